@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'panel.metrics.MetricsMiddleware',
+    'panel.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,7 +63,7 @@ ROOT_URLCONF = 'mypanel.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'panel.metrics.DjangoTemplates',
         'DIRS': [
             BASE_DIR / 'templates',
         ],
@@ -94,6 +96,8 @@ DATABASES = {
     }
 }
 
+DATABASE_ROUTERS = ['panel.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -135,3 +139,62 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Panel
+# Page sizes of the incomes, expenses and transactions lists
+
+PANEL_PAGE_SIZE = 50
+
+PANEL_MAX_PAGE_SIZE = 500
+
+
+# Rows above which the admin shows the estimate of PostgreSQL instead of counting a whole table
+
+PANEL_ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+# Seconds the rendered pages of the lists are kept in the cache
+
+PANEL_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+# Months of incomes, expenses and transactions kept in the ledgers by archive_ledgers (older ones
+# are moved to the archive tables)
+
+PANEL_ARCHIVE_MONTHS = 24
+
+
+# Most operations a request to /batch/ may carry
+
+PANEL_MAX_BATCH_SIZE = 500
+
+
+# Per-view query/SQL/template/size histograms, served to superusers at /metrics/
+
+PANEL_METRICS = False
+
+# Fail requests running more queries than the query_budget of their view (for tests)
+
+PANEL_ENFORCE_QUERY_BUDGETS = False
+
+
+# Alias (in DATABASES) of the read replica the read-only views read from, and for how many seconds
+# a user's reads stay on the primary after the user writes
+
+PANEL_REPLICA_DATABASE = None
+
+PANEL_REPLICA_PIN_SECONDS = 10
+
+
+# Currency all exchange rates are given in
+
+PANEL_BASE_CURRENCY = 'UZS'
+
+
+# Processes rendering the charts that are not cached yet (0 renders them in the request), and how
+# many renders may wait for them before the chart endpoints answer 503
+
+PANEL_CHART_WORKERS = 2
+
+PANEL_CHART_QUEUE = 8
@@ -0,0 +1,23 @@
+"""
+Settings for running the tests on two local SQLite databases, the second one standing in for a read replica:
+
+    python manage.py test --settings=mypanel.test_settings
+"""
+
+from .settings import *
+
+SECRET_KEY = 'tests'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        # A file, since the concurrency tests use threads, which an in-memory database would lock
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_replica.sqlite3'},
+    },
+}
@@ -1,17 +1,194 @@
 from django.contrib import admin
-from .models import Expense, \
+from django.db import transaction
+from .balances import BalanceManager
+from .ledgers import RollupManager
+from .models import ArchivedExpense, \
+    ArchivedIncome, \
+    ArchivedTransaction, \
+    ArchiveSummary, \
+    ExchangeRate, \
+    Expense, \
     Income, \
     Transaction
+from .paginators import EstimatedCountPaginator
 from .relationships import Account, \
     Category, \
     Subcategory
 
-models = [
-    Account, 
-    Category, 
-    Expense, 
-    Income, 
-    Subcategory, 
-    Transaction
-]
-admin.site.register(models)
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    A base admin for tables with millions of rows.
+
+    Pages are counted with EstimatedCountPaginator and without the second, unfiltered count, and
+    every foreign key of the listed rows is joined by list_select_related, so a changelist runs the
+    same number of queries whatever the size of the table.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class LedgerAdmin(LargeTableAdmin):
+    """
+    A base admin for incomes, expenses and transactions that keeps the balances and rollups right.
+
+    Adding, editing and deleting entries changes the balances of their accounts (and the rollups
+    of incomes and expenses) the way the ledger views do. Deleting many entries at once applies
+    one balance update per account.
+    """
+
+    date_hierarchy = 'date'
+    raw_id_fields = ['maker']
+    balance_manager = BalanceManager()
+    rollup_manager = RollupManager()
+
+    def save_model(self, request, obj, form, change):
+
+        with transaction.atomic():
+            previous = [self.model.objects.select_for_update().get(id=obj.id)] if change else []
+            super().save_model(request, obj, form, change)
+            self.apply(*self.changes(previous, [obj]))
+
+
+    def delete_model(self, request, obj):
+
+        self.delete_queryset(request, self.model.objects.filter(id=obj.id))
+
+
+    def delete_queryset(self, request, queryset):
+
+        with transaction.atomic():
+            entries = list(queryset.select_for_update(of=('self',)))
+            self.model.objects.filter(id__in=[entry.id for entry in entries]).delete()
+            self.apply(*self.changes(entries, []))
+
+
+    def changes(self, removed: list, added: list) -> tuple[list, list]:
+        """
+        A method for listing the balance and rollup changes that removing and adding the entries makes.
+        """
+
+        balance_changes, rollup_changes = [], []
+        for entries, sign in ((removed, -1), (added, 1)):
+            for entry in entries:
+                balance_changes += self.balance_manager.changes(entry, sign)
+                if not isinstance(entry, Transaction):
+                    rollup_changes.append(self.rollup_manager.change(entry, sign))
+        return balance_changes, rollup_changes
+
+
+    def apply(self, balance_changes: list, rollup_changes: list) -> None:
+        """
+        A method for applying the changes as one balance update per account and one update per rollup.
+        """
+
+        self.balance_manager.apply(self.balance_manager.collect(*balance_changes))
+        self.rollup_manager.apply(*rollup_changes)
+
+
+@admin.register(Income, Expense)
+class EntryAdmin(LedgerAdmin):
+    """
+    An admin for incomes and expenses.
+    """
+
+    list_display = ['date', 'account', 'category', 'subcategory', 'amount', 'comment', 'maker']
+    list_select_related = ['account', 'category', 'subcategory', 'maker']
+    autocomplete_fields = ['account', 'category', 'subcategory']
+
+
+@admin.register(Transaction)
+class TransactionAdmin(LedgerAdmin):
+    """
+    An admin for transactions between accounts.
+    """
+
+    list_display = ['date', 'account1', 'account2', 'amount', 'comment', 'maker']
+    list_select_related = ['account1', 'account2', 'maker']
+    autocomplete_fields = ['account1', 'account2']
+
+
+class ArchiveAdmin(LargeTableAdmin):
+    """
+    A base admin for the archive tables, which are only written by the archive_ledgers command.
+    """
+
+    def has_add_permission(self, request):
+
+        return False
+
+
+    def has_change_permission(self, request, obj=None):
+
+        return False
+
+
+    def has_delete_permission(self, request, obj=None):
+
+        return False
+
+
+@admin.register(ArchivedIncome, ArchivedExpense)
+class ArchivedEntryAdmin(ArchiveAdmin):
+    """
+    An admin for archived incomes and expenses.
+    """
+
+    list_display = ['date', 'account', 'category', 'subcategory', 'amount', 'comment', 'maker']
+    list_select_related = ['account', 'category', 'subcategory', 'maker']
+
+
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(ArchiveAdmin):
+    """
+    An admin for archived transactions.
+    """
+
+    list_display = ['date', 'account1', 'account2', 'amount', 'comment', 'maker']
+    list_select_related = ['account1', 'account2', 'maker']
+
+
+@admin.register(ArchiveSummary)
+class ArchiveSummaryAdmin(ArchiveAdmin):
+    """
+    An admin for the monthly totals of archived entries.
+    """
+
+    list_display = ['month', 'account', 'kind', 'category', 'subcategory', 'amount', 'count', 'maker']
+    list_select_related = ['account', 'category', 'subcategory', 'maker']
+
+
+@admin.register(Account)
+class AccountAdmin(admin.ModelAdmin):
+    """
+    An admin for accounts, searched by name by the autocomplete widgets of the ledgers.
+    """
+
+    list_display = ['name', 'balance', 'owner', 'date_created']
+    list_select_related = ['owner']
+    search_fields = ['name']
+    raw_id_fields = ['owner']
+
+
+@admin.register(Category, Subcategory)
+class CategoryAdmin(admin.ModelAdmin):
+    """
+    An admin for categories and subcategories, searched by name by the autocomplete widgets of the ledgers.
+    """
+
+    list_display = ['name', 'related_to']
+    list_filter = ['related_to']
+    search_fields = ['name']
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    """
+    An admin for exchange rates.
+    """
+
+    list_display = ['currency', 'rate', 'date']
+    list_filter = ['currency']
+    date_hierarchy = 'date'
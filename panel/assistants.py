@@ -1,4 +1,114 @@
 import re
+from datetime import datetime
+from decimal import Decimal
+from django.http import QueryDict
+from django.utils import timezone
+
+
+class Field:
+    """
+    A class for declaring a request field: the characters it may contain and the type it is parsed to.
+
+    The pattern is compiled once, when the field is declared.
+    """
+
+    # Integers have to fit the 64-bit columns they are compared with.
+    int_range = (-2 ** 63, 2 ** 63 - 1)
+    # Dates are accepted in ISO format (with 'Z' for UTC) or as 'dd.mm.yyyy[ hh:mm[:ss]]' (with '.' or '/').
+    local_datetime = re.compile(r'^(\d{1,2})[./](\d{1,2})[./](\d{4})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?$')
+
+    def __init__(self, not_allowed: str, kind: str = 'str', required: bool = True, strip: bool = True):
+
+        self.pattern = re.compile(not_allowed, flags=re.IGNORECASE)
+        self.kind = kind
+        self.required = required
+        self.strip = strip
+        self.convert = getattr(self, 'to_' + kind)
+
+
+    def parse(self, value: str | None):
+        """
+        A method for cleaning and converting the value. Raises ValueError with the reason when it is invalid.
+        """
+
+        value = (value or '').strip()
+        if self.strip:
+            value = self.pattern.sub('', value)
+        elif self.pattern.search(value):
+            raise ValueError('Contains characters that are not allowed.')
+        if not value:
+            if self.required:
+                raise ValueError('This field is required.')
+            return None
+        return self.convert(value)
+
+
+    def to_str(self, value: str) -> str:
+
+        return value
+
+
+    def to_int(self, value: str) -> int:
+
+        value = int(value)
+        if not self.int_range[0] <= value <= self.int_range[1]:
+            raise ValueError('Enter a number between %d and %d.' % self.int_range)
+        return value
+
+
+    def to_decimal(self, value: str) -> Decimal:
+
+        try:
+            value = Decimal(value.replace(',', '.'))
+        except ArithmeticError:
+            raise ValueError('Enter a number.')
+        if not value.is_finite() or value <= 0:
+            raise ValueError('Enter a positive number.')
+        return value
+
+
+    def to_datetime(self, value: str) -> datetime:
+
+        if value[-1] in 'Zz':
+            value = value[:-1] + '+00:00'
+        try:
+            result = datetime.fromisoformat(value)
+        except ValueError:
+            match = self.local_datetime.match(value)
+            if not match:
+                raise ValueError('Enter a valid date.')
+            day, month, year, hour, minute, second = (int(part or 0) for part in match.groups())
+            try:
+                result = datetime(year, month, day, hour, minute, second)
+            except ValueError:
+                raise ValueError('Enter a valid date.')
+        return timezone.make_aware(result) if timezone.is_naive(result) else result
+
+
+class Schema:
+    """
+    A class for declaring the fields of an endpoint and parsing request parameters against them.
+    """
+
+    def __init__(self, **fields: Field):
+
+        self.fields = fields
+
+
+    def parse(self, params: QueryDict) -> tuple[dict, dict]:
+        """
+        A method for parsing all fields of the parameters in one pass.
+
+        Returns the typed values and the errors (field name -> reason), one of which is empty.
+        """
+
+        data, errors = {}, {}
+        for name, field in self.fields.items():
+            try:
+                data[name] = field.parse(params.get(name))
+            except ValueError as error:
+                errors[name] = str(error)
+        return (data, {}) if not errors else ({}, errors)
 
 
 class Validator:
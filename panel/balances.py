@@ -0,0 +1,172 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, QuerySet, Sum
+from .caches import VersionKeeper
+from .models import ArchiveSummary, \
+    Expense, \
+    Income, \
+    Transaction
+from .relationships import Account
+from .routers import ReplicaRouter
+
+
+class BalanceManager:
+    """
+    A class for applying changes to the balances of accounts.
+    """
+
+    versions = VersionKeeper()
+
+    def apply(self, deltas: dict[int, Decimal]) -> None:
+        """
+        A method for applying the deltas (account id -> amount) to the balances of the accounts.
+
+        Every delta is applied as a single database-side UPDATE, so concurrent requests against
+        the same account can not overwrite each other's changes. Accounts are updated in the order
+        of their ids to keep the lock order stable between transactions.
+        """
+
+        with transaction.atomic():
+            for account_id, delta in sorted(deltas.items()):
+                if delta:
+                    Account.objects.filter(id=account_id).update(balance=F('balance') + delta)
+            owners = set(Account.objects.filter(id__in=deltas).values_list('owner_id', flat=True))
+            transaction.on_commit(lambda: self.bump_versions(owners))
+
+
+    def bump_versions(self, user_ids: set[int]) -> None:
+        """
+        A method for invalidating what is cached from the balances of the users.
+        """
+
+        for user_id in user_ids:
+            ReplicaRouter.pin(user_id)
+            self.versions.bump(self.version_name(user_id))
+
+
+    def version_name(self, user_id: int) -> str:
+        """
+        A method for getting the name of the version of the balances of the user.
+        """
+
+        return 'panel:balances:%d' % user_id
+
+
+    def changes(self, entry, sign: int = 1) -> list[tuple[int, Decimal]]:
+        """
+        A method for listing the changes (account id, amount) that adding (1) or removing (-1) the entry makes.
+        """
+
+        amount = sign * entry.amount.amount
+        if isinstance(entry, Transaction):
+            return [(entry.account1_id, -amount), (entry.account2_id, amount)]
+        return [(entry.account_id, amount if isinstance(entry, Income) else -amount)]
+
+
+    def collect(self, *changes: tuple[int, Decimal]) -> dict[int, Decimal]:
+        """
+        A method for collapsing the changes (account id, amount) into one delta per account.
+        """
+
+        deltas = {}
+        for account_id, amount in changes:
+            deltas[account_id] = deltas.get(account_id, Decimal(0)) + Decimal(amount)
+        return deltas
+
+
+class BalanceReconciler:
+    """
+    A class for checking the balances of accounts against their opening balances and entries.
+
+    The expected balance of an account is its opening balance plus its incomes and the
+    transactions into it, minus its expenses and the transactions out of it, archived ones
+    included (through their summaries). Amounts are added
+    as numbers, the way the views book them, whatever their currency. The accounts are split
+    into ranges of ids, so the ranges can be checked in separate processes.
+    """
+
+    sides = [
+        (Income, 'account', 1),
+        (Expense, 'account', -1),
+        (Transaction, 'account1', -1),
+        (Transaction, 'account2', 1),
+    ]
+    archived_sides = {'income': 1, 'expense': -1, 'transfer_in': 1, 'transfer_out': -1}
+    balance_manager = BalanceManager()
+
+    def shards(self, count: int) -> list[tuple[int, int]]:
+        """
+        A method for splitting the accounts into (at most) the given number of id ranges of similar size.
+        """
+
+        ids = list(Account.objects.order_by('id').values_list('id', flat=True))
+        size = -(-len(ids) // max(count, 1))
+        return [(ids[start], ids[min(start + size, len(ids)) - 1]) for start in range(0, len(ids), size or 1)]
+
+
+    def expected(self, accounts: QuerySet, lookup: str, value) -> dict[int, dict]:
+        """
+        A method for computing the recorded and the expected balance of the accounts.
+
+        The accounts are the ones whose id matches the lookup ('range' or 'in') and the value. Every
+        side of the entries is summed in one grouped query, which the account indexes of the ledgers answer.
+        """
+
+        rows = accounts \
+            .filter(**{'id__' + lookup: value}) \
+            .values_list('id', 'name', 'owner_id', 'balance', 'opening_balance')
+        result = {
+            account_id: {'name': name, 'owner': owner_id, 'balance': balance, 'expected': opening_balance}
+            for account_id, name, owner_id, balance, opening_balance in rows
+        }
+        for model, field, sign in self.sides:
+            totals = model.objects \
+                .filter(**{'%s__id__%s' % (field, lookup): value}) \
+                .values(field) \
+                .annotate(total=Sum('amount')) \
+                .order_by()
+            for row in totals:
+                # Accounts opened since their rows were read are left for the next check.
+                if row[field] in result:
+                    result[row[field]]['expected'] += sign * row['total']
+        totals = ArchiveSummary.objects \
+            .filter(**{'account__id__' + lookup: value}) \
+            .values('account', 'kind') \
+            .annotate(total=Sum('amount')) \
+            .order_by()
+        for row in totals:
+            if row['account'] in result:
+                result[row['account']]['expected'] += self.archived_sides[row['kind']] * row['total']
+        return result
+
+
+    def drift(self, shard: tuple[int, int]) -> list[dict]:
+        """
+        A method for listing the accounts of the id range whose balance differs from the expected one.
+        """
+
+        drifts = []
+        for account_id, account in sorted(self.expected(Account.objects.all(), 'range', shard).items()):
+            if account['balance'] != account['expected']:
+                drifts.append({'account': account_id, **account, 'drift': account['balance'] - account['expected']})
+        return drifts
+
+
+    def repair(self, account_ids: list[int]) -> list[dict]:
+        """
+        A method for setting the balances of the accounts to the expected ones, all in one transaction.
+
+        The accounts are locked before their balances are recomputed, so a concurrent change of a
+        balance either is counted in the expected balance or is applied on top of the repaired one.
+        """
+
+        with transaction.atomic():
+            accounts = Account.objects.select_for_update().order_by('id')
+            repaired = []
+            for account_id, account in sorted(self.expected(accounts, 'in', account_ids).items()):
+                if account['balance'] != account['expected']:
+                    Account.objects.filter(id=account_id).update(balance=account['expected'])
+                    repaired.append({'account': account_id, **account, 'drift': account['balance'] - account['expected']})
+            owners = {account['owner'] for account in repaired}
+            transaction.on_commit(lambda: self.balance_manager.bump_versions(owners))
+        return repaired
@@ -0,0 +1,246 @@
+from collections.abc import Awaitable, Callable
+from hashlib import md5
+from time import time_ns
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import QueryDict
+from .relationships import Account, \
+    Category, \
+    Subcategory
+from .routers import ReplicaRouter
+
+
+class VersionKeeper:
+    """
+    A class for keeping version numbers in the cache framework.
+
+    Cached data is stored under a key that includes the version of what it was built from, so
+    bumping the version invalidates it in every process at once. Versions start from the current
+    time, so a version lost by the cache never comes back with a number that was used before.
+    """
+
+    def get(self, name: str) -> int:
+        """
+        A method for getting the current version of the name.
+        """
+
+        version = cache.get(name)
+        if version is None:
+            cache.add(name, time_ns(), timeout=None)
+            version = cache.get(name)
+        return version
+
+
+    def bump(self, name: str) -> int:
+        """
+        A method for moving the name to a new version.
+        """
+
+        try:
+            return cache.incr(name)
+        except ValueError:
+            cache.add(name, time_ns(), timeout=None)
+            return cache.get(name)
+
+
+class FragmentCache:
+    """
+    A class for caching the rendered pages of the ledgers of users.
+
+    Every user has a version per ledger (incomes/expenses/transactions), which is bumped whenever
+    one of the user's entries is written, and the pages are cached under it, so they never need to
+    be deleted one by one. The names of categories and subcategories shown in the rows share one
+    more version, while a change of an account only bumps the ledgers of its owner. The key of a
+    page doubles as its ETag. Bumping the versions of a user
+    pins the user's reads to the primary for a while, so a page rendered from a replica that has
+    not caught up yet is never cached under the new version.
+    """
+
+    page_params = ['cursor', 'from', 'page_size', 'to']
+    lookups_version_name = 'panel:lookups'
+    accounts_version_name = 'panel:lookups:accounts'
+    ledgers = ['incomes', 'expenses', 'transactions']
+    versions = VersionKeeper()
+
+    def __init__(self, timeout: int | None = None):
+
+        self.timeout = timeout or getattr(settings, 'PANEL_FRAGMENT_TIMEOUT', 60 * 60 * 24)
+
+
+    def key(self, user_id: int, ledger: str, params: QueryDict) -> str:
+        """
+        A method for getting the key of the page of the ledger requested by the parameters.
+        """
+
+        query = '&'.join(
+            '%s=%s' % (name, value) for name in self.page_params for value in params.getlist(name)
+        )
+        return 'panel:fragments:%s:%d:%d:%d:%s' % (
+            ledger,
+            user_id,
+            self.versions.get(self.version_name(user_id, ledger)),
+            self.versions.get(self.lookups_version_name),
+            md5(query.encode()).hexdigest(),
+        )
+
+
+    def etag(self, *keys: str) -> str:
+        """
+        A method for getting the ETag of a response built from the pages under the keys.
+        """
+
+        return '"%s"' % md5('|'.join(keys).encode()).hexdigest()
+
+
+    def get(self, key: str, render: Callable[[], dict]) -> dict:
+        """
+        A method for getting the page under the key, rendering and caching it when it is missing.
+        """
+
+        page = cache.get(key)
+        if page is None:
+            page = render()
+            cache.set(key, page, self.timeout)
+        return page
+
+
+    async def aget(self, key: str, render: Callable[[], Awaitable[dict]]) -> dict:
+        """
+        A method for getting the page under the key from async code.
+        """
+
+        page = await cache.aget(key)
+        if page is None:
+            page = await render()
+            await cache.aset(key, page, self.timeout)
+        return page
+
+
+    def bump(self, user_id: int, *ledgers: str) -> None:
+        """
+        A method for invalidating the cached pages of the ledgers of the user.
+        """
+
+        ReplicaRouter.pin(user_id)
+        for ledger in ledgers:
+            self.versions.bump(self.version_name(user_id, ledger))
+
+
+    def bump_lookups(self) -> None:
+        """
+        A method for invalidating the cached pages of all users after a category or subcategory changes.
+        """
+
+        self.versions.bump(self.lookups_version_name)
+
+
+    def bump_accounts(self, owner_id: int) -> None:
+        """
+        A method for invalidating the cached pages of the owner and the loaded account names after an account changes.
+        """
+
+        self.bump(owner_id, *self.ledgers)
+        self.versions.bump(self.accounts_version_name)
+
+
+    def version_name(self, user_id: int, ledger: str) -> str:
+        """
+        A method for getting the name of the version of the ledger of the user.
+        """
+
+        return 'panel:ledgers:%d:%s' % (user_id, ledger)
+
+
+class LookupCache:
+    """
+    A class for holding the names of accounts, categories and subcategories in the memory of the process.
+
+    Names are loaded as the entries being resolved refer to them, with one query per table for all
+    missing ids. The names of categories and subcategories are dropped when the version of the
+    lookups changes, and the names of accounts when the version of the accounts does, which
+    happens whenever one of them is saved or deleted. Every process checks the versions once
+    per resolve, so a rename shows up everywhere on the next request. Names are always read from
+    the primary, since names read from a lagging replica would stay cached under the new version.
+    """
+
+    version_name = FragmentCache.lookups_version_name
+    accounts_version_name = FragmentCache.accounts_version_name
+    versions = VersionKeeper()
+    models = {'accounts': Account, 'categories': Category, 'subcategories': Subcategory}
+    tables = {
+        'account': 'accounts',
+        'account1': 'accounts',
+        'account2': 'accounts',
+        'source': 'accounts',
+        'target': 'accounts',
+        'category': 'categories',
+        'subcategory': 'subcategories',
+    }
+
+    def __init__(self):
+
+        self.version = None
+        self.accounts_version = None
+        self.names = {table: {} for table in self.models}
+
+
+    def get_version(self) -> int:
+        """
+        A method for dropping the loaded names that changed and returning the version of the lookups.
+        """
+
+        version = self.versions.get(self.version_name)
+        if version != self.version:
+            self.names, self.version, self.accounts_version = {table: {} for table in self.models}, version, None
+        accounts_version = self.versions.get(self.accounts_version_name)
+        if accounts_version != self.accounts_version:
+            self.names['accounts'], self.accounts_version = {}, accounts_version
+        return self.version
+
+
+    def resolve(self, entries: list, names: dict[str, str]) -> list:
+        """
+        A method for setting the names (name -> foreign key field) of the objects the entries refer to.
+
+        Entries are values() rows, which get the names as keys, or model instances, which get them as attributes.
+        """
+
+        if not names:
+            return entries
+        self.get_version()
+        tables = self.names
+        if entries and isinstance(entries[0], dict):
+            ids = [[entry[field] for entry in entries] for field in names.values()]
+            loaded = {}
+        else:
+            # Related objects the instances already hold (like the accounts of new entries) are used as they are.
+            ids = [[getattr(entry, field + '_id') for entry in entries] for field in names.values()]
+            loaded = {
+                (field, index): getattr(entry, field).name
+                for field in names.values() for index, entry in enumerate(entries) 
+                if entry._meta.get_field(field).is_cached(entry)
+            }
+        missing = {}
+        for field, values in zip(names.values(), ids):
+            missing.setdefault(self.tables[field], set()).update(
+                value for index, value in enumerate(values) if (field, index) not in loaded
+            )
+        for table, values in missing.items():
+            values -= tables[table].keys() | {None}
+            if values:
+                tables[table].update(
+                    self.models[table].objects.using(DEFAULT_DB_ALIAS).filter(id__in=values).values_list('id', 'name')
+                )
+        for (name, field), values in zip(names.items(), ids):
+            table = tables[self.tables[field]]
+            for index, (entry, value) in enumerate(zip(entries, values)):
+                value = loaded[field, index] if (field, index) in loaded else table.get(value)
+                if isinstance(entry, dict):
+                    entry[name] = value
+                else:
+                    setattr(entry, name, value)
+        return entries
+
+
+lookup_cache = LookupCache()
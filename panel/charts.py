@@ -0,0 +1,33 @@
+import pygal
+
+
+def render(kind: str, data: dict, options: dict) -> bytes:
+    """
+    A function for rendering the chart of the kind from its aggregated data as SVG.
+
+    It only needs pygal, so the processes of the pool of ChartRenderer can run it without setting up Django.
+    """
+
+    config = pygal.Config(
+        title=options['title'],
+        width=options['width'],
+        height=options['height'],
+        show_legend=kind != 'balance',
+        x_label_rotation=30,
+    )
+    if kind == 'categories':
+        chart = pygal.Pie(config, inner_radius=0.4)
+        for name, amount in data['values']:
+            chart.add(name, amount)
+    elif kind == 'cash-flow':
+        chart = pygal.Bar(config)
+        chart.x_labels = data['months']
+        chart.add('Incomes', data['incomes'])
+        chart.add('Expenses', data['expenses'])
+    elif kind == 'balance':
+        chart = pygal.Line(config)
+        chart.x_labels = data['months']
+        chart.add(data['name'], data['balances'])
+    else:
+        raise ValueError('Unknown chart "%s".' % kind)
+    return chart.render()
@@ -0,0 +1,315 @@
+import csv
+import heapq
+import io
+import tempfile
+from datetime import date, datetime, time
+from decimal import Decimal
+from zipfile import BadZipFile
+from django.contrib.auth.models import User
+from django.core.exceptions import BadRequest
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from djmoney.money import Money
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from .balances import BalanceManager
+from .caches import FragmentCache
+from .ledgers import RollupManager
+from .models import ArchivedTransaction, \
+    Expense, \
+    Income, \
+    Transaction
+from .paginators import KeysetPaginator
+from .relationships import Account, \
+    Category, \
+    Subcategory
+
+
+class LedgerExporter:
+    """
+    A class for exporting incomes, expenses and transactions to CSV/XLSX with flat memory usage.
+
+    Rows are read as plain tuples in chunks from a server-side cursor and written out one by one,
+    so no model instances or whole result sets are kept in memory.
+    """
+
+    columns = {
+        Income: [
+            ('Date', 'date'),
+            ('Account', 'account__name'),
+            ('Category', 'category__name'),
+            ('Subcategory', 'subcategory__name'),
+            ('Amount', 'amount'),
+            ('Currency', 'amount_currency'),
+            ('Comment', 'comment'),
+        ],
+        Expense: [
+            ('Date', 'date'),
+            ('Account', 'account__name'),
+            ('Category', 'category__name'),
+            ('Subcategory', 'subcategory__name'),
+            ('Amount', 'amount'),
+            ('Currency', 'amount_currency'),
+            ('Comment', 'comment'),
+        ],
+        Transaction: [
+            ('Date', 'date'),
+            ('From', 'account1__name'),
+            ('To', 'account2__name'),
+            ('Amount', 'amount'),
+            ('Currency', 'amount_currency'),
+            ('Comment', 'comment'),
+        ],
+    }
+    chunk_size = 2000
+
+    def filter(self, queryset: QuerySet, params: QueryDict) -> QuerySet:
+        """
+        A method for limiting the queryset to the dates and the account requested by the parameters.
+
+        The queryset is bound to the database it would be read from now, since a streamed export is
+        read after the view returns, outside the routing of the request.
+        """
+
+        queryset = KeysetPaginator().filter_dates(queryset, params)
+        if params.get('account_id'):
+            try:
+                account_id = int(params.get('account_id'))
+            except ValueError:
+                raise BadRequest('Invalid account.')
+            if queryset.model in (Transaction, ArchivedTransaction):
+                queryset = queryset.filter(Q(account1_id=account_id) | Q(account2_id=account_id))
+            else:
+                queryset = queryset.filter(account_id=account_id)
+        return queryset.order_by('date', 'id').using(queryset.db)
+
+
+    def rows(self, queryset: QuerySet, *archived: QuerySet):
+        """
+        A method for iterating over the queryset as rows of the export, header first.
+
+        The rows of the archived querysets (of the same ledger) are merged in by date.
+        """
+
+        columns = self.columns[queryset.model]
+        yield [header for header, field in columns]
+        values = [
+            queryset.values_list(*[field for header, field in columns]).iterator(chunk_size=self.chunk_size)
+            for queryset in (queryset, *archived)
+        ]
+        for row in heapq.merge(*values, key=lambda row: row[0]):
+            row = list(row)
+            # Spreadsheets do not support time zones, so dates are written in the local time.
+            row[0] = timezone.localtime(row[0]).replace(tzinfo=None)
+            yield row
+
+
+    def to_csv(self, rows):
+        """
+        A method for encoding the rows as CSV lines one at a time.
+        """
+
+        class Echo:
+
+            def write(self, value):
+
+                return value
+
+        writer = csv.writer(Echo())
+        for row in rows:
+            yield writer.writerow(row)
+
+
+    def to_xlsx(self, rows, title: str):
+        """
+        A method for writing the rows into an XLSX file using a write-only worksheet.
+
+        Returns the file rewound to its beginning, ready to be streamed.
+        """
+
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(title)
+        for row in rows:
+            worksheet.append(row)
+        file = tempfile.TemporaryFile()
+        workbook.save(file)
+        file.seek(0)
+        return file
+
+
+class LedgerImporter:
+    """
+    A class for importing bank statements (CSV/XLSX) into incomes, expenses or transactions.
+
+    The statement uses the columns of the export. Rows are validated in one streaming pass against
+    in-memory lookups of the user's accounts and of the categories, inserted in batches, and the
+    balances and rollups are adjusted once per account/rollup at the end, all in one transaction.
+    Nothing is saved when any row is invalid or when running dry.
+    """
+
+    batch_size = 1000
+    balance_manager = BalanceManager()
+    rollup_manager = RollupManager()
+    fragment_cache = FragmentCache()
+
+    def run(self, model, file, user: User, dry_run: bool = False) -> dict:
+        """
+        A method for importing the statement file and reporting the result.
+
+        A file that can not be read is reported as an error without a row.
+        """
+
+        lookups = self.get_lookups(model, user)
+        deltas = {}
+        rollups = {}
+        errors = []
+        batch = []
+        imported = 0
+        try:
+            with transaction.atomic():
+                for number, row in self.read(file):
+                    entry, row_errors = self.build(model, row, lookups, user)
+                    if row_errors:
+                        errors.append({'row': number, 'errors': row_errors})
+                        continue
+                    imported += 1
+                    for account_id, amount in self.balance_manager.changes(entry):
+                        deltas[account_id] = deltas.get(account_id, Decimal(0)) + amount
+                    if model is not Transaction:
+                        key, kind, amount, count = self.rollup_manager.change(entry, 1)
+                        total = rollups.get((key, kind), (Decimal(0), 0))
+                        rollups[(key, kind)] = (total[0] + amount, total[1] + count)
+                    if dry_run or errors:
+                        continue
+                    batch.append(entry)
+                    if len(batch) >= self.batch_size:
+                        model.objects.bulk_create(batch)
+                        batch = []
+                if dry_run or errors:
+                    transaction.set_rollback(True)
+                else:
+                    model.objects.bulk_create(batch)
+                    self.balance_manager.apply(deltas)
+                    self.rollup_manager.apply(*[
+                        (key, kind, amount, count) for (key, kind), (amount, count) in rollups.items()
+                    ])
+                    ledger = model._meta.model_name + 's'
+                    transaction.on_commit(lambda: self.fragment_cache.bump(user.id, ledger))
+        except BadRequest as error:
+            return {'imported': 0, 'valid': 0, 'errors': [{'row': None, 'errors': [str(error)]}], 'dry_run': dry_run}
+        return {
+            'imported': 0 if dry_run or errors else imported,
+            'valid': imported,
+            'errors': errors,
+            'dry_run': dry_run,
+        }
+
+
+    def read(self, file):
+        """
+        A method for iterating over the data rows of the file as (row number, {header: value}) pairs.
+
+        Raises BadRequest when the file is not a workbook or not UTF-8 text, which may only show
+        after some rows were read.
+        """
+
+        try:
+            if file.name.lower().endswith('.xlsx'):
+                rows = load_workbook(file, read_only=True, data_only=True).active.iter_rows(values_only=True)
+            else:
+                rows = csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+            header = [str(value).strip() if value is not None else '' for value in next(rows, [])]
+            for number, row in enumerate(rows, start=2):
+                if any(value not in (None, '') for value in row):
+                    yield number, dict(zip(header, row))
+        except (BadZipFile, InvalidFileException, KeyError):
+            raise BadRequest('The file is not a valid XLSX workbook.')
+        except (UnicodeDecodeError, csv.Error):
+            raise BadRequest('The file is not a valid UTF-8 CSV file.')
+
+
+    def get_lookups(self, model, user: User) -> dict:
+        """
+        A method for loading the names of the user's accounts and of the categories in one go.
+        """
+
+        related_to = model.__name__
+        return {
+            'accounts': {
+                name.casefold(): id for id, name in 
+                Account.objects.filter(owner=user).values_list('id', 'name')
+            },
+            'categories': {
+                name.casefold(): id for id, name in 
+                Category.objects.filter(related_to=related_to).values_list('id', 'name')
+            },
+            'subcategories': {
+                name.casefold(): id for id, name in 
+                Subcategory.objects.filter(related_to=related_to).values_list('id', 'name')
+            },
+        }
+
+
+    def build(self, model, row: dict, lookups: dict, user: User) -> tuple:
+        """
+        A method for building an unsaved entry out of the row, or listing what is wrong with the row.
+        """
+
+        errors = []
+        fields = {'maker': user, 'comment': str(row.get('Comment') or '').strip()[:1000]}
+        references = [('From', 'account1_id', 'accounts'), ('To', 'account2_id', 'accounts')] \
+            if model is Transaction else [
+                ('Account', 'account_id', 'accounts'),
+                ('Category', 'category_id', 'categories'),
+                ('Subcategory', 'subcategory_id', 'subcategories'),
+            ]
+        for header, field, lookup in references:
+            value = str(row.get(header) or '').strip()
+            fields[field] = lookups[lookup].get(value.casefold())
+            if fields[field] is None:
+                errors.append('Unknown %s "%s".' % (header.lower(), value))
+        fields['date'] = self.parse_date(row.get('Date'))
+        if fields['date'] is None:
+            errors.append('Invalid date.')
+        amount = self.parse_amount(row.get('Amount'))
+        if amount is None:
+            errors.append('Invalid amount.')
+        currency = str(row.get('Currency') or 'UZS').strip().upper()
+        if currency not in dict(model.currencies):
+            errors.append('Unknown currency "%s".' % currency)
+        if errors:
+            return None, errors
+        fields['amount'] = Money(amount, currency)
+        return model(**fields), []
+
+
+    def parse_date(self, value) -> datetime | None:
+        """
+        A method for converting the date of a row to an aware datetime.
+        """
+
+        if isinstance(value, str):
+            try:
+                value = parse_datetime(value.strip()) or parse_date(value.strip())
+            except ValueError:
+                return None
+        if type(value) is date:
+            value = datetime.combine(value, time.min)
+        if not isinstance(value, datetime):
+            return None
+        return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+    def parse_amount(self, value) -> Decimal | None:
+        """
+        A method for converting the amount of a row to a positive decimal.
+        """
+
+        try:
+            amount = Decimal(str(value).strip().replace(' ', '').replace(',', '.'))
+        except ArithmeticError:
+            return None
+        return amount if amount.is_finite() and amount > 0 else None
@@ -0,0 +1,375 @@
+from datetime import datetime
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .balances import BalanceManager
+from .caches import FragmentCache
+from .models import ArchivedExpense, \
+    ArchivedIncome, \
+    ArchivedTransaction, \
+    ArchiveSummary, \
+    Expense, \
+    Income, \
+    MonthlyRollup, \
+    Transaction
+from .relationships import Account, \
+    Category, \
+    Subcategory
+
+
+class RollupManager:
+    """
+    A class for keeping the monthly rollups of incomes and expenses up to date.
+    """
+
+    def change(self, entry, sign: int) -> tuple[tuple, str, Decimal, int]:
+        """
+        A method for describing the change that adding (1) or removing (-1) the entry makes to its rollup.
+
+        The change is a snapshot, so it has to be taken before the entry is edited or deleted.
+        """
+
+        kind = 'income' if isinstance(entry, Income) else 'expense'
+        month = timezone.localtime(entry.date).date().replace(day=1)
+        key = (
+            entry.maker_id, 
+            entry.account_id, 
+            entry.category_id, 
+            entry.subcategory_id, 
+            entry.amount.currency.code, 
+            month,
+        )
+        return key, kind, sign * Decimal(entry.amount.amount), sign
+
+
+    def apply(self, *changes: tuple[tuple, str, Decimal, int]) -> None:
+        """
+        A method for applying the changes to the rollups as database-side increments.
+        """
+
+        totals = {}
+        for key, kind, amount, count in changes:
+            fields = totals.setdefault(key, {})
+            fields[kind + '_amount'] = fields.get(kind + '_amount', Decimal(0)) + amount
+            fields[kind + '_count'] = fields.get(kind + '_count', 0) + count
+        with transaction.atomic():
+            for key, fields in sorted(totals.items()):
+                fields = {name: value for name, value in fields.items() if value}
+                if not fields:
+                    continue
+                maker_id, account_id, category_id, subcategory_id, currency, month = key
+                rollup, created = MonthlyRollup.objects.get_or_create(
+                    maker_id=maker_id,
+                    account_id=account_id,
+                    category_id=category_id,
+                    subcategory_id=subcategory_id,
+                    currency=currency,
+                    month=month,
+                )
+                MonthlyRollup.objects.filter(id=rollup.id).update(
+                    **{name: F(name) + value for name, value in fields.items()}
+                )
+
+
+class LedgerBatch:
+    """
+    A class for applying a batch of create/edit/delete operations on incomes, expenses and transactions.
+
+    Every operation is validated before anything is written: the fields against the schema of its
+    ledger, and the entries, accounts and categories it refers to against what the database holds
+    (entries and accounts must belong to the user). Then all operations are applied in memory and
+    written in one transaction with one bulk query per model and kind of write, one balance update
+    per account and one rollup update per month/category. Nothing is written when any operation is
+    invalid.
+    """
+
+    models = {'income': Income, 'expense': Expense, 'transaction': Transaction}
+    update_fields = {
+        Income: ['account', 'category', 'subcategory', 'amount', 'date', 'comment'],
+        Expense: ['account', 'category', 'subcategory', 'amount', 'date', 'comment'],
+        Transaction: ['account1', 'account2', 'amount', 'date', 'comment'],
+    }
+    balance_manager = BalanceManager()
+    rollup_manager = RollupManager()
+    fragment_cache = FragmentCache()
+
+    def __init__(self, schemas: dict, max_operations: int | None = None):
+
+        self.schemas = schemas
+        self.max_operations = max_operations or getattr(settings, 'PANEL_MAX_BATCH_SIZE', 500)
+
+
+    def run(self, operations: list, user: User) -> dict:
+        """
+        A method for applying the operations and reporting the result of each of them.
+
+        Returns the results and the errors (index of the operation -> reasons), one of which is empty.
+        """
+
+        if not isinstance(operations, list) or not operations:
+            return {'results': [], 'errors': [{'index': None, 'errors': ['Expected a list of operations.']}]}
+        if len(operations) > self.max_operations:
+            return {'results': [], 'errors': [
+                {'index': None, 'errors': ['At most %d operations are allowed.' % self.max_operations]}
+            ]}
+        parsed, errors = self.parse(operations)
+        with transaction.atomic():
+            lookups = self.get_lookups(parsed, user)
+            errors += self.check(parsed, lookups)
+            if errors:
+                return {'results': [], 'errors': sorted(errors, key=lambda error: error['index'])}
+            results = self.apply(parsed, lookups, user)
+        return {'results': results, 'errors': []}
+
+
+    def parse(self, operations: list) -> tuple[list[dict], list[dict]]:
+        """
+        A method for checking the shape of the operations and parsing their fields.
+        """
+
+        parsed, errors = [], []
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                errors.append({'index': index, 'errors': ['Expected an object.']})
+                continue
+            reasons = []
+            op, ledger, entry_id = operation.get('op'), operation.get('ledger'), operation.get('id')
+            if op not in ('create', 'edit', 'delete'):
+                reasons.append('Unknown op "%s".' % op)
+            if ledger not in self.models:
+                reasons.append('Unknown ledger "%s".' % ledger)
+            if op in ('edit', 'delete') and (not isinstance(entry_id, int) or isinstance(entry_id, bool)):
+                reasons.append('An id is required.')
+            if op == 'create' and entry_id is not None:
+                reasons.append('An id is not allowed when creating.')
+            data = {}
+            if not reasons and op != 'delete':
+                values = operation.get('data')
+                values = {name: str(value) for name, value in values.items() if value is not None} \
+                    if isinstance(values, dict) else {}
+                data, field_errors = self.schemas[ledger].parse(values)
+                reasons += ['%s: %s' % (name, reason) for name, reason in field_errors.items()]
+            if reasons:
+                errors.append({'index': index, 'errors': reasons})
+                continue
+            parsed.append({'index': index, 'op': op, 'ledger': ledger, 'id': entry_id, 'data': data})
+        return parsed, errors
+
+
+    def get_lookups(self, operations: list[dict], user: User) -> dict:
+        """
+        A method for loading (and locking) the entries and loading the accounts and categories the operations use.
+        """
+
+        entry_ids = {ledger: set() for ledger in self.models}
+        account_ids, category_ids, subcategory_ids = set(), set(), set()
+        for operation in operations:
+            if operation['id'] is not None:
+                entry_ids[operation['ledger']].add(operation['id'])
+            data = operation['data']
+            account_ids.update(data[name] for name in ('account_id', 'account1', 'account2') if name in data)
+            category_ids.update([data['category_id']] if 'category_id' in data else [])
+            subcategory_ids.update([data['subcategory_id']] if 'subcategory_id' in data else [])
+        return {
+            'entries': {
+                ledger: model.objects.select_for_update().filter(maker=user).in_bulk(entry_ids[ledger])
+                for ledger, model in self.models.items() if entry_ids[ledger]
+            },
+            'accounts': Account.objects.filter(owner=user).in_bulk(account_ids),
+            'categories': Category.objects.in_bulk(category_ids),
+            'subcategories': Subcategory.objects.in_bulk(subcategory_ids),
+        }
+
+
+    def check(self, operations: list[dict], lookups: dict) -> list[dict]:
+        """
+        A method for checking that everything the operations refer to exists, in the order of the operations.
+        """
+
+        errors = []
+        deleted = set()
+        for operation in operations:
+            reasons = []
+            ledger, entry_id, data = operation['ledger'], operation['id'], operation['data']
+            if entry_id is not None:
+                if entry_id not in lookups['entries'].get(ledger, {}):
+                    reasons.append('Unknown %s %d.' % (ledger, entry_id))
+                elif (ledger, entry_id) in deleted:
+                    reasons.append('The %s %d is deleted by an earlier operation.' % (ledger, entry_id))
+                elif operation['op'] == 'delete':
+                    deleted.add((ledger, entry_id))
+            for name, lookup in (
+                ('account_id', 'accounts'),
+                ('account1', 'accounts'),
+                ('account2', 'accounts'),
+                ('category_id', 'categories'),
+                ('subcategory_id', 'subcategories'),
+            ):
+                if name in data and data[name] not in lookups[lookup]:
+                    reasons.append('%s: Unknown %s %d.' % (name, lookup[:-1], data[name]))
+            if reasons:
+                errors.append({'index': operation['index'], 'errors': reasons})
+        return errors
+
+
+    def apply(self, operations: list[dict], lookups: dict, user: User) -> list[dict]:
+        """
+        A method for applying the valid operations in memory and writing them in bulk.
+        """
+
+        created = {model: [] for model in self.update_fields}
+        updated = {model: {} for model in self.update_fields}
+        deleted = {model: set() for model in self.update_fields}
+        balance_changes, rollup_changes, results = [], [], []
+        for operation in operations:
+            model = self.models[operation['ledger']]
+            if operation['op'] == 'create':
+                entry = model(maker=user)
+            else:
+                entry = lookups['entries'][operation['ledger']][operation['id']]
+            if operation['op'] != 'create':
+                balance_changes += self.balance_manager.changes(entry, -1)
+                if model is not Transaction:
+                    rollup_changes.append(self.rollup_manager.change(entry, -1))
+            if operation['op'] == 'delete':
+                updated[model].pop(entry.id, None)
+                deleted[model].add(entry.id)
+            else:
+                self.fill(entry, operation['data'], lookups)
+                balance_changes += self.balance_manager.changes(entry)
+                if model is not Transaction:
+                    rollup_changes.append(self.rollup_manager.change(entry, 1))
+                if operation['op'] == 'create':
+                    created[model].append(entry)
+                else:
+                    updated[model][entry.id] = entry
+            results.append({'index': operation['index'], 'op': operation['op'], 'ledger': operation['ledger'], 'entry': entry})
+
+        for model in self.update_fields:
+            model.objects.bulk_create(created[model])
+            model.objects.bulk_update(updated[model].values(), self.update_fields[model])
+            model.objects.filter(id__in=deleted[model]).delete()
+        self.balance_manager.apply(self.balance_manager.collect(*balance_changes))
+        self.rollup_manager.apply(*rollup_changes)
+        ledgers = [ledger + 's' for ledger, model in self.models.items() if created[model] or updated[model] or deleted[model]]
+        transaction.on_commit(lambda: self.fragment_cache.bump(user.id, *ledgers))
+        for result in results:
+            result['id'] = result.pop('entry').id
+        return results
+
+
+    def fill(self, entry, data: dict, lookups: dict) -> None:
+        """
+        A method for setting the parsed fields on the entry, the way the ledger views do.
+        """
+
+        if isinstance(entry, Transaction):
+            entry.account1 = lookups['accounts'][data['account1']]
+            entry.account2 = lookups['accounts'][data['account2']]
+        else:
+            entry.account = lookups['accounts'][data['account_id']]
+            entry.category = lookups['categories'][data['category_id']]
+            entry.subcategory = lookups['subcategories'][data['subcategory_id']]
+        if entry.id is None:
+            entry.amount = data['amount']
+        else:
+            entry.amount.amount = data['amount']
+        entry.date = data['date'] or entry.date or timezone.now()
+        entry.comment = data['comment'] or ''
+
+
+class LedgerArchiver:
+    """
+    A class for moving old incomes, expenses and transactions into the archive tables.
+
+    Entries are archived by whole months: every archived month leaves summary rows behind (per
+    account, category and kind), which stand in for its entries wherever totals are rebuilt from
+    the ledgers. Archived entries keep their ids and are read back only when asked for explicitly,
+    like with the archive parameter of the JSON lists and of the exports.
+    """
+
+    archives = {Income: ArchivedIncome, Expense: ArchivedExpense, Transaction: ArchivedTransaction}
+
+    def horizon(self, months: int | None = None) -> datetime:
+        """
+        A method for getting the start of the oldest month that is kept (PANEL_ARCHIVE_MONTHS before the current one).
+        """
+
+        months = getattr(settings, 'PANEL_ARCHIVE_MONTHS', 24) if months is None else months
+        today = timezone.localdate()
+        month = today.year * 12 + today.month - 1 - months
+        return timezone.make_aware(datetime(month // 12, month % 12 + 1, 1))
+
+
+    def archive(self, before: datetime, batch_size: int = 1000) -> dict[str, int]:
+        """
+        A method for archiving the entries dated before the moment and getting how many of each were archived.
+
+        Every batch is copied, summarized and deleted in its own transaction, so the archival can be
+        stopped at any point and the ledgers never lock for long.
+        """
+
+        counts = {}
+        for model, archive in self.archives.items():
+            name = model._meta.model_name + 's'
+            counts[name] = 0
+            fields = [field.attname for field in model._meta.concrete_fields]
+            while True:
+                with transaction.atomic():
+                    rows = list(
+                        model.objects
+                        .select_for_update()
+                        .filter(date__lt=before)
+                        .order_by('id')
+                        .values(*fields)[:batch_size]
+                    )
+                    if not rows:
+                        break
+                    archive.objects.bulk_create([archive(**row) for row in rows])
+                    self.summarize(model, rows)
+                    model.objects.filter(id__in=[row['id'] for row in rows]).delete()
+                counts[name] += len(rows)
+        return counts
+
+
+    def summarize(self, model, rows: list[dict]) -> None:
+        """
+        A method for adding the archived rows of the model to the summaries of their months.
+        """
+
+        totals = {}
+        for row in rows:
+            month = timezone.localtime(row['date']).date().replace(day=1)
+            if model is Transaction:
+                keys = [
+                    (row['maker_id'], row['account1_id'], None, None, 'transfer_out', row['amount_currency'], month),
+                    (row['maker_id'], row['account2_id'], None, None, 'transfer_in', row['amount_currency'], month),
+                ]
+            else:
+                keys = [(
+                    row['maker_id'],
+                    row['account_id'],
+                    row['category_id'],
+                    row['subcategory_id'],
+                    model._meta.model_name,
+                    row['amount_currency'],
+                    month,
+                )]
+            for key in keys:
+                amount, count = totals.get(key, (Decimal(0), 0))
+                totals[key] = (amount + row['amount'], count + 1)
+        for key, (amount, count) in sorted(totals.items(), key=lambda item: str(item[0])):
+            maker_id, account_id, category_id, subcategory_id, kind, currency, month = key
+            summary, created = ArchiveSummary.objects.get_or_create(
+                maker_id=maker_id,
+                account_id=account_id,
+                category_id=category_id,
+                subcategory_id=subcategory_id,
+                kind=kind,
+                currency=currency,
+                month=month,
+            )
+            ArchiveSummary.objects.filter(id=summary.id).update(amount=F('amount') + amount, count=F('count') + count)
@@ -0,0 +1,41 @@
+from datetime import datetime, time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from panel.ledgers import LedgerArchiver
+
+
+class Command(BaseCommand):
+    """
+    A command for moving old incomes, expenses and transactions into the archive tables.
+    """
+
+    help = 'Archives the entries of the months before the horizon, leaving monthly summaries behind.'
+    archiver = LedgerArchiver()
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--months', type=int, help='Months to keep (default: PANEL_ARCHIVE_MONTHS).')
+        parser.add_argument('--before', help='Archive the months before this date (YYYY-MM-DD) instead.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        """
+        A method for archiving the entries older than the horizon, which is always the start of a month.
+        """
+
+        if options['before']:
+            try:
+                day = parse_date(options['before'])
+            except ValueError:
+                day = None
+            if day is None:
+                raise CommandError('Invalid date "%s".' % options['before'])
+            before = timezone.make_aware(datetime.combine(day.replace(day=1), time.min))
+        else:
+            before = self.archiver.horizon(options['months'])
+        counts = self.archiver.archive(before, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Archived %s dated before %s.' % (
+            ', '.join('%d %s' % (count, name) for name, count in counts.items()),
+            before.date().isoformat(),
+        )))
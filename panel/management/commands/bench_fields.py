@@ -0,0 +1,63 @@
+import timeit
+from django.core.management.base import BaseCommand
+from django.http import QueryDict
+from panel.assistants import Validator
+from panel.views import IncomeView
+
+
+class Command(BaseCommand):
+    """
+    A command for comparing the declarative request parser with the Validator it replaced.
+    """
+
+    help = 'Benchmarks parsing the fields of an income POST with Schema against Validator.'
+    params = QueryDict(mutable=True)
+    params.update({
+        'income_id': '125',
+        'category_id': '4',
+        'subcategory_id': '17',
+        'account_id': '3',
+        'amount': '150000.50',
+        'date': '01.04.2023 12:30',
+        'comment': 'Salary for March, bonus #2',
+    })
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--number', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        """
+        A method for timing both parsers on the same requests and printing the results.
+
+        Note that Validator only cleans strings, while Schema also converts them to typed values;
+        converting the date to an aware datetime accounts for most of the time of Schema.
+        """
+
+        validator = Validator()
+        schema = IncomeView.post_schema
+        number = options['number']
+        without_date = self.params.copy()
+        without_date['date'] = ''
+        for title, params in (('with a date', self.params), ('without a date', without_date)):
+
+            def validate():
+                # The calls IncomeView.post used to make. The comment pattern is written with a valid
+                # character range, since the one the view used does not compile.
+                validator.validate(params.get('income_id'), r'[^0-9]', strip=True)
+                validator.validate(params.get('category_id'), r'[^0-9]', strip=True)
+                validator.validate(params.get('subcategory_id'), r'[^0-9]', strip=True)
+                validator.validate(params.get('account_id'), r'[^0-9]', strip=True)
+                validator.validate(params.get('amount'), r'[^0-9.,]', strip=True)
+                validator.validate(params.get('date'), r'[^0-9/.-:;,]')
+                validator.validate(params.get('comment'), r'[^a-zA-Zа-яА-ЯёЁ0-9,.#+_()-]', strip=True)
+
+            def parse():
+                schema.parse(params)
+
+            self.stdout.write('Income POST %s:' % title)
+            for name, function in (('Validator', validate), ('Schema', parse)):
+                seconds = min(timeit.repeat(function, number=number, repeat=5))
+                self.stdout.write('  %-10s %8.2f us/request %10.0f requests/s' % (
+                    name, seconds / number * 1e6, number / seconds
+                ))
@@ -0,0 +1,84 @@
+import timeit
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from panel.models import Income
+from panel.relationships import Account, \
+    Category, \
+    Subcategory
+from panel.serializers import IncomeSerializer, \
+    IncomeValuesSerializer
+
+
+class Command(BaseCommand):
+    """
+    A command for comparing the values() serializers with the model serializers they replaced.
+    """
+
+    help = 'Benchmarks serializing incomes with IncomeValuesSerializer against IncomeSerializer.'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--entries', type=int, default=1000)
+        parser.add_argument('--number', type=int, default=500)
+
+    def handle(self, *args, **options):
+        """
+        A method for timing both serializers on the same incomes and printing the results.
+
+        The incomes are created in a transaction that is rolled back at the end. Note that the
+        model serializer does the lesser job: its output has only the ids of the related objects,
+        while the values() serializer also includes their names.
+        """
+
+        with transaction.atomic():
+            ids = self.create_incomes(options['entries'])
+            values_serializer = IncomeValuesSerializer()
+            queryset = Income.objects.filter(id__in=ids)
+
+            def retrieve_model():
+                IncomeSerializer(Income.objects.get(id=ids[0])).data
+
+            def retrieve_values():
+                values_serializer.to_representation(values_serializer.values(Income.objects.all()).get(id=ids[0]))
+
+            def list_model():
+                IncomeSerializer(queryset, many=True).data
+
+            def list_values():
+                values_serializer.list(queryset)
+
+            for title, number, count, functions in (
+                ('Retrieve one income', options['number'], 1, (retrieve_model, retrieve_values)),
+                ('List %d incomes' % len(ids), max(options['number'] // 100, 1), len(ids), (list_model, list_values)),
+            ):
+                self.stdout.write('%s:' % title)
+                for name, function in zip(('Model', 'Values'), functions):
+                    seconds = min(timeit.repeat(function, number=number, repeat=5))
+                    self.stdout.write('  %-10s %10.2f us/call %10.0f objects/s' % (
+                        name, seconds / number * 1e6, number * count / seconds
+                    ))
+            transaction.set_rollback(True)
+
+
+    def create_incomes(self, number: int) -> list[int]:
+        """
+        A method for creating the incomes to serialize.
+        """
+
+        user = User.objects.create_user('bench-serializers')
+        account = Account.objects.create(name='bench-serializers', balance=Decimal('0'), owner=user)
+        category = Category.objects.create(name='Salary', related_to='Income')
+        subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        incomes = Income.objects.bulk_create([
+            Income(
+                category=category, 
+                subcategory=subcategory, 
+                account=account, 
+                amount=Decimal('1000.50') + index, 
+                comment='Income #%d' % index, 
+                maker=user
+            ) for index in range(number)
+        ])
+        return [income.id for income in incomes]
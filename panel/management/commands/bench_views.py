@@ -0,0 +1,281 @@
+import json
+import resource
+import tracemalloc
+from datetime import timedelta
+from itertools import count
+from time import perf_counter
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from panel.caches import FragmentCache
+from panel.metrics import RequestMetrics
+from panel.models import Expense, \
+    Income, \
+    Transaction
+from panel.relationships import Account, \
+    Category, \
+    Subcategory
+
+
+class Command(BaseCommand):
+    """
+    A command for benchmarking the panel endpoints through the test client on the current database.
+    """
+
+    help = 'Measures latency percentiles, queries and memory of the panel endpoints and writes them as JSON.'
+    fragment_cache = FragmentCache()
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--user', default='synthetic-0', help='Username to send the requests as.')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per scenario.')
+        parser.add_argument('--only', nargs='*', default=[], help='Run only the scenarios containing these words.')
+        parser.add_argument('--output', help='File to write the results to as JSON.')
+        parser.add_argument('--compare', help='Results of an earlier run to compare with.')
+
+    def handle(self, *args, **options):
+        """
+        A method for running the scenarios one by one and reporting the results.
+
+        Scenarios that change data are run in add/edit/delete order over the same entries, so a run
+        leaves the database as it found it. Memory is measured with tracemalloc over the warmup
+        requests only, since tracing slows down the timed ones.
+        """
+
+        user = User.objects.get(username=options['user'])
+        self.client = Client(raise_request_exception=False)
+        self.client.force_login(user)
+        results = {}
+        for name, send, prepare in self.get_scenarios(user):
+            if options['only'] and not any(word in name for word in options['only']):
+                continue
+            results[name] = self.measure(send, prepare, options['requests'], options['warmup'])
+            self.stdout.write('%-28s p50 %8.2f ms  p99 %8.2f ms  %5.1f queries  %8.1f KiB  %s' % (
+                name,
+                results[name]['p50_ms'],
+                results[name]['p99_ms'],
+                results[name]['queries'],
+                results[name]['peak_memory_kib'],
+                ','.join(str(status) for status in results[name]['statuses']),
+            ))
+        report = {
+            'date': timezone.now().isoformat(),
+            'database': connections['default'].vendor,
+            'user': user.username,
+            'entries': {
+                'incomes': Income.objects.filter(maker=user).count(),
+                'expenses': Expense.objects.filter(maker=user).count(),
+                'transactions': Transaction.objects.filter(maker=user).count(),
+            },
+            'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+
+    def get_scenarios(self, user: User) -> list[tuple]:
+        """
+        A method for listing the scenarios: name, function sending a request and an untimed preparation.
+        """
+
+        account, other = Account.objects.filter(owner=user).order_by('id')[:2]
+        scenarios = [
+            ('page', lambda: self.client.get(reverse('panel:incomes-expenses')), None),
+            (
+                'page (cold)',
+                lambda: self.client.get(reverse('panel:incomes-expenses')),
+                lambda: self.fragment_cache.bump(user.id, 'incomes', 'expenses', 'transactions'),
+            ),
+        ]
+        for name, fields in (
+            ('income', self.get_category_fields('Income', account)),
+            ('expense', self.get_category_fields('Expense', account)),
+            ('transaction', {'account1': account.id, 'account2': other.id}),
+        ):
+            url = reverse('panel:%ss' % name)
+            ids = []
+            scenarios += [
+                ('%s add' % name, self.add(url, fields, ids), None),
+                ('%s edit' % name, self.edit(url, fields, ids, name + '_id'), None),
+                ('%s delete' % name, self.delete(url, ids, name + '_id'), None),
+            ]
+        scenarios += [
+            ('dashboard', lambda: self.client.get(reverse('panel:dashboard')), None),
+            (
+                'dashboard (cold)',
+                lambda: self.client.get(reverse('panel:dashboard')),
+                lambda: self.fragment_cache.bump(user.id, 'incomes', 'expenses'),
+            ),
+        ]
+        scenarios += [
+            ('timeline', lambda: self.client.get(reverse('panel:timeline')), None),
+            ('timeline (account)', lambda: self.client.get(reverse('panel:timeline'), {'account': account.id}), None),
+            ('statement (month)', lambda: self.client.get(
+                reverse('panel:statement', args=[account.id]), 
+                {'from': (timezone.localdate() - timedelta(days=30)).isoformat()},
+            ), None),
+        ]
+        for name, params in (
+            ('categories', {}), 
+            ('cash-flow', {'months': 36}), 
+            ('balance', {'account': account.id, 'months': 36}),
+        ):
+            url = reverse('panel:chart-' + name)
+            scenarios.append(('chart %s' % name, lambda url=url, params=params: self.client.get(url, params), None))
+        for name, words in (('search', 'coffee'), ('search (rare)', 'dividends'), ('search (prefix)', 'gro')):
+            scenarios.append((name, lambda words=words: self.client.get(reverse('panel:search'), {'q': words}), None))
+        for model in ('income', 'expense', 'transaction'):
+            url = reverse('admin:panel_%s_changelist' % model)
+            scenarios.append(('admin %ss' % model, lambda url=url: self.client.get(url), None))
+        return scenarios
+
+
+    def get_category_fields(self, related_to: str, account: Account) -> dict:
+        """
+        A method for getting the fields of an income or expense booked on the account.
+        """
+
+        return {
+            'category_id': Category.objects.filter(related_to=related_to).values_list('id', flat=True)[0],
+            'subcategory_id': Subcategory.objects.filter(related_to=related_to).values_list('id', flat=True)[0],
+            'account_id': account.id,
+        }
+
+
+    def add(self, url: str, fields: dict, ids: list):
+        """
+        A method for building the function adding an entry and keeping its id for the edits and deletes.
+        """
+
+        def send():
+            response = self.client.post(url, {**fields, 'amount': '1000', 'comment': 'Benchmark'})
+            if response.status_code == 200:
+                ids.append(response.json()['id'])
+            return response
+
+        return send
+
+
+    def edit(self, url: str, fields: dict, ids: list, id_field: str):
+        """
+        A method for building the function editing the added entries in turn.
+        """
+
+        position = count()
+
+        def send():
+            entry_id = ids[next(position) % len(ids)] if ids else 0
+            return self.client.post(url, {
+                **fields, 
+                'amount': '2000', 
+                'comment': 'Edited', 
+                'editing': '', 
+                id_field: entry_id,
+            })
+
+        return send
+
+
+    def delete(self, url: str, ids: list, id_field: str):
+        """
+        A method for building the function deleting the added entries one by one.
+        """
+
+        def send():
+            return self.client.get(url, {'deleting': '', id_field: ids.pop() if ids else 0})
+
+        return send
+
+
+    def measure(self, send, prepare, requests: int, warmup: int) -> dict:
+        """
+        A method for sending the requests of a scenario and summarizing them.
+        """
+
+        peak = 0
+        tracemalloc.start()
+        for _ in range(warmup):
+            if prepare:
+                prepare()
+            tracemalloc.reset_peak()
+            self.read(send())
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        latencies, queries, sql, templates, statuses = [], [], [], [], set()
+        for _ in range(requests):
+            if prepare:
+                prepare()
+            metrics = RequestMetrics()
+            token = RequestMetrics.current.set(metrics)
+            try:
+                started = perf_counter()
+                statuses.add(self.read(send()))
+                latencies.append(perf_counter() - started)
+            finally:
+                RequestMetrics.current.reset(token)
+            queries.append(metrics.queries)
+            sql.append(metrics.sql_time)
+            templates.append(metrics.template_time)
+        latencies.sort()
+        return {
+            'requests': requests,
+            'statuses': sorted(statuses),
+            'p50_ms': self.percentile(latencies, 50) * 1000,
+            'p90_ms': self.percentile(latencies, 90) * 1000,
+            'p99_ms': self.percentile(latencies, 99) * 1000,
+            'max_ms': latencies[-1] * 1000,
+            'mean_ms': sum(latencies) / len(latencies) * 1000,
+            'queries': sum(queries) / len(queries),
+            'sql_ms': sum(sql) / len(sql) * 1000,
+            'template_ms': sum(templates) / len(templates) * 1000,
+            'peak_memory_kib': peak / 1024,
+        }
+
+
+    def read(self, response) -> int:
+        """
+        A method for reading the whole body of the response, streamed or not, and getting its status.
+        """
+
+        if response.streaming:
+            b''.join(response.streaming_content)
+        else:
+            response.content
+        return response.status_code
+
+
+    def percentile(self, values: list[float], percent: int) -> float:
+        """
+        A method for getting the percentile of the sorted values.
+        """
+
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+    def compare(self, report: dict, path: str) -> None:
+        """
+        A method for printing how the latencies and queries changed since the run saved in the file.
+        """
+
+        with open(path) as file:
+            previous = json.load(file)['scenarios']
+        self.stdout.write('Compared with %s:' % path)
+        for name, result in report['scenarios'].items():
+            if name not in previous:
+                continue
+            before = previous[name]
+            self.stdout.write('%-28s p50 %+7.1f%%  p99 %+7.1f%%  queries %+.1f' % (
+                name,
+                (result['p50_ms'] / before['p50_ms'] - 1) * 100,
+                (result['p99_ms'] / before['p99_ms'] - 1) * 100,
+                result['queries'] - before['queries'],
+            ))
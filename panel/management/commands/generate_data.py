@@ -0,0 +1,229 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from panel.caches import FragmentCache
+from panel.models import Expense, \
+    Income, \
+    Transaction
+from panel.relationships import Account, \
+    Category, \
+    Subcategory
+
+
+class Command(BaseCommand):
+    """
+    A command for filling the database with synthetic users and ledgers for benchmarking.
+    """
+
+    help = 'Generates users with accounts and incomes/expenses/transactions spread over the past months.'
+    categories = {
+        'Income': {
+            'Salary': ['Monthly', 'Bonus'],
+            'Freelance': ['Projects', 'Consulting'],
+            'Investments': ['Dividends', 'Interest'],
+        },
+        'Expense': {
+            'Food': ['Groceries', 'Restaurants', 'Coffee'],
+            'Transport': ['Taxi', 'Fuel', 'Public transport'],
+            'Home': ['Rent', 'Utilities', 'Internet'],
+            'Leisure': ['Cinema', 'Travel', 'Sports'],
+            'Health': ['Pharmacy', 'Doctors'],
+        },
+    }
+    accounts = [('Cash', 'UZS'), ('Card', 'UZS'), ('Deposit', 'UZS'), ('Savings', 'USD'), ('Travel', 'RUB')]
+    rates = {'UZS': 1, 'USD': 12_000, 'RUB': 130}
+    fragment_cache = FragmentCache()
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--incomes', type=int, default=20000, help='Incomes per user.')
+        parser.add_argument('--expenses', type=int, default=80000, help='Expenses per user.')
+        parser.add_argument('--transactions', type=int, default=10000, help='Transactions per user.')
+        parser.add_argument('--months', type=int, default=36, help='How far back the entries go.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='synthetic', help='Prefix of the generated names.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        """
+        A method for generating the users one by one, each in its own transaction.
+
+        The first user is a superuser, so the benchmarks can open the admin with it. Balances are
+        set to the sum of the generated entries and the rollups are rebuilt at the end.
+        """
+
+        self.random = random.Random(options['seed'])
+        self.end = timezone.localtime()
+        self.start = self.end - timedelta(days=30 * options['months'])
+        categories = self.get_categories(options['prefix'])
+        existing = User.objects.filter(username__startswith=options['prefix'] + '-').count()
+        for number in range(existing, existing + options['users']):
+            with transaction.atomic():
+                user, accounts = self.create_user('%s-%d' % (options['prefix'], number), number == 0)
+                balances = {account.id: Decimal(0) for account in accounts}
+                for model, count, build in (
+                    (Income, options['incomes'], self.build_income),
+                    (Expense, options['expenses'], self.build_expense),
+                    (Transaction, options['transactions'], self.build_transaction),
+                ):
+                    batch = []
+                    for _ in range(count):
+                        batch.append(build(user, accounts, categories, balances))
+                        if len(batch) >= options['batch_size']:
+                            model.objects.bulk_create(batch)
+                            batch = []
+                    model.objects.bulk_create(batch)
+                for account in accounts:
+                    account.balance.amount = balances[account.id]
+                Account.objects.bulk_update(accounts, ['balance'])
+            self.fragment_cache.bump(user.id, 'incomes', 'expenses', 'transactions')
+            self.stdout.write('Generated %s.' % user.username)
+        call_command('rebuild_rollups', stdout=self.stdout)
+
+
+    def get_categories(self, prefix: str) -> dict[str, list[tuple[Category, Subcategory]]]:
+        """
+        A method for creating (or reusing) the categories and subcategories the entries are spread over.
+        """
+
+        result = {}
+        for related_to, categories in self.categories.items():
+            result[related_to] = []
+            for name, subcategories in categories.items():
+                category, _ = Category.objects.get_or_create(name='%s %s' % (prefix, name), related_to=related_to)
+                for subname in subcategories:
+                    subcategory, _ = Subcategory.objects.get_or_create(
+                        name='%s %s' % (prefix, subname), related_to=related_to
+                    )
+                    result[related_to].append((category, subcategory))
+        return result
+
+
+    def create_user(self, username: str, is_superuser: bool) -> tuple[User, list[Account]]:
+        """
+        A method for creating the user, without a usable password, and the user's accounts.
+        """
+
+        user = User.objects.create(
+            username=username,
+            password=make_password(None),
+            is_staff=is_superuser,
+            is_superuser=is_superuser,
+        )
+        accounts = [
+            Account(name='%s %s' % (username, name), balance=Decimal(0), balance_currency=currency, owner=user)
+            for name, currency in self.accounts
+        ]
+        return user, Account.objects.bulk_create(accounts)
+
+
+    def build_income(self, user: User, accounts: list[Account], categories: dict, balances: dict) -> Income:
+        """
+        A method for building an income, mostly salaries paid in the first days of a month.
+        """
+
+        category, subcategory = self.random.choice(categories['Income'])
+        account = accounts[0] if self.random.random() < 0.3 else self.random.choice(accounts)
+        if self.random.random() < 0.6:
+            date = self.get_date(day=self.random.randint(1, 5))
+        else:
+            date = self.get_date()
+        amount = self.get_amount(account, 8_000_000 if self.random.random() < 0.6 else 1_500_000)
+        balances[account.id] += amount
+        return Income(
+            category=category,
+            subcategory=subcategory,
+            account=account,
+            amount=amount,
+            amount_currency=account.balance_currency,
+            date=date,
+            comment=self.get_comment(subcategory),
+            maker=user,
+        )
+
+
+    def build_expense(self, user: User, accounts: list[Account], categories: dict, balances: dict) -> Expense:
+        """
+        A method for building an expense, mostly small everyday ones made from cash or the card.
+        """
+
+        category, subcategory = self.random.choice(categories['Expense'])
+        if self.random.random() < 0.85:
+            account = self.random.choice(accounts[:2])
+        else:
+            account = self.random.choice(accounts)
+        amount = self.get_amount(account, 90_000)
+        balances[account.id] -= amount
+        return Expense(
+            category=category,
+            subcategory=subcategory,
+            account=account,
+            amount=amount,
+            amount_currency=account.balance_currency,
+            date=self.get_date(),
+            comment=self.get_comment(subcategory),
+            maker=user,
+        )
+
+
+    def build_transaction(self, user: User, accounts: list[Account], categories: dict, balances: dict) -> Transaction:
+        """
+        A method for building a transfer between two accounts of the user in the same currency.
+        """
+
+        account1, account2 = self.random.sample(accounts[:3], 2)
+        amount = self.get_amount(account1, 1_000_000)
+        balances[account1.id] -= amount
+        balances[account2.id] += amount
+        return Transaction(
+            account1=account1,
+            account2=account2,
+            amount=amount,
+            amount_currency=account1.balance_currency,
+            date=self.get_date(),
+            comment='Transfer',
+            maker=user,
+        )
+
+
+    def get_date(self, day: int | None = None) -> datetime:
+        """
+        A method for picking a moment of the period, busier on weekends and in the evenings.
+
+        Entries are more frequent in recent months, as if the user kept the panel more carefully
+        over time. With a day given, the moment is moved to that day of its month.
+        """
+
+        span = (self.end - self.start).total_seconds()
+        date = self.start + timedelta(seconds=span * self.random.random() ** 0.7)
+        if date.weekday() < 5 and self.random.random() < 0.3:
+            date += timedelta(days=5 - date.weekday())
+        hour = min(23, max(7, int(self.random.gauss(18, 3.5))))
+        date = date.replace(hour=hour, minute=self.random.randint(0, 59), second=self.random.randint(0, 59))
+        if day is not None:
+            date = date.replace(day=day)
+        return min(date, self.end)
+
+
+    def get_amount(self, account: Account, median: int) -> Decimal:
+        """
+        A method for picking a log-normally distributed amount around the median (in UZS).
+        """
+
+        amount = median * self.random.lognormvariate(0, 0.9) / self.rates[account.balance_currency]
+        return Decimal(max(amount, 0.01)).quantize(Decimal('0.01'))
+
+
+    def get_comment(self, subcategory: Subcategory) -> str:
+        """
+        A method for writing a short comment of the entry.
+        """
+
+        return '%s #%d' % (subcategory.name.split(' ', 1)[-1], self.random.randint(1, 9999))
@@ -0,0 +1,48 @@
+import csv
+from decimal import Decimal, InvalidOperation
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+from panel.caches import VersionKeeper
+from panel.models import ExchangeRate
+from panel.rates import RateTable
+
+
+class Command(BaseCommand):
+    """
+    A command for loading exchange rates from a local CSV file.
+    """
+
+    help = 'Loads exchange rates from a CSV file with "date,currency,rate" rows, replacing rates of the same day.'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        """
+        A method for saving the rates of the file and invalidating the cached rates.
+        """
+
+        currencies = dict(ExchangeRate.currencies)
+        rates = []
+        with open(options['path'], newline='', encoding='utf-8-sig') as file:
+            for number, row in enumerate(csv.DictReader(file), start=2):
+                try:
+                    day = parse_date(row['date'].strip())
+                    rate = Decimal(row['rate'].strip())
+                except (KeyError, AttributeError, ValueError, InvalidOperation):
+                    day = rate = None
+                currency = (row.get('currency') or '').strip().upper()
+                if day is None or rate is None or rate <= 0 or currency not in currencies:
+                    raise CommandError('Invalid rate on line %d.' % number)
+                rates.append(ExchangeRate(currency=currency, date=day, rate=rate))
+        with transaction.atomic():
+            ExchangeRate.objects.bulk_create(
+                rates,
+                update_conflicts=True,
+                unique_fields=['currency', 'date'],
+                update_fields=['rate'],
+            )
+            transaction.on_commit(lambda: VersionKeeper().bump(RateTable.version_name))
+        self.stdout.write(self.style.SUCCESS('Loaded %d rates.' % len(rates)))
@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    A command for load testing the same page served by a WSGI and an ASGI server.
+    """
+
+    help = 'Compares requests/s and latency percentiles of a WSGI URL and an ASGI URL.'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--wsgi', 
+            default='http://127.0.0.1:8000/incomes-expenses/', 
+            help='URL of the sync view, e.g. served by "manage.py runserver" or gunicorn.'
+        )
+        parser.add_argument(
+            '--asgi', 
+            default='http://127.0.0.1:8001/async/incomes-expenses/', 
+            help='URL of the async view, e.g. served by uvicorn or daphne with mypanel.asgi.'
+        )
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--sessionid', default='', help='Session cookie of a logged in user.')
+
+    def handle(self, *args, **options):
+        """
+        A method for running the load against both URLs and printing the results.
+        """
+
+        for name in ('wsgi', 'asgi'):
+            latencies, errors, seconds = self.run(options[name], options)
+            latencies.sort()
+            self.stdout.write('%s %s' % (name.upper(), options[name]))
+            self.stdout.write('  %.1f requests/s, %d errors' % (len(latencies) / seconds, errors))
+            if latencies:
+                self.stdout.write('  p50 %.1f ms, p99 %.1f ms' % (
+                    self.percentile(latencies, 50) * 1000, 
+                    self.percentile(latencies, 99) * 1000
+                ))
+
+
+    def run(self, url: str, options: dict) -> tuple[list[float], int, float]:
+        """
+        A method for sending the requests to the URL from a pool of concurrent clients.
+        """
+
+        headers = {'Cookie': 'sessionid=%s' % options['sessionid']} if options['sessionid'] else {}
+
+        def send(_):
+            started = time.perf_counter()
+            try:
+                with urlopen(Request(url, headers=headers), timeout=30) as response:
+                    response.read()
+            except OSError:
+                return None
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            results = list(executor.map(send, range(options['requests'])))
+        seconds = time.perf_counter() - started
+        latencies = [result for result in results if result is not None]
+        return latencies, len(results) - len(latencies), seconds
+
+
+    def percentile(self, values: list[float], percent: int) -> float:
+        """
+        A method for getting the percentile of the sorted values.
+        """
+
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
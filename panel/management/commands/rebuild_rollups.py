@@ -0,0 +1,105 @@
+from itertools import chain
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncMonth
+from panel.caches import FragmentCache
+from panel.models import ArchiveSummary, \
+    Expense, \
+    Income, \
+    MonthlyRollup
+
+
+class Command(BaseCommand):
+    """
+    A command for rebuilding the monthly rollups of incomes and expenses from scratch.
+    """
+
+    help = 'Rebuilds the monthly rollups of incomes and expenses from scratch.'
+    key = ['maker', 'account', 'category', 'subcategory', 'amount_currency', 'month']
+    # The summaries are locked first, since the archiver writes them before it deletes the entries.
+    locked_models = [ArchiveSummary, Income, Expense]
+    fragment_cache = FragmentCache()
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        """
+        A method for replacing all rollups with totals aggregated from the ledgers.
+
+        Archived months are taken from the summaries the archived entries left behind. The ledgers
+        are locked against writes while they are aggregated and the rollups are replaced, so no
+        entry is written in between and left out; the cached totals of the users are dropped
+        once the new rollups are committed.
+        """
+
+        with transaction.atomic():
+            self.lock()
+            rollups = self.aggregate()
+            makers = set(MonthlyRollup.objects.values_list('maker', flat=True).distinct())
+            makers |= {rollup.maker_id for rollup in rollups.values()}
+            MonthlyRollup.objects.all().delete()
+            MonthlyRollup.objects.bulk_create(rollups.values(), batch_size=options['batch_size'])
+            transaction.on_commit(lambda: self.bump(makers))
+        self.stdout.write(self.style.SUCCESS('Rebuilt %d rollups.' % len(rollups)))
+
+
+    def lock(self) -> None:
+        """
+        A method for locking the ledgers and the archive summaries against writes until the end of the transaction.
+
+        Other databases than PostgreSQL lock the whole database for the first write of a transaction
+        and fail the transaction if anything was written since it read, so they need no lock here.
+        """
+
+        connection = connections[MonthlyRollup.objects.db]
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            for model in self.locked_models:
+                cursor.execute('LOCK TABLE %s IN SHARE MODE' % connection.ops.quote_name(model._meta.db_table))
+
+
+    def aggregate(self) -> dict[tuple, MonthlyRollup]:
+        """
+        A method for summing the ledgers and the archive summaries into unsaved rollups.
+        """
+
+        rollups = {}
+        for model, kind in ((Income, 'income'), (Expense, 'expense')):
+            totals = model.objects \
+                .annotate(month=TruncMonth('date', output_field=DateField())) \
+                .values(*self.key) \
+                .annotate(total=Sum('amount'), count=Count('id')) \
+                .order_by()
+            archived = ArchiveSummary.objects \
+                .filter(kind=kind) \
+                .values('maker', 'account', 'category', 'subcategory', 'month', amount_currency=F('currency')) \
+                .annotate(total=Sum('amount'), count=Sum('count')) \
+                .order_by()
+            for row in chain(totals.iterator(), archived.iterator()):
+                key = tuple(row[field] for field in self.key)
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollup = rollups[key] = MonthlyRollup(
+                        maker_id=row['maker'],
+                        account_id=row['account'],
+                        category_id=row['category'],
+                        subcategory_id=row['subcategory'],
+                        currency=row['amount_currency'],
+                        month=row['month'],
+                    )
+                setattr(rollup, kind + '_amount', getattr(rollup, kind + '_amount') + row['total'])
+                setattr(rollup, kind + '_count', getattr(rollup, kind + '_count') + row['count'])
+        return rollups
+
+
+    def bump(self, makers: set[int]) -> None:
+        """
+        A method for invalidating what is cached from the incomes and expenses of the users.
+        """
+
+        for maker in makers:
+            self.fragment_cache.bump(maker, 'incomes', 'expenses')
@@ -0,0 +1,71 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db import connections
+from panel.balances import BalanceReconciler
+
+
+class Command(BaseCommand):
+    """
+    A command for finding (and optionally repairing) accounts whose balance drifted from their entries.
+    """
+
+    help = 'Recomputes the balances of all accounts from their entries and reports (or repairs) the drifted ones.'
+    reconciler = BalanceReconciler()
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--workers', 
+            type=int, 
+            default=os.cpu_count(), 
+            help='Processes checking account ranges in parallel (1 checks them in this process).'
+        )
+        parser.add_argument('--shards', type=int, help='Account ranges to split the work into (default: 4 per worker).')
+        parser.add_argument('--repair', action='store_true', help='Set the drifted balances to the expected ones.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        """
+        A method for checking the account ranges, reporting the drift and repairing it when asked.
+
+        Workers are forked from this process, so its database connections are closed first and
+        every worker opens its own. The repair runs here, in one transaction, after all ranges are checked.
+        """
+
+        started = perf_counter()
+        workers = max(options['workers'] or 1, 1)
+        shards = self.reconciler.shards(options['shards'] or workers * 4)
+        if workers == 1 or len(shards) == 1:
+            drifts = [drift for shard in shards for drift in self.reconciler.drift(shard)]
+        else:
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(min(workers, len(shards)), mp_context=context) as executor:
+                drifts = [drift for result in executor.map(self.reconciler.drift, shards) for drift in result]
+        repaired = self.reconciler.repair([drift['account'] for drift in drifts]) if options['repair'] and drifts else []
+        seconds = perf_counter() - started
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'shards': len(shards),
+                'seconds': seconds,
+                'drifted': drifts,
+                'repaired': repaired,
+            }, indent=2, default=str))
+            return
+        for drift in drifts:
+            self.stdout.write('%-40s balance %20s  expected %20s  drift %+20s' % (
+                '#%d %s' % (drift['account'], drift['name']),
+                drift['balance'],
+                drift['expected'],
+                drift['drift'],
+            ))
+        summary = 'Checked %d account ranges in %.2f s: %d drifted' % (len(shards), seconds, len(drifts))
+        if options['repair']:
+            summary += ', %d repaired' % len(repaired)
+        style = self.style.WARNING if drifts and not repaired else self.style.SUCCESS
+        self.stdout.write(style(summary + '.'))
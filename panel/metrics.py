@@ -0,0 +1,312 @@
+import logging
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest, HttpResponse
+from django.template.backends import django as django_backend
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger('panel.metrics')
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    An exception for requests running more SQL queries than the query budget of their view.
+    """
+
+
+class Histogram:
+    """
+    A class for counting observed values into buckets, the way Prometheus histograms do.
+    """
+
+    def __init__(self, buckets: tuple):
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+
+    def observe(self, value: float) -> None:
+        """
+        A method for counting the value into the first bucket it fits in.
+        """
+
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """
+        A method for getting the upper bound and the cumulative count of every bucket.
+        """
+
+        total = 0
+        result = []
+        for bound, count in zip([*self.buckets, '+Inf'], self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+
+class MetricsRegistry:
+    """
+    A class for aggregating the metrics of requests per view in process memory.
+
+    Every process keeps its own histograms, so each worker has to be scraped separately.
+    """
+
+    metrics = {
+        'panel_view_queries': (
+            'SQL queries run per request.',
+            (1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+        ),
+        'panel_view_sql_seconds': (
+            'Time spent running SQL per request.',
+            (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+        ),
+        'panel_view_template_seconds': (
+            'Time spent rendering templates per request.',
+            (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+        ),
+        'panel_view_response_bytes': (
+            'Size of the response body (streamed responses are not counted).',
+            (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+        ),
+        'panel_view_duration_seconds': (
+            'Time spent handling the request.',
+            (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+        ),
+    }
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.exceeded = {}
+
+
+    def observe(self, view: str, **values: float) -> None:
+        """
+        A method for counting the values (metric name without the prefix -> value) of a request to the view.
+        """
+
+        with self.lock:
+            for name, value in values.items():
+                name = 'panel_view_' + name
+                key = (name, view)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(self.metrics[name][1])
+                self.histograms[key].observe(value)
+
+
+    def count_exceeded(self, view: str) -> None:
+        """
+        A method for counting a request to the view that ran over its query budget.
+        """
+
+        with self.lock:
+            self.exceeded[view] = self.exceeded.get(view, 0) + 1
+
+
+    def render(self) -> str:
+        """
+        A method for rendering all metrics in the Prometheus text format.
+        """
+
+        lines = []
+        with self.lock:
+            for name, (description, buckets) in self.metrics.items():
+                lines += ['# HELP %s %s' % (name, description), '# TYPE %s histogram' % name]
+                for (metric, view), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in histogram.cumulative():
+                        lines.append('%s_bucket{view="%s",le="%s"} %d' % (name, view, bound, count))
+                    lines.append('%s_sum{view="%s"} %s' % (name, view, histogram.sum))
+                    lines.append('%s_count{view="%s"} %d' % (name, view, histogram.count))
+            lines += [
+                '# HELP panel_view_query_budget_exceeded_total Requests that ran over the query budget of the view.',
+                '# TYPE panel_view_query_budget_exceeded_total counter',
+            ]
+            for view, count in sorted(self.exceeded.items()):
+                lines.append('panel_view_query_budget_exceeded_total{view="%s"} %d' % (view, count))
+        return '\n'.join(lines) + '\n'
+
+
+    def clear(self) -> None:
+        """
+        A method for dropping everything recorded so far.
+        """
+
+        with self.lock:
+            self.histograms.clear()
+            self.exceeded.clear()
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """
+    A class for recording the queries and the template rendering of one request.
+
+    The metrics of the request being served are kept in a context variable, which also reaches the
+    threads sync_to_async runs the queries of async views in. Every database connection counts its
+    queries into them through record_query, which the connection_created signal installs.
+    """
+
+    current = ContextVar('panel_request_metrics', default=None)
+
+    def __init__(self):
+
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+
+
+    def __call__(self, execute, sql, params, many, context):
+
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += perf_counter() - start
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    A function for counting the query into the metrics of the current request, if any.
+    """
+
+    metrics = RequestMetrics.current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+class Template(django_backend.Template):
+    """
+    A template that adds its rendering time to the metrics of the current request.
+    """
+
+    def render(self, context=None, request=None):
+
+        metrics = RequestMetrics.current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += perf_counter() - start
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    The Django template backend with the rendering of templates timed for MetricsMiddleware.
+
+    Only the templates rendered by views are timed; the ones they include are part of their time.
+    Without the PANEL_METRICS setting it gives out the templates of the Django backend unchanged.
+    """
+
+    def from_string(self, template_code):
+
+        template = super().from_string(template_code)
+        return Template(template.template, self) if getattr(settings, 'PANEL_METRICS', False) else template
+
+
+    def get_template(self, template_name):
+
+        template = super().get_template(template_name)
+        return Template(template.template, self) if getattr(settings, 'PANEL_METRICS', False) else template
+
+
+@sync_and_async_middleware
+class MetricsMiddleware:
+    """
+    A middleware for recording the queries, SQL time, template time and response size of every view.
+
+    It is enabled by the PANEL_METRICS setting. Views may declare a query_budget; requests running
+    more queries are logged and counted, and fail with QueryBudgetExceeded when the
+    PANEL_ENFORCE_QUERY_BUDGETS setting is on (as the tests do). Under ASGI it runs as async
+    middleware, so the async views are served without switching threads.
+    """
+
+    def __init__(self, get_response):
+
+        if not getattr(settings, 'PANEL_METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = RequestMetrics.current.set(metrics)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            RequestMetrics.current.reset(token)
+        return self.record(request, response, metrics, perf_counter() - start)
+
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+
+        metrics = RequestMetrics()
+        token = RequestMetrics.current.set(metrics)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            RequestMetrics.current.reset(token)
+        return self.record(request, response, metrics, perf_counter() - start)
+
+
+    def record(self, request: HttpRequest, response: HttpResponse, metrics: RequestMetrics, duration: float) -> HttpResponse:
+        """
+        A method for adding the metrics of the request to the registry and checking its query budget.
+        """
+
+        match = request.resolver_match
+        if match is None:
+            return response
+        values = {
+            'queries': metrics.queries,
+            'sql_seconds': metrics.sql_time,
+            'template_seconds': metrics.template_time,
+            'duration_seconds': duration,
+        }
+        if not response.streaming:
+            values['response_bytes'] = len(response.content)
+        registry.observe(match.view_name, **values)
+        self.check_budget(match, metrics.queries)
+        return response
+
+
+    def check_budget(self, match, queries: int) -> None:
+        """
+        A method for reporting the request when it ran more queries than the budget of its view.
+        """
+
+        budget = getattr(getattr(match.func, 'view_class', None), 'query_budget', None)
+        if budget is None or queries <= budget:
+            return
+        registry.count_exceeded(match.view_name)
+        message = '%s ran %d queries, its budget is %d.' % (match.view_name, queries, budget)
+        if getattr(settings, 'PANEL_ENFORCE_QUERY_BUDGETS', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
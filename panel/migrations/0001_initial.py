@@ -0,0 +1,92 @@
+# Generated by Django 4.2 on 2026-10-18 17:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import djmoney.models.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Account',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('balance_currency', djmoney.models.fields.CurrencyField(choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], default='UZS', editable=False, max_length=4)),
+                ('balance', djmoney.models.fields.MoneyField(currency_choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], currency_max_length=4, decimal_places=2, default_currency='UZS', max_digits=1000)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=500)),
+                ('related_to', models.CharField(choices=[('Expense', 'Expense'), ('Income', 'Income')], max_length=7)),
+            ],
+            options={
+                'verbose_name_plural': 'Categories',
+            },
+        ),
+        migrations.CreateModel(
+            name='Subcategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=500)),
+                ('related_to', models.CharField(choices=[('Expense', 'Expense'), ('Income', 'Income')], max_length=7)),
+            ],
+            options={
+                'verbose_name_plural': 'Subcategories',
+            },
+        ),
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount_currency', djmoney.models.fields.CurrencyField(choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], default='UZS', editable=False, max_length=4)),
+                ('amount', djmoney.models.fields.MoneyField(currency_choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], currency_max_length=4, decimal_places=2, default_currency='UZS', max_digits=1000)),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('comment', models.CharField(max_length=1000)),
+                ('account1', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='account1', to='panel.account')),
+                ('account2', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='account2', to='panel.account')),
+                ('maker', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Income',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount_currency', djmoney.models.fields.CurrencyField(choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], default='UZS', editable=False, max_length=4)),
+                ('amount', djmoney.models.fields.MoneyField(currency_choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], currency_max_length=4, decimal_places=2, default_currency='UZS', max_digits=1000)),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('comment', models.CharField(max_length=1000)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='panel.account')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='panel.category')),
+                ('maker', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+                ('subcategory', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='panel.subcategory')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Expense',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount_currency', djmoney.models.fields.CurrencyField(choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], default='UZS', editable=False, max_length=4)),
+                ('amount', djmoney.models.fields.MoneyField(currency_choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], currency_max_length=4, decimal_places=2, default_currency='UZS', max_digits=1000)),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('comment', models.CharField(max_length=1000)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='panel.account')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='panel.category')),
+                ('maker', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+                ('subcategory', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='panel.subcategory')),
+            ],
+        ),
+    ]
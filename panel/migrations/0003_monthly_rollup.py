@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-18 17:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('panel', '0002_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], max_length=4)),
+                ('month', models.DateField()),
+                ('income_amount', models.DecimalField(decimal_places=2, default=0, max_digits=1000)),
+                ('income_count', models.IntegerField(default=0)),
+                ('expense_amount', models.DecimalField(decimal_places=2, default=0, max_digits=1000)),
+                ('expense_count', models.IntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='panel.account')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='panel.category')),
+                ('maker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('subcategory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='panel.subcategory')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='monthlyrollup',
+            index=models.Index(fields=['maker', 'month'], name='monthly_rollup_maker_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyrollup',
+            constraint=models.UniqueConstraint(fields=('maker', 'account', 'category', 'subcategory', 'currency', 'month'), name='monthly_rollup_key'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-18 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0004_ledger_date_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], max_length=4)),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('date', models.DateField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='exchangerate',
+            constraint=models.UniqueConstraint(fields=('currency', 'date'), name='exchange_rate_key'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2 on 2026-10-18 18:05
+
+import logging
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+logger = logging.getLogger('panel.migrations')
+
+
+def set_opening_balances(apps, schema_editor):
+    """
+    Takes the current balances as right: the opening balance is what is left after taking the entries out.
+
+    Nothing recorded the opening balances before, so a balance that had drifted from its entries
+    turns the drift into an opening balance. Every account that gets an opening balance other than
+    zero is logged, to be checked (and corrected in the admin) before reconcile_balances trusts it.
+    """
+
+    Account = apps.get_model('panel', 'Account')
+    totals = {}
+    for model, field, sign in (
+        ('Income', 'account', 1),
+        ('Expense', 'account', -1),
+        ('Transaction', 'account1', -1),
+        ('Transaction', 'account2', 1),
+    ):
+        rows = apps.get_model('panel', model).objects.values(field).annotate(total=Sum('amount')).order_by()
+        for row in rows:
+            totals[row[field]] = totals.get(row[field], Decimal(0)) + sign * row['total']
+    accounts = []
+    for account_id, name, balance in Account.objects.values_list('id', 'name', 'balance').order_by('id'):
+        opening_balance = balance - totals.get(account_id, Decimal(0))
+        if opening_balance:
+            logger.warning(
+                'Account %d (%s) gets an opening balance of %s derived from its balance and entries.', 
+                account_id, name, opening_balance,
+            )
+        accounts.append(Account(id=account_id, opening_balance=opening_balance))
+    Account.objects.bulk_update(accounts, ['opening_balance'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0005_exchange_rate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='opening_balance',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=1000),
+        ),
+        migrations.RunPython(set_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 4.2 on 2026-10-18 18:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import djmoney.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('panel', '0006_account_opening_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('expense', 'expense'), ('income', 'income'), ('transfer_in', 'transfer_in'), ('transfer_out', 'transfer_out')], max_length=12)),
+                ('currency', models.CharField(choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], max_length=4)),
+                ('month', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=1000)),
+                ('count', models.IntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='panel.account')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='panel.category')),
+                ('maker', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+                ('subcategory', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='panel.subcategory')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount_currency', djmoney.models.fields.CurrencyField(choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], default='UZS', editable=False, max_length=4)),
+                ('amount', djmoney.models.fields.MoneyField(currency_choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], currency_max_length=4, decimal_places=2, default_currency='UZS', max_digits=1000)),
+                ('date', models.DateTimeField()),
+                ('comment', models.CharField(max_length=1000)),
+                ('account1', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='panel.account')),
+                ('account2', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='panel.account')),
+                ('maker', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedIncome',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount_currency', djmoney.models.fields.CurrencyField(choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], default='UZS', editable=False, max_length=4)),
+                ('amount', djmoney.models.fields.MoneyField(currency_choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], currency_max_length=4, decimal_places=2, default_currency='UZS', max_digits=1000)),
+                ('date', models.DateTimeField()),
+                ('comment', models.CharField(max_length=1000)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='panel.account')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='panel.category')),
+                ('maker', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('subcategory', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='panel.subcategory')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedExpense',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount_currency', djmoney.models.fields.CurrencyField(choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], default='UZS', editable=False, max_length=4)),
+                ('amount', djmoney.models.fields.MoneyField(currency_choices=[('EURO', 'EURO'), ('RUB', 'RUB'), ('USD', 'USD'), ('UZS', 'UZS')], currency_max_length=4, decimal_places=2, default_currency='UZS', max_digits=1000)),
+                ('date', models.DateTimeField()),
+                ('comment', models.CharField(max_length=1000)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='panel.account')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='panel.category')),
+                ('maker', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('subcategory', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='panel.subcategory')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivesummary',
+            index=models.Index(fields=['account', 'kind'], name='archive_summary_account_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='archivesummary',
+            constraint=models.UniqueConstraint(fields=('maker', 'account', 'category', 'subcategory', 'kind', 'currency', 'month'), name='archive_summary_key'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['maker', 'date', 'id'], name='archived_transaction_maker_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['account1', 'date'], name='archived_transaction_acc1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['account2', 'date'], name='archived_transaction_acc2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedincome',
+            index=models.Index(fields=['maker', 'date', 'id'], name='archived_income_maker_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedincome',
+            index=models.Index(fields=['account', 'date'], name='archived_income_account_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedexpense',
+            index=models.Index(fields=['maker', 'date', 'id'], name='archived_expense_maker_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedexpense',
+            index=models.Index(fields=['account', 'date'], name='archived_expense_account_idx'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+from django.db import migrations
+
+# Every entry is found by a key of its id and its ledger: id * 4 + 1 (income), 2 (expense), 3 (transaction).
+LEDGERS = [('panel_income', 1), ('panel_expense', 2), ('panel_transaction', 3)]
+
+
+def postgresql_sql() -> tuple[list[str], list[str]]:
+    """
+    Full-text (simple configuration) and trigram GIN indexes over the comments of every ledger.
+    """
+
+    forward = ['CREATE EXTENSION IF NOT EXISTS pg_trgm']
+    backward = []
+    for table, code in LEDGERS:
+        forward += [
+            "CREATE INDEX %s_comment_fts ON %s USING gin (to_tsvector('simple', comment))" % (table, table),
+            'CREATE INDEX %s_comment_trgm ON %s USING gin (comment gin_trgm_ops)' % (table, table),
+        ]
+        backward += [
+            'DROP INDEX IF EXISTS %s_comment_fts' % table,
+            'DROP INDEX IF EXISTS %s_comment_trgm' % table,
+        ]
+    return forward, backward
+
+
+def sqlite_sql() -> tuple[list[str], list[str]]:
+    """
+    An FTS5 table of the comments of every ledger, filled from the ledgers and kept in sync by triggers.
+
+    The maker is a column of the table too (as a "m<id>" token), so the search of a user matches
+    only the user's rows; it is given no weight in the ranking.
+    """
+
+    forward = [
+        "CREATE VIRTUAL TABLE panel_comment_search USING fts5(comment, maker, tokenize='unicode61 remove_diacritics 2')",
+    ]
+    backward = []
+    for table, code in LEDGERS:
+        key = 'id * 4 + %d' % code
+        forward += [
+            "INSERT INTO panel_comment_search (rowid, comment, maker) SELECT %s, comment, 'm' || maker_id FROM %s" % (
+                key, table,
+            ),
+            "CREATE TRIGGER %s_search_insert AFTER INSERT ON %s BEGIN "
+            "INSERT INTO panel_comment_search (rowid, comment, maker) VALUES (new.%s, new.comment, 'm' || new.maker_id); "
+            "END" % (table, table, key),
+            "CREATE TRIGGER %s_search_update AFTER UPDATE OF comment, maker_id ON %s BEGIN "
+            "UPDATE panel_comment_search SET comment = new.comment, maker = 'm' || new.maker_id WHERE rowid = old.%s; "
+            "END" % (table, table, key),
+            "CREATE TRIGGER %s_search_delete AFTER DELETE ON %s BEGIN "
+            "DELETE FROM panel_comment_search WHERE rowid = old.%s; "
+            "END" % (table, table, key),
+        ]
+        backward += ['DROP TRIGGER IF EXISTS %s_search_%s' % (table, event) for event in ('insert', 'update', 'delete')]
+    backward.append('DROP TABLE IF EXISTS panel_comment_search')
+    return forward, backward
+
+
+def run(schema_editor, backward: bool) -> None:
+
+    builders = {'postgresql': postgresql_sql, 'sqlite': sqlite_sql}
+    builder = builders.get(schema_editor.connection.vendor)
+    if builder is None:
+        return
+    for sql in builder()[1 if backward else 0]:
+        schema_editor.execute(sql)
+
+
+def create_search(apps, schema_editor):
+
+    run(schema_editor, False)
+
+
+def drop_search(apps, schema_editor):
+
+    run(schema_editor, True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0007_ledger_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 from djmoney.models.fields import MoneyField
 from .relationships import Account, \
     Category, \
@@ -11,6 +12,14 @@ class Expense(models.Model):
     A model for handling expenses.
     """
 
+    class Meta:
+
+        indexes = [
+            models.Index(fields=['maker', 'date', 'id'], name='expense_maker_date_idx'),
+            models.Index(fields=['date'], name='expense_date_idx'),
+            models.Index(fields=['account', 'date'], name='expense_account_date_idx'),
+        ]
+
     currencies = [
         ('EURO', 'EURO'),
         ('RUB', 'RUB'),
@@ -28,7 +37,7 @@ class Expense(models.Model):
         currency_choices=currencies,
         currency_max_length=4
     )
-    date = models.DateTimeField(auto_now_add=True, editable=True)
+    date = models.DateTimeField(default=timezone.now)
     comment = models.CharField(max_length=1000)
     maker = models.ForeignKey(User, on_delete=models.PROTECT)
 
@@ -44,6 +53,14 @@ class Income(models.Model):
     A model for handling incomes.
     """
 
+    class Meta:
+
+        indexes = [
+            models.Index(fields=['maker', 'date', 'id'], name='income_maker_date_idx'),
+            models.Index(fields=['date'], name='income_date_idx'),
+            models.Index(fields=['account', 'date'], name='income_account_date_idx'),
+        ]
+
     currencies = [
         ('EURO', 'EURO'),
         ('RUB', 'RUB'),
@@ -61,7 +78,7 @@ class Income(models.Model):
         currency_choices=currencies,
         currency_max_length=4
     )
-    date = models.DateTimeField(auto_now_add=True, editable=True)
+    date = models.DateTimeField(default=timezone.now)
     comment = models.CharField(max_length=1000)
     maker = models.ForeignKey(User, on_delete=models.PROTECT)
 
@@ -77,6 +94,15 @@ class Transaction(models.Model):
     A model for handling transactions between accounts.
     """
 
+    class Meta:
+
+        indexes = [
+            models.Index(fields=['maker', 'date', 'id'], name='transaction_maker_date_idx'),
+            models.Index(fields=['date'], name='transaction_date_idx'),
+            models.Index(fields=['account1', 'date'], name='transaction_account1_date_idx'),
+            models.Index(fields=['account2', 'date'], name='transaction_account2_date_idx'),
+        ]
+
     currencies = [
         ('EURO', 'EURO'),
         ('RUB', 'RUB'),
@@ -93,7 +119,7 @@ class Transaction(models.Model):
         currency_choices=currencies,
         currency_max_length=4
     )
-    date = models.DateTimeField(auto_now_add=True, editable=True)
+    date = models.DateTimeField(default=timezone.now)
     comment = models.CharField(max_length=1000)
     maker = models.ForeignKey(User, on_delete=models.PROTECT)
 
@@ -101,4 +127,260 @@ class Transaction(models.Model):
 
     def __str__(self) -> str:
         
-        return str(self.from_.name) + ' > ' + str(self.to.name)
+        return '%s > %s' % (self.account1.name, self.account2.name)
+
+
+class MonthlyRollup(models.Model):
+    """
+    A model for handling monthly totals of incomes and expenses.
+
+    Rows are kept up to date by the views that create, edit and delete incomes and expenses, and
+    can be rebuilt from scratch with the rebuild_rollups command.
+    """
+
+    class Meta:
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['maker', 'account', 'category', 'subcategory', 'currency', 'month'],
+                name='monthly_rollup_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['maker', 'month'], name='monthly_rollup_maker_idx'),
+        ]
+
+    currencies = [
+        ('EURO', 'EURO'),
+        ('RUB', 'RUB'),
+        ('USD', 'USD'),
+        ('UZS', 'UZS'),
+    ]
+
+    maker = models.ForeignKey(User, on_delete=models.CASCADE)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    subcategory = models.ForeignKey(Subcategory, on_delete=models.CASCADE)
+    currency = models.CharField(max_length=4, choices=currencies)
+    month = models.DateField()
+    income_amount = models.DecimalField(max_digits=1000, decimal_places=2, default=0)
+    income_count = models.IntegerField(default=0)
+    expense_amount = models.DecimalField(max_digits=1000, decimal_places=2, default=0)
+    expense_count = models.IntegerField(default=0)
+
+    objects = models.Manager()
+
+    def __str__(self) -> str:
+
+        return '%s %s' % (self.account.name, self.month.strftime('%m.%Y'))
+
+
+class ExchangeRate(models.Model):
+    """
+    A model for handling dated exchange rates of currencies to the base currency (PANEL_BASE_CURRENCY).
+
+    The rate is the amount of the base currency one unit of the currency is worth.
+    """
+
+    class Meta:
+
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'date'], name='exchange_rate_key'),
+        ]
+
+    currencies = [
+        ('EURO', 'EURO'),
+        ('RUB', 'RUB'),
+        ('USD', 'USD'),
+        ('UZS', 'UZS'),
+    ]
+
+    currency = models.CharField(max_length=4, choices=currencies)
+    rate = models.DecimalField(max_digits=20, decimal_places=8)
+    date = models.DateField()
+
+    objects = models.Manager()
+
+    def __str__(self) -> str:
+
+        return '%s %s (%s)' % (self.currency, self.rate, self.date.strftime('%d.%m.%Y'))
+
+
+class ArchivedExpense(models.Model):
+    """
+    A model for handling expenses moved out of the expenses table by the archive_ledgers command.
+
+    Archived expenses keep the ids they had, so the ids of expenses stay unique across both tables.
+    """
+
+    class Meta:
+
+        indexes = [
+            models.Index(fields=['maker', 'date', 'id'], name='archived_expense_maker_idx'),
+            models.Index(fields=['account', 'date'], name='archived_expense_account_idx'),
+        ]
+
+    currencies = [
+        ('EURO', 'EURO'),
+        ('RUB', 'RUB'),
+        ('USD', 'USD'),
+        ('UZS', 'UZS'),
+    ]
+
+    id = models.BigIntegerField(primary_key=True)
+    category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='+')
+    subcategory = models.ForeignKey(Subcategory, on_delete=models.PROTECT, related_name='+')
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='+')
+    amount = MoneyField(
+        max_digits=1000, 
+        decimal_places=2, 
+        default_currency='UZS', 
+        currency_choices=currencies,
+        currency_max_length=4
+    )
+    date = models.DateTimeField()
+    comment = models.CharField(max_length=1000)
+    maker = models.ForeignKey(User, on_delete=models.PROTECT, related_name='+')
+
+    objects = models.Manager()
+
+    def __str__(self) -> str:
+        
+        return self.account.name
+
+
+class ArchivedIncome(models.Model):
+    """
+    A model for handling incomes moved out of the incomes table by the archive_ledgers command.
+
+    Archived incomes keep the ids they had, so the ids of incomes stay unique across both tables.
+    """
+
+    class Meta:
+
+        indexes = [
+            models.Index(fields=['maker', 'date', 'id'], name='archived_income_maker_idx'),
+            models.Index(fields=['account', 'date'], name='archived_income_account_idx'),
+        ]
+
+    currencies = [
+        ('EURO', 'EURO'),
+        ('RUB', 'RUB'),
+        ('USD', 'USD'),
+        ('UZS', 'UZS'),
+    ]
+
+    id = models.BigIntegerField(primary_key=True)
+    category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='+')
+    subcategory = models.ForeignKey(Subcategory, on_delete=models.PROTECT, related_name='+')
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='+')
+    amount = MoneyField(
+        max_digits=1000, 
+        decimal_places=2, 
+        default_currency='UZS', 
+        currency_choices=currencies,
+        currency_max_length=4
+    )
+    date = models.DateTimeField()
+    comment = models.CharField(max_length=1000)
+    maker = models.ForeignKey(User, on_delete=models.PROTECT, related_name='+')
+
+    objects = models.Manager()
+
+    def __str__(self) -> str:
+        
+        return self.account.name
+
+
+class ArchivedTransaction(models.Model):
+    """
+    A model for handling transactions moved out of the transactions table by the archive_ledgers command.
+
+    Archived transactions keep the ids they had, so the ids of transactions stay unique across both tables.
+    """
+
+    class Meta:
+
+        indexes = [
+            models.Index(fields=['maker', 'date', 'id'], name='archived_transaction_maker_idx'),
+            models.Index(fields=['account1', 'date'], name='archived_transaction_acc1_idx'),
+            models.Index(fields=['account2', 'date'], name='archived_transaction_acc2_idx'),
+        ]
+
+    currencies = [
+        ('EURO', 'EURO'),
+        ('RUB', 'RUB'),
+        ('USD', 'USD'),
+        ('UZS', 'UZS'),
+    ]
+
+    id = models.BigIntegerField(primary_key=True)
+    account1 = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='+')
+    account2 = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='+')
+    amount = MoneyField(
+        max_digits=1000, 
+        decimal_places=2, 
+        default_currency='UZS', 
+        currency_choices=currencies,
+        currency_max_length=4
+    )
+    date = models.DateTimeField()
+    comment = models.CharField(max_length=1000)
+    maker = models.ForeignKey(User, on_delete=models.PROTECT, related_name='+')
+
+    objects = models.Manager()
+
+    def __str__(self) -> str:
+        
+        return '%s > %s' % (self.account1.name, self.account2.name)
+
+
+class ArchiveSummary(models.Model):
+    """
+    A model for handling the monthly totals of archived entries per account, category and kind.
+
+    Transactions leave two rows, one for the account the money left (transfer_out) and one for the
+    account it went to (transfer_in), without a category. The rows stand in for the archived
+    entries wherever totals are rebuilt from the ledgers (balances, rollups).
+    """
+
+    class Meta:
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['maker', 'account', 'category', 'subcategory', 'kind', 'currency', 'month'],
+                name='archive_summary_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['account', 'kind'], name='archive_summary_account_idx'),
+        ]
+
+    currencies = [
+        ('EURO', 'EURO'),
+        ('RUB', 'RUB'),
+        ('USD', 'USD'),
+        ('UZS', 'UZS'),
+    ]
+    kinds = [
+        ('expense', 'expense'),
+        ('income', 'income'),
+        ('transfer_in', 'transfer_in'),
+        ('transfer_out', 'transfer_out'),
+    ]
+
+    maker = models.ForeignKey(User, on_delete=models.PROTECT)
+    account = models.ForeignKey(Account, on_delete=models.PROTECT)
+    category = models.ForeignKey(Category, on_delete=models.PROTECT, null=True)
+    subcategory = models.ForeignKey(Subcategory, on_delete=models.PROTECT, null=True)
+    kind = models.CharField(max_length=12, choices=kinds)
+    currency = models.CharField(max_length=4, choices=currencies)
+    month = models.DateField()
+    amount = models.DecimalField(max_digits=1000, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    objects = models.Manager()
+
+    def __str__(self) -> str:
+
+        return '%s %s %s' % (self.account.name, self.kind, self.month.strftime('%m.%Y'))
@@ -0,0 +1,203 @@
+import heapq
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_date
+
+
+class KeysetPaginator:
+    """
+    A class for paginating ledger querysets by (date, id) cursors.
+
+    Every page is fetched with a single indexed range query, so the cost of a page does not depend
+    on how many pages come before it.
+    """
+
+    def __init__(self, page_size: int | None = None, max_page_size: int | None = None):
+
+        self.page_size = page_size or getattr(settings, 'PANEL_PAGE_SIZE', 50)
+        self.max_page_size = max_page_size or getattr(settings, 'PANEL_MAX_PAGE_SIZE', 500)
+
+
+    def paginate(self, queryset: QuerySet, params: QueryDict) -> tuple[list, str | None]:
+        """
+        A method for fetching the page of the queryset requested by the parameters.
+
+        Returns the entries of the page and the cursor of the next page (None for the last page).
+        """
+
+        page_size = self.get_page_size(params)
+        entries = list(self.get_queryset(queryset, params))
+        next_cursor = self.encode(entries[page_size - 1]) if len(entries) > page_size else None
+        return entries[:page_size], next_cursor
+
+
+    def paginate_merged(self, querysets: list[QuerySet], params: QueryDict) -> tuple[list, str | None]:
+        """
+        A method for fetching the page of several querysets of entries with unique ids (like a ledger and its archive).
+
+        The page of every queryset is fetched with its own range query and the pages are merged in
+        (date, id) order, so the cursors of the merged pages work the same way.
+        """
+
+        page_size = self.get_page_size(params)
+        pages = [self.get_queryset(queryset, params) for queryset in querysets]
+        entries = list(heapq.merge(*pages, key=self.get_position))[:page_size + 1]
+        next_cursor = self.encode(entries[page_size - 1]) if len(entries) > page_size else None
+        return entries[:page_size], next_cursor
+
+
+    async def apaginate(self, queryset: QuerySet, params: QueryDict) -> tuple[list, str | None]:
+        """
+        A method for fetching the page of the queryset requested by the parameters through the async ORM.
+        """
+
+        page_size = self.get_page_size(params)
+        entries = [entry async for entry in self.get_queryset(queryset, params)]
+        next_cursor = self.encode(entries[page_size - 1]) if len(entries) > page_size else None
+        return entries[:page_size], next_cursor
+
+
+    async def apaginate_merged(self, querysets: list[QuerySet], params: QueryDict) -> tuple[list, str | None]:
+        """
+        A method for fetching the merged page of several querysets through the async ORM.
+        """
+
+        page_size = self.get_page_size(params)
+        pages = [[entry async for entry in self.get_queryset(queryset, params)] for queryset in querysets]
+        entries = list(heapq.merge(*pages, key=self.get_position))[:page_size + 1]
+        next_cursor = self.encode(entries[page_size - 1]) if len(entries) > page_size else None
+        return entries[:page_size], next_cursor
+
+
+    def get_queryset(self, queryset: QuerySet, params: QueryDict) -> QuerySet:
+        """
+        A method for building the query of the page requested by the parameters.
+
+        One extra entry is fetched to find out whether there is a next page.
+        """
+
+        queryset = self.filter_dates(queryset, params).order_by('date', 'id')
+        if params.get('cursor'):
+            date, entry_id = self.decode(params.get('cursor'))
+            queryset = queryset.filter(Q(date__gt=date) | Q(date=date, id__gt=entry_id))
+        return queryset[:self.get_page_size(params) + 1]
+
+
+    def filter_dates(self, queryset: QuerySet, params: QueryDict) -> QuerySet:
+        """
+        A method for limiting the queryset to the 'from'/'to' dates (both inclusive) of the parameters.
+        """
+
+        date_from = self.parse_day(params.get('from'))
+        date_to = self.parse_day(params.get('to'))
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date__lt=date_to + timedelta(days=1))
+        return queryset
+
+
+    def get_page_size(self, params: QueryDict) -> int:
+        """
+        A method for getting the page size requested by the parameters.
+        """
+
+        try:
+            page_size = int(params.get('page_size', self.page_size))
+        except ValueError:
+            raise BadRequest('Invalid page size.')
+        return max(1, min(page_size, self.max_page_size))
+
+
+    def parse_day(self, value: str | None) -> datetime | None:
+        """
+        A method for converting a date string to the aware start of that day.
+        """
+
+        if not value:
+            return None
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise BadRequest('Invalid date.')
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+
+    def get_position(self, entry) -> tuple[datetime, int]:
+        """
+        A method for getting the (date, id) the entry (a model instance or a dict) is ordered by.
+        """
+
+        if isinstance(entry, dict):
+            return entry['date'], entry['id']
+        return entry.date, entry.id
+
+
+    def encode(self, entry) -> str:
+        """
+        A method for building the cursor pointing right after the entry (a model instance or a dict).
+        """
+
+        date, entry_id = self.get_position(entry)
+        value = '%s|%d' % (date.isoformat(), entry_id)
+        return urlsafe_b64encode(value.encode()).decode()
+
+
+    def decode(self, cursor: str) -> tuple[datetime, int]:
+        """
+        A method for reading the date and the id out of the cursor.
+        """
+
+        try:
+            date, entry_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(date), int(entry_id)
+        except ValueError:
+            raise BadRequest('Invalid cursor.')
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator taking the number of rows of unfiltered querysets from the statistics of the database.
+
+    Counting every row of a ledger with millions of entries takes longer than fetching a page of it,
+    so on PostgreSQL an unfiltered queryset is counted from pg_class.reltuples once the estimate is
+    above PANEL_ESTIMATED_COUNT_THRESHOLD. Filtered querysets, small tables and other databases
+    are counted exactly.
+    """
+
+    @cached_property
+    def count(self) -> int:
+
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = self.estimate(self.object_list)
+            if estimate is not None and estimate > getattr(settings, 'PANEL_ESTIMATED_COUNT_THRESHOLD', 100_000):
+                return estimate
+        return super().count
+
+
+    def estimate(self, queryset: QuerySet) -> int | None:
+        """
+        A method for getting the number of rows of the table of the queryset the database estimates.
+        """
+
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', 
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
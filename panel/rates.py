@@ -0,0 +1,146 @@
+from bisect import bisect_right
+from datetime import date
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import QuerySet, Sum
+from django.http import QueryDict
+from django.utils import timezone
+from .balances import BalanceManager
+from .caches import VersionKeeper
+from .models import ArchivedExpense, \
+    ArchivedIncome, \
+    ExchangeRate, \
+    Expense, \
+    Income
+from .paginators import KeysetPaginator
+from .relationships import Account
+
+
+class RateTable:
+    """
+    A class for holding the exchange rates in the memory of the process.
+
+    The table is reloaded from the database only when the version of the rates changes, which
+    happens whenever a rate is saved or deleted. The table is always read from the primary, since
+    rates read from a lagging replica would stay loaded under the new version.
+    """
+
+    version_name = 'panel:rates'
+    versions = VersionKeeper()
+
+    def __init__(self):
+
+        self.version = None
+        self.rates = {}
+
+
+    def get_version(self) -> int:
+        """
+        A method for reloading the table if the rates changed and returning their version.
+        """
+
+        version = self.versions.get(self.version_name)
+        if version != self.version:
+            rates = {}
+            rows = ExchangeRate.objects.using(DEFAULT_DB_ALIAS).order_by('date').values_list('currency', 'date', 'rate')
+            for currency, day, rate in rows:
+                days, values = rates.setdefault(currency, ([], []))
+                days.append(day)
+                values.append(rate)
+            self.rates, self.version = rates, version
+        return self.version
+
+
+    def rate(self, currency: str, day: date | None = None) -> Decimal:
+        """
+        A method for getting the latest rate of the currency on or before the day (today by default).
+        """
+
+        if currency == settings.PANEL_BASE_CURRENCY:
+            return Decimal(1)
+        days, values = self.rates.get(currency, ([], []))
+        index = bisect_right(days, day or timezone.localdate())
+        if not index:
+            raise LookupError('No exchange rate for %s.' % currency)
+        return values[index - 1]
+
+
+    def convert(self, amount: Decimal, currency: str, to: str, day: date | None = None) -> Decimal:
+        """
+        A method for converting the amount from one currency to another.
+        """
+
+        if currency == to:
+            return amount
+        return amount * self.rate(currency, day) / self.rate(to, day)
+
+
+class NetWorthCalculator:
+    """
+    A class for computing a user's net worth and period totals in one currency.
+
+    Amounts are summed per currency by the database, so only one row per currency is converted in
+    memory. Results are cached per user under the versions of the user's balances and of the rates.
+    """
+
+    rate_table = RateTable()
+    versions = VersionKeeper()
+    balance_manager = BalanceManager()
+    paginator = KeysetPaginator()
+    timeout = 60 * 60
+
+    def calculate(self, user: User, currency: str, params: QueryDict) -> dict:
+        """
+        A method for getting the net worth and the income/expense totals of the period in the currency.
+        """
+
+        date_from = self.paginator.parse_day(params.get('from'))
+        date_to = self.paginator.parse_day(params.get('to'))
+        key = 'panel:net-worth:%d:%s:%s:%s:%s:%s' % (
+            user.id,
+            currency,
+            date_from and date_from.date(),
+            date_to and date_to.date(),
+            self.versions.get(self.balance_manager.version_name(user.id)),
+            self.rate_table.get_version(),
+        )
+        result = cache.get(key)
+        if result is None:
+            result = self.build(user, currency, params, date_to.date() if date_to else None)
+            cache.set(key, result, self.timeout)
+        return result
+
+
+    def build(self, user: User, currency: str, params: QueryDict, day: date | None) -> dict:
+        """
+        A method for computing the net worth and the income/expense totals of the period on the day.
+        """
+
+        accounts = Account.objects.filter(owner=user)
+        totals = {}
+        # Archived entries count too, so the totals of a period do not change when it is archived.
+        for name, models in (('incomes', (Income, ArchivedIncome)), ('expenses', (Expense, ArchivedExpense))):
+            querysets = [self.paginator.filter_dates(model.objects.filter(maker=user), params) for model in models]
+            totals[name] = sum((self.total(queryset, 'amount', currency, day) for queryset in querysets), Decimal(0))
+        result = {
+            'currency': currency,
+            'net_worth': self.total(accounts, 'balance', currency, day),
+            **totals,
+        }
+        return result
+
+
+    def total(self, queryset: QuerySet, field: str, currency: str, day: date | None) -> Decimal:
+        """
+        A method for summing the money field of the queryset per currency and converting the sums.
+        """
+
+        sums = queryset.order_by().values_list(field + '_currency').annotate(total=Sum(field))
+        total = sum(
+            (self.rate_table.convert(amount, amount_currency, currency, day) for amount_currency, amount in sums), 
+            Decimal(0)
+        )
+        return total.quantize(Decimal('0.01'))
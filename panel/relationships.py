@@ -1,5 +1,7 @@
+from decimal import Decimal
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import F
 from djmoney.models.fields import MoneyField
 
 
@@ -23,6 +25,8 @@ class Account(models.Model):
         currency_choices=currencies,
         currency_max_length=4
     )
+    # The balance the account was opened with, which the incomes, expenses and transactions add up from.
+    opening_balance = models.DecimalField(max_digits=1000, decimal_places=2, default=Decimal(0))
     owner = models.ForeignKey(User, on_delete=models.PROTECT)
     date_created = models.DateTimeField(auto_now_add=True)
 
@@ -33,22 +37,28 @@ class Account(models.Model):
         return self.name
     
 
-    def decrement(self, amount: int | float):
+    def save(self, *args, **kwargs):
+
+        if self._state.adding and not self.opening_balance and self.balance is not None:
+            self.opening_balance = self.balance.amount
+        super().save(*args, **kwargs)
+
+
+    def decrement(self, amount: int | float | Decimal):
         """
         A method for decrementing the current balance of the account by the amount provided.
         """
 
-        self.balance.amount -= amount
-        self.save()
+        self.increment(-Decimal(str(amount)))
     
 
-    def increment(self, amount: int | float):
+    def increment(self, amount: int | float | Decimal):
         """
         A method for incrementing the current balance of the account by the amount provided.
         """
 
-        self.balance.amount += amount
-        self.save()
+        Account.objects.filter(id=self.id).update(balance=F('balance') + Decimal(str(amount)))
+        self.refresh_from_db(fields=['balance', 'balance_currency'])
 
 
 class Category(models.Model):
@@ -0,0 +1,228 @@
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from hashlib import sha256
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from . import charts
+from .caches import lookup_cache
+from .models import ArchiveSummary, \
+    MonthlyRollup, \
+    Transaction
+from .relationships import Account
+
+
+class ChartQueueFull(Exception):
+    """
+    An exception for charts that can not be rendered now, because too many renders are waiting for the pool.
+    """
+
+
+class ChartTimeout(Exception):
+    """
+    An exception for charts that were not rendered within the timeout of ChartRenderer.
+    """
+
+
+class ChartRenderer:
+    """
+    A class for rendering charts of the ledgers of users as SVG.
+
+    The data of a chart is aggregated by the database (from the monthly rollups and the transfers
+    of the period) and the SVG is cached under the SHA-256 of the data and the options, so the same
+    figures are never rendered twice, whoever asks for them. Renders on a cold cache run in a pool
+    of PANEL_CHART_WORKERS processes shared by the whole process; when PANEL_CHART_QUEUE renders
+    are already waiting for it, ChartQueueFull is raised instead of queueing one more. A render
+    holds its place in the queue until it is done, even after ChartTimeout gave up waiting for it.
+    """
+
+    kinds = {
+        'categories': 'Spending by category',
+        'cash-flow': 'Cash flow',
+        'balance': 'Balance of %s',
+    }
+    pool = None
+    pool_lock = threading.Lock()
+    lookups = {'name': 'category'}
+
+    def __init__(self, workers: int | None = None, queue: int | None = None, timeout: int = 30):
+
+        self.workers = getattr(settings, 'PANEL_CHART_WORKERS', 2) if workers is None else workers
+        self.slots = threading.BoundedSemaphore(queue or getattr(settings, 'PANEL_CHART_QUEUE', 8))
+        self.timeout = timeout
+
+
+    def data(self, kind: str, user: User, params: dict) -> tuple[dict, dict]:
+        """
+        A method for aggregating the data of the chart of the kind and getting its options.
+
+        The parameters are the months to cover, the currency, the account (of balance charts) and the size.
+        """
+
+        months = self.months(min(max(params.get('months') or 12, 1), 60))
+        currency = params.get('currency') or settings.PANEL_BASE_CURRENCY
+        options = {
+            'title': self.kinds[kind],
+            'width': min(max(params.get('width') or 800, 200), 2000),
+            'height': min(max(params.get('height') or 400, 200), 2000),
+        }
+        if kind == 'categories':
+            data = self.build_categories(user, months, currency)
+            options['title'] += ' (%s)' % currency
+        elif kind == 'cash-flow':
+            data = self.build_cash_flow(user, months, currency)
+            options['title'] += ' (%s)' % currency
+        else:
+            data = self.build_balance(user, months, params.get('account'))
+            options['title'] %= data['name']
+        return data, options
+
+
+    def months(self, count: int) -> list[date]:
+        """
+        A method for listing the first days of the last months, the current one included.
+        """
+
+        month = timezone.localdate().replace(day=1)
+        months = [month]
+        for _ in range(count - 1):
+            month = (month - timedelta(days=1)).replace(day=1)
+            months.append(month)
+        return months[::-1]
+
+
+    def build_categories(self, user: User, months: list[date], currency: str) -> dict:
+        """
+        A method for summing the expenses of the months in the currency per category.
+        """
+
+        rows = list(
+            MonthlyRollup.objects.filter(maker=user, currency=currency, month__gte=months[0], expense_count__gt=0)
+            .values('category')
+            .annotate(amount=Sum('expense_amount'))
+            .order_by('-amount', 'category')
+        )
+        return {'values': [[row['name'], float(row['amount'])] for row in lookup_cache.resolve(rows, self.lookups)]}
+
+
+    def build_cash_flow(self, user: User, months: list[date], currency: str) -> dict:
+        """
+        A method for summing the incomes and the expenses in the currency per month.
+        """
+
+        sums = {
+            row['month']: row for row in MonthlyRollup.objects.filter(
+                maker=user, currency=currency, month__gte=months[0]
+            ).values('month').annotate(incomes=Sum('income_amount'), expenses=Sum('expense_amount')).order_by()
+        }
+        empty = {'incomes': 0, 'expenses': 0}
+        return {
+            'months': [month.strftime('%m.%Y') for month in months],
+            'incomes': [float(sums.get(month, empty)['incomes']) for month in months],
+            'expenses': [float(sums.get(month, empty)['expenses']) for month in months],
+        }
+
+
+    def build_balance(self, user: User, months: list[date], account_id: int | None) -> dict:
+        """
+        A method for getting the balance of the account at the end of every month.
+
+        Balances are worked out backwards from the current one, taking away what every month
+        changed: its incomes and expenses from the rollups and its transfers, archived ones included.
+        Raises Account.DoesNotExist for accounts of other users.
+        """
+
+        account = Account.objects.filter(owner=user).values('name', 'balance').get(id=account_id)
+        start = timezone.make_aware(datetime.combine(months[0], time()))
+        changes = {}
+        for month, amount in MonthlyRollup.objects.filter(account=account_id, month__gte=months[0]).values_list(
+            'month'
+        ).annotate(amount=Sum('income_amount') - Sum('expense_amount')).order_by():
+            changes[month] = changes.get(month, Decimal(0)) + amount
+        for field, sign in (('account1', -1), ('account2', 1)):
+            for month, amount in Transaction.objects.filter(**{field: account_id, 'date__gte': start}).annotate(
+                month=TruncMonth('date')
+            ).values_list('month').annotate(amount=Sum('amount')).order_by():
+                month = timezone.localtime(month).date() if isinstance(month, datetime) else month
+                changes[month] = changes.get(month, Decimal(0)) + sign * amount
+        for month, kind, amount in ArchiveSummary.objects.filter(
+            account=account_id, kind__in=['transfer_in', 'transfer_out'], month__gte=months[0]
+        ).values_list('month', 'kind', 'amount'):
+            changes[month] = changes.get(month, Decimal(0)) + (amount if kind == 'transfer_in' else -amount)
+
+        balance = account['balance'] - sum(amount for month, amount in changes.items() if month > months[-1])
+        balances = []
+        for month in reversed(months):
+            balances.append(float(balance))
+            balance -= changes.get(month, Decimal(0))
+        return {
+            'name': account['name'],
+            'months': [month.strftime('%m.%Y') for month in months],
+            'balances': balances[::-1],
+        }
+
+
+    def key(self, kind: str, data: dict, options: dict) -> str:
+        """
+        A method for getting the hash of the chart, the same for the same data and options.
+        """
+
+        content = json.dumps([kind, data, options], sort_keys=True, separators=(',', ':'))
+        return sha256(content.encode()).hexdigest()
+
+
+    def get(self, key: str, kind: str, data: dict, options: dict) -> bytes:
+        """
+        A method for getting the SVG of the chart under the key, rendering and caching it when it is missing.
+        """
+
+        cache_key = 'panel:charts:' + key
+        svg = cache.get(cache_key)
+        if svg is None:
+            svg = self.render(kind, data, options)
+            cache.set(cache_key, svg, getattr(settings, 'PANEL_FRAGMENT_TIMEOUT', 60 * 60 * 24))
+        return svg
+
+
+    def render(self, kind: str, data: dict, options: dict) -> bytes:
+        """
+        A method for rendering the chart in the pool (or in this process, without workers).
+        """
+
+        if not self.workers:
+            return charts.render(kind, data, options)
+        if not self.slots.acquire(blocking=False):
+            raise ChartQueueFull('Too many charts are being rendered.')
+        try:
+            future = self.get_pool().submit(charts.render, kind, data, options)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda future: self.slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # Renders still waiting for a worker are dropped; a running one keeps its place until it ends.
+            future.cancel()
+            raise ChartTimeout('The chart is taking too long to render.')
+
+
+    def get_pool(self) -> ProcessPoolExecutor:
+        """
+        A method for getting the pool of the process, starting it on first use.
+
+        The workers are spawned rather than forked, since forking a threaded server is unsafe, and
+        only import pygal, not Django.
+        """
+
+        with self.pool_lock:
+            if ChartRenderer.pool is None:
+                ChartRenderer.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return ChartRenderer.pool
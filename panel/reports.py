@@ -0,0 +1,461 @@
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections.abc import Iterator
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import BadRequest
+from django.db import connections
+from django.db.models import BigIntegerField, CharField, F, Q, QuerySet, Sum, Value
+from django.http import QueryDict
+from django.utils import timezone
+from .balances import BalanceManager
+from .caches import FragmentCache, \
+    lookup_cache, \
+    VersionKeeper
+from .models import ArchivedExpense, \
+    ArchivedIncome, \
+    ArchivedTransaction, \
+    Expense, \
+    Income, \
+    MonthlyRollup, \
+    Transaction
+from .paginators import KeysetPaginator
+from .relationships import Account
+
+
+class CommentSearch:
+    """
+    A class for searching the comments of a user's incomes, expenses and transactions.
+
+    PostgreSQL matches the comments against a prefix tsquery or by trigram similarity, both
+    answered by GIN indexes; SQLite matches them in the FTS5 table the ledgers keep in sync through
+    triggers (see the comment_search migration). Hits are ranked by relevance (higher scores first)
+    and paginated by (score, key) cursors, where the key is id * 4 + the code of the ledger.
+    """
+
+    ledgers = {1: 'income', 2: 'expense', 3: 'transaction'}
+    paginator = KeysetPaginator()
+
+    def search(self, user: User, text: str, params: QueryDict) -> tuple[list[tuple[str, int, float]], str | None]:
+        """
+        A method for finding the page of the user's entries whose comments match the words of the text.
+
+        Returns the hits (ledger, id, score) and the cursor of the next page (None for the last page).
+        """
+
+        words = re.findall(r'\w+', text.lower())
+        if not words:
+            raise BadRequest('Nothing to search for.')
+        page_size = self.paginator.get_page_size(params)
+        after = self.decode(params.get('cursor')) if params.get('cursor') else None
+        vendor = connections[Income.objects.db].vendor
+        if vendor not in ('postgresql', 'sqlite'):
+            raise BadRequest('Search is not available on %s.' % vendor)
+        sql, sql_params = getattr(self, 'build_' + vendor)(user, words, text)
+        if after is not None:
+            sql += ' WHERE score < %s OR (score = %s AND key > %s)'
+            sql_params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score DESC, key LIMIT %s'
+        with connections[Income.objects.db].cursor() as cursor:
+            cursor.execute(sql, [*sql_params, page_size + 1])
+            rows = cursor.fetchall()
+        next_cursor = self.encode(*rows[page_size - 1]) if len(rows) > page_size else None
+        return [(self.ledgers[key % 4], key // 4, score) for key, score in rows[:page_size]], next_cursor
+
+
+    def build_sqlite(self, user: User, words: list[str], text: str) -> tuple[str, list]:
+        """
+        A method for building the query of the hits in the FTS5 table, every word matched as a prefix.
+        """
+
+        match = 'maker : "m%d" AND comment : (%s)' % (user.id, ' '.join('"%s"*' % word for word in words))
+        return (
+            'SELECT key, score FROM ('
+            'SELECT rowid AS key, -bm25(panel_comment_search, 1.0, 0.0) AS score '
+            'FROM panel_comment_search WHERE panel_comment_search MATCH %s'
+            ') AS hits',
+            [match],
+        )
+
+
+    def build_postgresql(self, user: User, words: list[str], text: str) -> tuple[str, list]:
+        """
+        A method for building the query of the hits in every ledger, matched by the words as prefixes or by similarity.
+        """
+
+        query = ' & '.join('%s:*' % word for word in words)
+        parts, params = [], []
+        for code, ledger in self.ledgers.items():
+            parts.append(
+                "SELECT id * 4 + %d AS key, "
+                "ts_rank(to_tsvector('simple', comment), to_tsquery('simple', %%s)) + similarity(comment, %%s) AS score "
+                "FROM panel_%s "
+                "WHERE maker_id = %%s "
+                "AND (to_tsvector('simple', comment) @@ to_tsquery('simple', %%s) OR comment %%%% %%s)" % (code, ledger)
+            )
+            params += [query, text, user.id, query, text]
+        return 'SELECT key, score FROM (%s) AS hits' % ' UNION ALL '.join(parts), params
+
+
+    def encode(self, key: int, score: float) -> str:
+        """
+        A method for building the cursor pointing right after the hit.
+        """
+
+        return urlsafe_b64encode(('%r|%d' % (score, key)).encode()).decode()
+
+
+    def decode(self, cursor: str) -> tuple[float, int]:
+        """
+        A method for reading the score and the key out of the cursor.
+        """
+
+        try:
+            score, key = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return float(score), int(key)
+        except ValueError:
+            raise BadRequest('Invalid cursor.')
+
+
+class LedgerTimeline:
+    """
+    A class for listing a user's incomes, expenses and transactions as one stream ordered by (date, id).
+
+    The three ledgers are read with one UNION ALL query over values() querysets of the same columns,
+    with the ledger as a discriminator: the account the money left (source), the account it went
+    to (target) and the categories of incomes and expenses. The database merges the ledgers in
+    (date, id, ledger) order and stops at the end of the page, and the page after is found by a
+    (date, id, ledger) cursor, so no ledger is loaded in full.
+    """
+
+    branches = {
+        'expense': (Expense, {
+            'source': F('account'), 
+            'target': Value(None, output_field=BigIntegerField()),
+            'category_ref': F('category'),
+            'subcategory_ref': F('subcategory'),
+        }),
+        'income': (Income, {
+            'source': Value(None, output_field=BigIntegerField()),
+            'target': F('account'),
+            'category_ref': F('category'),
+            'subcategory_ref': F('subcategory'),
+        }),
+        'transaction': (Transaction, {
+            'source': F('account1'),
+            'target': F('account2'),
+            'category_ref': Value(None, output_field=BigIntegerField()),
+            'subcategory_ref': Value(None, output_field=BigIntegerField()),
+        }),
+    }
+    fields = ['id', 'date', 'amount', 'amount_currency', 'comment']
+    paginator = KeysetPaginator()
+
+    def page(self, user: User, params: QueryDict) -> tuple[list[dict], str | None]:
+        """
+        A method for fetching the page of the timeline requested by the parameters.
+
+        The parameters may limit the timeline to ledgers (ledger, repeatable), an account (as the
+        source or the target), a category, a subcategory and 'from'/'to' dates. Returns the rows
+        and the cursor of the next page (None for the last page).
+        """
+
+        page_size = self.paginator.get_page_size(params)
+        after = self.decode(params['cursor']) if params.get('cursor') else None
+        querysets = [
+            self.get_queryset(user, ledger, params, after) 
+            for ledger in self.branches if ledger in (params.getlist('ledger') or self.branches)
+        ]
+        querysets = [queryset for queryset in querysets if queryset is not None]
+        if not querysets:
+            return [], None
+        queryset = querysets[0].union(*querysets[1:], all=True) if len(querysets) > 1 else querysets[0]
+        rows = list(queryset.order_by('date', 'id', 'ledger')[:page_size + 1])
+        next_cursor = self.encode(rows[page_size - 1]) if len(rows) > page_size else None
+        for row in rows:
+            row['category'] = row.pop('category_ref')
+            row['subcategory'] = row.pop('subcategory_ref')
+        return rows[:page_size], next_cursor
+
+
+    def get_queryset(self, user: User, ledger: str, params: QueryDict, after: tuple | None) -> QuerySet | None:
+        """
+        A method for building the values() queryset of the ledger, or None when the filters rule the ledger out.
+        """
+
+        model, columns = self.branches[ledger]
+        queryset = self.paginator.filter_dates(model.objects.filter(maker=user), params)
+        try:
+            account, category, subcategory = (
+                int(params[name]) if params.get(name) else None for name in ('account', 'category', 'subcategory')
+            )
+        except ValueError:
+            raise BadRequest('Invalid filter.')
+        if account is not None:
+            queryset = queryset.filter(Q(account1=account) | Q(account2=account)) if model is Transaction \
+                else queryset.filter(account=account)
+        if category is not None or subcategory is not None:
+            if model is Transaction:
+                return None
+            queryset = queryset.filter(**{
+                name: value for name, value in (('category', category), ('subcategory', subcategory)) 
+                if value is not None
+            })
+        if after is not None:
+            date, entry_id, after_ledger = after
+            # The ledger breaks ties of (date, id), so the entry with the id of the cursor comes after it in later ledgers.
+            lookup = 'id__gte' if ledger > after_ledger else 'id__gt'
+            queryset = queryset.filter(Q(date__gt=date) | Q(date=date, **{lookup: entry_id}))
+        return queryset.order_by().values(
+            *self.fields, 
+            ledger=Value(ledger, output_field=CharField()), 
+            **columns,
+        )
+
+
+    def encode(self, row: dict) -> str:
+        """
+        A method for building the cursor pointing right after the row.
+        """
+
+        value = '%s|%d|%s' % (row['date'].isoformat(), row['id'], row['ledger'])
+        return urlsafe_b64encode(value.encode()).decode()
+
+
+    def decode(self, cursor: str) -> tuple[datetime, int, str]:
+        """
+        A method for reading the date, the id and the ledger out of the cursor.
+        """
+
+        try:
+            date, entry_id, ledger = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(date), int(entry_id), ledger
+        except ValueError:
+            raise BadRequest('Invalid cursor.')
+
+
+class AccountStatement:
+    """
+    A class for building the statement of an account: its entries of a period and the balance after each of them.
+
+    The entries of the account, incomes and expenses and both sides of transactions (archived ones
+    included), are read as one UNION ALL of signed amounts, and the balance after every entry is
+    worked out by the database with SUM() OVER windows in (date, id, ledger) order: the current
+    balance, minus everything from the start of the period on, plus the entries up to the row.
+    So only the entries from the start of the period on are read, and the opening balance is the
+    one the account really had, however the entries before it were archived. Django can not
+    annotate a union, so the windows are written in SQL around it. Rows are fetched in chunks from
+    a server-side cursor, so a statement of any length is streamed in constant memory.
+    """
+
+    branches = [
+        ('expense', Expense, 'account', -1),
+        ('expense', ArchivedExpense, 'account', -1),
+        ('income', Income, 'account', 1),
+        ('income', ArchivedIncome, 'account', 1),
+        ('transaction', Transaction, 'account1', -1),
+        ('transaction', ArchivedTransaction, 'account1', -1),
+        ('transaction', Transaction, 'account2', 1),
+        ('transaction', ArchivedTransaction, 'account2', 1),
+    ]
+    paginator = KeysetPaginator()
+    chunk_size = 2000
+
+    def build(self, user: User, account_id: int, params: QueryDict) -> tuple[dict, Iterator[dict]]:
+        """
+        A method for getting the account and an iterator over the statement of the 'from'/'to' period (both inclusive).
+
+        The iterator yields the opening balance, the rows and the closing balance as dicts with a
+        'kind' of 'opening', 'entry' and 'closing'. Raises Account.DoesNotExist for accounts of other users.
+        The iterator reads the database the account was read from, even when it is only consumed
+        after the view returns, outside the routing of the request.
+        """
+
+        account = Account.objects.filter(owner=user).values('id', 'name', 'balance', 'balance_currency').get(id=account_id)
+        start = self.paginator.parse_day(params.get('from'))
+        end = self.paginator.parse_day(params.get('to'))
+        end = end + timedelta(days=1) if end else None
+        return account, self.rows(connections[Income.objects.db], account, start, end)
+
+
+    def rows(self, connection, account: dict, start: datetime | None, end: datetime | None) -> Iterator[dict]:
+        """
+        A method for reading the statement from the database of the connection, stopping at the end of the period.
+        """
+
+        convert = getattr(connection.ops, 'convert_datetimefield_value', None)
+        entries = self.fetch(connection, *self.get_sql(connection, account['id'], start))
+        opening = closing = None
+        try:
+            for ledger, entry_id, date, comment, change, shift in entries:
+                date = convert(date, None, connection) if convert else date
+                balance = self.to_decimal(account['balance'] + self.to_decimal(shift))
+                if opening is None:
+                    opening = balance - self.to_decimal(change)
+                    yield {'kind': 'opening', 'balance': opening}
+                if end is not None and date >= end:
+                    break
+                closing = balance
+                yield {
+                    'kind': 'entry',
+                    'ledger': ledger,
+                    'id': entry_id,
+                    'date': date,
+                    'comment': comment,
+                    'amount': self.to_decimal(change),
+                    'balance': balance,
+                }
+        finally:
+            entries.close()
+        if opening is None:
+            opening = account['balance']
+            yield {'kind': 'opening', 'balance': opening}
+        yield {'kind': 'closing', 'balance': opening if closing is None else closing}
+
+
+    def fetch(self, connection, sql: str, params: list) -> Iterator[tuple]:
+        """
+        A method for iterating over the rows of the query, fetched in chunks from a server-side cursor.
+        """
+
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(sql, params)
+            while chunk := cursor.fetchmany(self.chunk_size):
+                yield from chunk
+
+
+    def get_sql(self, connection, account_id: int, start: datetime | None) -> tuple[str, list]:
+        """
+        A method for building the query of the signed entries of the account with the shifts of the balance after them.
+
+        The shift after an entry is what the entries up to it add minus what all entries from the
+        start add, so the balance after the entry is the current balance plus its shift.
+        """
+
+        quote = connection.ops.quote_name
+        parts, params = [], []
+        for ledger, model, field, sign in self.branches:
+            part = 'SELECT %%s AS ledger, id, date, comment, amount * %d AS change FROM %s WHERE %s = %%s' % (
+                sign, quote(model._meta.db_table), quote(model._meta.get_field(field).column)
+            )
+            params += [ledger, account_id]
+            if start is not None:
+                part += ' AND date >= %s'
+                params.append(connection.ops.adapt_datetimefield_value(start))
+            parts.append(part)
+        order = 'ORDER BY date, id, ledger'
+        sql = (
+            'SELECT ledger, id, date, comment, change, '
+            'SUM(change) OVER (%s ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) - SUM(change) OVER () AS shift '
+            'FROM (%s) AS entries %s' % (order, ' UNION ALL '.join(parts), order)
+        )
+        return sql, params
+
+
+    def to_decimal(self, value) -> Decimal:
+        """
+        A method for rounding a sum to cents (SQLite sums decimals as floats).
+        """
+
+        return Decimal(value).quantize(Decimal('0.01'))
+
+
+class DashboardSummary:
+    """
+    A class for building the dashboard of a user: balances, month-to-date totals and top spending categories.
+
+    The figures are read from the accounts and from the monthly rollups, which the writes keep up to
+    date, so building them takes three grouped queries however long the ledgers are. Each part is
+    cached per user under the versions it is built from, and a write only rebuilds the parts it
+    made stale: a transfer rebuilds the balances but not the totals of the month.
+    """
+
+    versions = VersionKeeper()
+    balance_manager = BalanceManager()
+    fragment_cache = FragmentCache()
+    top_size = 5
+
+    def summarize(self, user: User) -> dict:
+        """
+        A method for getting the dashboard of the user, building the parts that are not cached.
+        """
+
+        month = timezone.localdate().replace(day=1)
+        lookups = self.versions.get(FragmentCache.lookups_version_name)
+        ledgers = [
+            self.versions.get(self.fragment_cache.version_name(user.id, ledger)) for ledger in ('incomes', 'expenses')
+        ]
+        keys = {
+            'balances': 'panel:dashboard:balances:%d:%d:%d' % (
+                user.id, self.versions.get(self.balance_manager.version_name(user.id)), lookups
+            ),
+            'totals': 'panel:dashboard:totals:%d:%s:%d:%d' % (user.id, month, *ledgers),
+            'top_categories': 'panel:dashboard:categories:%d:%s:%d:%d' % (user.id, month, ledgers[1], lookups),
+        }
+        summary = cache.get_many(keys.values())
+        missing = {}
+        for part, key in keys.items():
+            if key not in summary:
+                missing[key] = getattr(self, 'build_' + part)(user, month)
+        if missing:
+            cache.set_many(missing, self.fragment_cache.timeout)
+        summary.update(missing)
+        return {'month': month, **{part: summary[key] for part, key in keys.items()}}
+
+
+    def build_balances(self, user: User, month: date) -> list[dict]:
+        """
+        A method for listing the accounts of the user with their balances.
+        """
+
+        return [
+            {'id': account_id, 'name': name, 'balance': balance, 'currency': currency}
+            for account_id, name, balance, currency in Account.objects.filter(owner=user).order_by('id').values_list(
+                'id', 'name', 'balance', 'balance_currency'
+            )
+        ]
+
+
+    def build_totals(self, user: User, month: date) -> list[dict]:
+        """
+        A method for summing the incomes and expenses of the user since the start of the month per currency.
+        """
+
+        rows = MonthlyRollup.objects.filter(maker=user, month=month).values('currency').annotate(
+            incomes=Sum('income_amount'),
+            expenses=Sum('expense_amount'),
+        ).order_by('currency')
+        return [
+            {
+                'currency': row['currency'],
+                'incomes': row['incomes'].quantize(Decimal('0.01')),
+                'expenses': row['expenses'].quantize(Decimal('0.01')),
+            }
+            for row in rows
+        ]
+
+
+    def build_top_categories(self, user: User, month: date) -> list[dict]:
+        """
+        A method for listing the categories the user spent the most on since the start of the month.
+
+        Amounts in different currencies are not added up, so a category may appear once per currency.
+        """
+
+        rows = list(
+            MonthlyRollup.objects.filter(maker=user, month=month, expense_count__gt=0)
+            .values('category', 'currency')
+            .annotate(amount=Sum('expense_amount'))
+            .order_by('-amount', 'category')[:self.top_size]
+        )
+        return [
+            {
+                'id': row['category'], 
+                'name': row['name'], 
+                'currency': row['currency'], 
+                'amount': row['amount'].quantize(Decimal('0.01')),
+            }
+            for row in lookup_cache.resolve(rows, {'name': 'category'})
+        ]
@@ -0,0 +1,185 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest, HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+
+
+class ReplicaRouter:
+    """
+    A database router for sending the reads of read-only requests to a replica.
+
+    Only the models of the panel app are read from the replica; sessions, users and the rest stay
+    on the primary, so logging in never depends on the replica catching up. Reads go to the replica
+    only inside a use_replica() block, which ReplicaMiddleware opens for the read-only views. The
+    alias of the replica is the PANEL_REPLICA_DATABASE setting; without it everything uses default.
+    """
+
+    apps = {'panel'}
+    state = ContextVar('panel_replica_state', default=None)
+
+    def db_for_read(self, model, **hints):
+
+        state = self.state.get()
+        replica = getattr(settings, 'PANEL_REPLICA_DATABASE', None)
+        if replica and state is not None and state['replica'] and model._meta.app_label in self.apps:
+            return replica
+        return None
+
+
+    def db_for_write(self, model, **hints):
+
+        state = self.state.get()
+        if state is not None:
+            state['wrote'] = True
+        return 'default'
+
+
+    def allow_relation(self, obj1, obj2, **hints):
+
+        databases = {'default', getattr(settings, 'PANEL_REPLICA_DATABASE', None) or 'default'}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+    @classmethod
+    @contextmanager
+    def use_replica(cls, replica: bool = True):
+        """
+        A method for routing the reads of the block to the replica (or, with replica=False, to the primary).
+
+        The returned state records whether anything was written in the block.
+        """
+
+        state = {'replica': replica, 'wrote': False}
+        token = cls.state.set(state)
+        try:
+            yield state
+        finally:
+            cls.state.reset(token)
+
+
+    @classmethod
+    def pin(cls, user_id: int) -> None:
+        """
+        A method for keeping the reads of the user on the primary for PANEL_REPLICA_PIN_SECONDS.
+
+        Called whenever the user's data changes, whoever changed it, so what is cached under the
+        new versions of the data is never read from a replica that has not caught up yet.
+        """
+
+        if getattr(settings, 'PANEL_REPLICA_DATABASE', None):
+            cache.set(cls.pin_key(user_id), True, getattr(settings, 'PANEL_REPLICA_PIN_SECONDS', 10))
+
+
+    @classmethod
+    def is_pinned(cls, user_id: int) -> bool:
+        """
+        A method for telling whether the reads of the user are pinned to the primary.
+        """
+
+        return bool(cache.get(cls.pin_key(user_id)))
+
+
+    @classmethod
+    def pin_key(cls, user_id: int) -> str:
+        """
+        A method for getting the key of the cache telling that the user's reads are pinned to the primary.
+        """
+
+        return 'panel:primary:%d' % user_id
+
+
+@sync_and_async_middleware
+class ReplicaMiddleware:
+    """
+    A middleware for serving the GET requests of read-only views from the replica.
+
+    Views opt in with read_only = True. After a request of a user writes anything, or anything
+    bumps the versions of the user's cached data, the user's reads stay on the primary for
+    PANEL_REPLICA_PIN_SECONDS, which should cover the lag of the replica.
+    The pin is kept in the cache per user, not per session, so pages rendered from the replica and
+    cached by another session of the user never predate the user's last write.
+    Under ASGI it runs as async middleware and only leaves the event loop for the user and the pin.
+    """
+
+    def __init__(self, get_response):
+
+        if not getattr(settings, 'PANEL_REPLICA_DATABASE', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view
+
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+
+        if self.is_async:
+            return self.__acall__(request)
+        with ReplicaRouter.use_replica(False) as state:
+            response = self.get_response(request)
+        if state['wrote']:
+            self.pin(request)
+        return response
+
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+
+        with ReplicaRouter.use_replica(False) as state:
+            response = await self.get_response(request)
+        if state['wrote']:
+            await sync_to_async(self.pin)(request)
+        return response
+
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs):
+        """
+        A method for switching the reads of the request to the replica when the view allows it.
+        """
+
+        if self.reads_replica(request, view_func) and not self.is_pinned(request):
+            ReplicaRouter.state.get()['replica'] = True
+        return None
+
+
+    async def aprocess_view(self, request: HttpRequest, view_func, view_args, view_kwargs):
+        """
+        A method for switching the reads of the request to the replica when the view allows it, under ASGI.
+        """
+
+        if self.reads_replica(request, view_func) and not await sync_to_async(self.is_pinned)(request):
+            ReplicaRouter.state.get()['replica'] = True
+        return None
+
+
+    def reads_replica(self, request: HttpRequest, view_func) -> bool:
+        """
+        A method for telling whether the view serves the request from the replica, unless the user is pinned.
+        """
+
+        view_class = getattr(view_func, 'view_class', None)
+        return request.method in ('GET', 'HEAD') and getattr(view_class, 'read_only', False)
+
+
+    def is_pinned(self, request: HttpRequest) -> bool:
+        """
+        A method for telling whether the reads of the user of the request are pinned to the primary.
+        """
+
+        return request.user.is_authenticated and ReplicaRouter.is_pinned(request.user.id)
+
+
+    def pin(self, request: HttpRequest) -> None:
+        """
+        A method for pinning the reads of the user of the request to the primary after the request wrote.
+        """
+
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            ReplicaRouter.pin(user.id)
@@ -1,4 +1,7 @@
+from django.db.models import QuerySet
+from django.utils import timezone
 from rest_framework import serializers
+from .caches import lookup_cache
 from .models import *
 
 
@@ -33,3 +36,116 @@ class TransactionSerializer(serializers.ModelSerializer):
 
         model = Transaction
         fields = '__all__'
+
+
+class ValuesSerializer:
+    """
+    A serializer for reading entries straight from the database into JSON-ready dicts.
+
+    Only the listed columns are fetched, with one values() query, so no model instances or
+    serializer fields are built. The names of the related objects come from the lookup cache
+    instead of joins. The output has the fields of the model serializer of the same entries, plus
+    the related names.
+    """
+
+    fields = []
+    related_names = {}
+    decimal_fields = ['amount']
+    datetime_fields = ['date']
+
+    def values(self, queryset: QuerySet) -> QuerySet:
+        """
+        A method for limiting the queryset to the columns of the output.
+        """
+
+        return queryset.values(*self.fields)
+
+
+    def to_representation(self, row: dict) -> dict:
+        """
+        A method for converting the values of the row to the types JSON has.
+        """
+
+        return self.many([row])[0]
+
+
+    def many(self, rows: list[dict]) -> list[dict]:
+        """
+        A method for converting the values of the rows, resolving the related names of all of them at once.
+        """
+
+        lookup_cache.resolve(rows, self.related_names)
+        for row in rows:
+            for name in self.decimal_fields:
+                row[name] = str(row[name])
+            for name in self.datetime_fields:
+                value = timezone.localtime(row[name]).isoformat()
+                row[name] = value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return rows
+
+
+    def list(self, queryset: QuerySet) -> list[dict]:
+        """
+        A method for serializing all entries of the queryset.
+        """
+
+        return self.many(list(self.values(queryset)))
+
+
+class ExpenseValuesSerializer(ValuesSerializer):
+    """
+    A serializer for reading expenses with the names of their account and categories.
+    """
+
+    fields = ['id', 'category', 'subcategory', 'account', 'amount', 'amount_currency', 'date', 'comment', 'maker']
+    related_names = {
+        'category_name': 'category', 
+        'subcategory_name': 'subcategory', 
+        'account_name': 'account',
+    }
+
+
+class IncomeValuesSerializer(ValuesSerializer):
+    """
+    A serializer for reading incomes with the names of their account and categories.
+    """
+
+    fields = ['id', 'category', 'subcategory', 'account', 'amount', 'amount_currency', 'date', 'comment', 'maker']
+    related_names = {
+        'category_name': 'category', 
+        'subcategory_name': 'subcategory', 
+        'account_name': 'account',
+    }
+
+
+class TransactionValuesSerializer(ValuesSerializer):
+    """
+    A serializer for reading transactions with the names of their accounts.
+    """
+
+    fields = ['id', 'account1', 'account2', 'amount', 'amount_currency', 'date', 'comment', 'maker']
+    related_names = {
+        'account1_name': 'account1', 
+        'account2_name': 'account2',
+    }
+
+
+class TimelineSerializer(ValuesSerializer):
+    """
+    A serializer for the rows of the timeline with the names of their accounts and categories.
+    """
+
+    related_names = {
+        'source_name': 'source',
+        'target_name': 'target',
+        'category_name': 'category',
+        'subcategory_name': 'subcategory',
+    }
+
+
+class StatementSerializer(ValuesSerializer):
+    """
+    A serializer for the entries of account statements.
+    """
+
+    decimal_fields = ['amount', 'balance']
@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .balances import BalanceManager
+from .caches import FragmentCache, \
+    VersionKeeper
+from .metrics import record_query
+from .models import ExchangeRate, \
+    Expense, \
+    Income, \
+    Transaction
+from .rates import RateTable
+from .relationships import Account, \
+    Category, \
+    Subcategory
+
+balance_manager = BalanceManager()
+fragment_cache = FragmentCache()
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    A function for counting the queries of a new database connection into the metrics of the request being served.
+
+    Connections are opened per thread, so one installed by the middleware would miss the queries
+    async views run through sync_to_async.
+    """
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver([post_save, post_delete], sender=ExchangeRate)
+def bump_rates_version(sender, **kwargs):
+    """
+    A function for making every process reload its exchange rates after a rate is saved or deleted.
+    """
+
+    VersionKeeper().bump(RateTable.version_name)
+
+
+@receiver([post_save, post_delete], sender=Income)
+@receiver([post_save, post_delete], sender=Expense)
+@receiver([post_save, post_delete], sender=Transaction)
+def bump_ledger_version(sender, instance, **kwargs):
+    """
+    A function for invalidating the cached pages of the ledger of the maker after an entry is written.
+
+    The version is bumped once the transaction commits, so a page rendered from the old data in the
+    meantime is cached under the old version.
+    """
+
+    ledger = sender._meta.model_name + 's'
+    transaction.on_commit(lambda: fragment_cache.bump(instance.maker_id, ledger))
+
+
+@receiver([post_save, post_delete], sender=Account)
+def bump_balances_version(sender, instance, **kwargs):
+    """
+    A function for invalidating what is cached from the balances of the owner after an account is written.
+
+    Accounts are created, deleted and edited (in the admin) without going through BalanceManager.
+    """
+
+    transaction.on_commit(lambda: balance_manager.bump_versions({instance.owner_id}))
+
+
+@receiver([post_save, post_delete], sender=Account)
+def bump_accounts_version(sender, instance, **kwargs):
+    """
+    A function for invalidating the cached pages of the owner after an account is written.
+
+    Accounts belong to one user, so the pages of the other users stay cached.
+    """
+
+    transaction.on_commit(lambda: fragment_cache.bump_accounts(instance.owner_id))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Subcategory)
+def bump_lookups_version(sender, **kwargs):
+    """
+    A function for invalidating the cached pages of all users after a category or subcategory changes.
+    """
+
+    transaction.on_commit(fragment_cache.bump_lookups)
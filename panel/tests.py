@@ -1,3 +1,2113 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from zipfile import ZipFile
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import BadRequest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse, QueryDict
+from django.template import engines
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from . import charts, metrics
+from .assistants import Field, \
+    Schema
+from .balances import BalanceManager
+from .caches import FragmentCache, \
+    LookupCache
+from .files import LedgerExporter
+from .ledgers import RollupManager
+from .metrics import QueryBudgetExceeded, \
+    registry
+from .models import ArchivedExpense, \
+    ArchivedTransaction, \
+    ArchiveSummary, \
+    ExchangeRate, \
+    Expense, \
+    Income, \
+    MonthlyRollup, \
+    Transaction
+from .paginators import KeysetPaginator
+from .rates import NetWorthCalculator
+from .relationships import Account, \
+    Category, \
+    Subcategory
+from .rendering import ChartQueueFull, \
+    ChartRenderer
+from .reports import DashboardSummary, \
+    LedgerTimeline
+from .routers import ReplicaMiddleware, \
+    ReplicaRouter
+from .serializers import IncomeSerializer, \
+    IncomeValuesSerializer, \
+    TransactionSerializer, \
+    TransactionValuesSerializer
+from .views import ChartView, \
+    IncomeView
 
-# Create your tests here.
+
+class BalanceManagerTests(TestCase):
+    """
+    Tests for applying balance changes to accounts.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        self.account = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.other = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+
+    def test_collect_merges_changes_per_account(self):
+
+        deltas = BalanceManager().collect(
+            (self.account.id, Decimal('10.50')),
+            (self.other.id, Decimal('-3')),
+            (self.account.id, Decimal('-0.50')),
+        )
+        self.assertEqual(deltas, {self.account.id: Decimal('10.00'), self.other.id: Decimal('-3')})
+
+    def test_apply_updates_balances_in_the_database(self):
+
+        BalanceManager().apply({self.account.id: Decimal('-25.25'), self.other.id: Decimal('25.25')})
+        self.account.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.account.balance.amount, Decimal('74.75'))
+        self.assertEqual(self.other.balance.amount, Decimal('25.25'))
+
+    def test_increment_and_decrement_do_not_save_stale_values(self):
+
+        stale = Account.objects.get(id=self.account.id)
+        self.account.increment(Decimal('5'))
+        stale.decrement(Decimal('2'))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance.amount, Decimal('103.00'))
+        self.assertEqual(stale.balance.amount, Decimal('103.00'))
+
+
+class BalanceConcurrencyTests(TransactionTestCase):
+    """
+    Tests for applying balance changes to one account from parallel writers.
+    """
+
+    writers = 8
+    changes_per_writer = 25
+
+    def test_parallel_writers_do_not_lose_updates(self):
+
+        user = User.objects.create_user('owner')
+        account = Account.objects.create(name='Cash', balance=Decimal('0.00'), owner=user)
+        manager = BalanceManager()
+        errors = []
+        barrier = threading.Barrier(self.writers)
+
+        def write():
+            try:
+                barrier.wait()
+                for _ in range(self.changes_per_writer):
+                    manager.apply({account.id: Decimal('1.25')})
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write) for _ in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        account.refresh_from_db()
+        expected = Decimal('1.25') * self.writers * self.changes_per_writer
+        self.assertEqual(account.balance.amount, expected)
+
+
+class RowResponseTests(TestCase):
+    """
+    Tests for responding to list changes with only the changed row.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        self.account = Account.objects.create(name='Cash', balance=Decimal('0.00'), owner=self.user)
+        self.category = Category.objects.create(name='Salary', related_to='Income')
+        self.subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        self.incomes = [
+            Income.objects.create(
+                category=self.category,
+                subcategory=self.subcategory,
+                account=self.account,
+                amount=Decimal(amount),
+                comment='Payment',
+                maker=self.user,
+            )
+            for amount in ('10', '20', '30')
+        ]
+        self.request = RequestFactory().post('/incomes/')
+        self.request.user = self.user
+
+    def test_row_response_renders_only_the_changed_row(self):
+
+        response = IncomeView().respond(self.request, {}, 'replace', self.incomes[1].id, self.incomes[1])
+        data = json.loads(response.content)
+        self.assertEqual(data['action'], 'replace')
+        self.assertEqual(data['id'], self.incomes[1].id)
+        self.assertEqual(data['html'].count('<tr'), 1)
+        self.assertIn('id="income-%d"' % self.incomes[1].id, data['html'])
+
+    def test_remove_response_has_no_html(self):
+
+        response = IncomeView().respond(self.request, {}, 'remove', 5)
+        self.assertEqual(json.loads(response.content), {'status': 200, 'action': 'remove', 'id': 5, 'html': ''})
+
+    def test_full_flag_renders_the_whole_list(self):
+
+        response = IncomeView().respond(self.request, {'full': ''}, 'insert', self.incomes[0].id, self.incomes[0])
+        data = json.loads(response.content)
+        self.assertNotIn('action', data)
+        self.assertEqual(data['html'].count('<tr'), 3)
+
+
+class KeysetPaginatorTests(TestCase):
+    """
+    Tests for paginating ledgers by (date, id) cursors.
+    """
+
+    def setUp(self):
+
+        user = User.objects.create_user('owner')
+        account = Account.objects.create(name='Cash', balance=Decimal('0.00'), owner=user)
+        category = Category.objects.create(name='Salary', related_to='Income')
+        subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        start = timezone.make_aware(datetime(2023, 1, 1, 12))
+        # Pairs of entries share a date, so the id has to break the ties.
+        self.dates = [start + timedelta(days=day // 2) for day in range(7)]
+        self.ids = []
+        for date in self.dates:
+            income = Income.objects.create(
+                category=category,
+                subcategory=subcategory,
+                account=account,
+                amount=Decimal('1'),
+                comment='Payment',
+                maker=user,
+            )
+            Income.objects.filter(id=income.id).update(date=date)
+            self.ids.append(income.id)
+        self.queryset = Income.objects.filter(maker=user)
+
+    def test_walks_all_pages_in_order(self):
+
+        paginator = KeysetPaginator(page_size=3)
+        ids, cursor, pages = [], None, 0
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            with self.assertNumQueries(1):
+                entries, cursor = paginator.paginate(self.queryset, params)
+            ids.extend(entry.id for entry in entries)
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(ids, self.ids)
+        self.assertEqual(pages, 3)
+
+    def test_page_size_comes_from_the_parameters_and_is_capped(self):
+
+        paginator = KeysetPaginator(page_size=3, max_page_size=5)
+        entries, cursor = paginator.paginate(self.queryset, {'page_size': '2'})
+        self.assertEqual(len(entries), 2)
+        entries, cursor = paginator.paginate(self.queryset, {'page_size': '100'})
+        self.assertEqual(len(entries), 5)
+
+    def test_filters_by_inclusive_date_range(self):
+
+        entries, cursor = KeysetPaginator().paginate(self.queryset, {'from': '2023-01-02', 'to': '2023-01-03'})
+        self.assertEqual([entry.id for entry in entries], self.ids[2:6])
+        self.assertIsNone(cursor)
+
+    def test_page_of_incomes_and_expenses_pages_every_ledger_on_its_own(self):
+
+        cache.clear()
+        self.client.force_login(User.objects.get(username='owner'))
+        url = reverse('panel:incomes-expenses')
+        response = self.client.get(url, {'incomes_page_size': 3, 'expenses_page_size': 1})
+        self.assertContains(response, 'id="income-', count=3)
+        cursor = response.context['incomes_next']
+        response = self.client.get(url, {'incomes_cursor': cursor, 'incomes_page_size': 3})
+        self.assertContains(response, 'id="income-', count=3)
+        self.assertContains(response, 'id="income-%d"' % self.ids[3])
+        response = self.client.get(url, {'expenses_cursor': cursor, 'expenses_page_size': 1})
+        self.assertContains(response, 'id="income-', count=7)
+
+    def test_rejects_invalid_parameters(self):
+
+        paginator = KeysetPaginator()
+        for params in ({'cursor': 'garbage'}, {'from': '2023-13-01'}, {'page_size': 'ten'}):
+            with self.assertRaises(BadRequest):
+                paginator.paginate(self.queryset, params)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Tests for the query plans of the main ledger queries.
+
+    The plans must be served by the ledger indexes: no sequential scans of the ledger tables and
+    no sorts on a seeded dataset.
+    """
+
+    users = 10
+    entries_per_user = 200
+
+    @classmethod
+    def setUpTestData(cls):
+
+        category = Category.objects.create(name='Salary', related_to='Income')
+        subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        start = timezone.make_aware(datetime(2020, 1, 1))
+        for number in range(cls.users):
+            user = User.objects.create_user('user%d' % number)
+            account1 = Account.objects.create(name='Cash%d' % number, balance=Decimal('0'), owner=user)
+            account2 = Account.objects.create(name='Card%d' % number, balance=Decimal('0'), owner=user)
+            common = {'amount': Decimal('1'), 'comment': 'Seed', 'maker': user}
+            entries = {'account': account1, 'category': category, 'subcategory': subcategory, **common}
+            for model, fields in ((Income, entries), (Expense, entries), (Transaction, {
+                'account1': account1,
+                'account2': account2,
+                **common,
+            })):
+                created = model.objects.bulk_create(model(**fields) for _ in range(cls.entries_per_user))
+                for index, entry in enumerate(created):
+                    entry.date = start + timedelta(hours=index * 7)
+                model.objects.bulk_update(created, ['date'])
+        cls.user = user
+        cls.account1 = account1
+        cls.account2 = account2
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertIndexedPlan(self, queryset):
+
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            node = line.strip().lstrip('->|-` ').strip()
+            if connection.vendor == 'postgresql':
+                bad = node.startswith(('Seq Scan on panel_', 'Sort'))
+            else:
+                bad = node.startswith('SCAN panel_') or 'TEMP B-TREE' in node
+            self.assertFalse(bad, 'Query is not served by an index:\n%s\n%s' % (queryset.query, plan))
+
+    def test_list_pages_use_the_maker_indexes(self):
+
+        paginator = KeysetPaginator()
+        first, cursor = paginator.paginate(Income.objects.filter(maker=self.user), {})
+        for params in ({}, {'cursor': cursor}, {'from': '2020-02-01', 'to': '2020-03-01'}):
+            for model in (Income, Expense, Transaction):
+                self.assertIndexedPlan(paginator.get_queryset(model.objects.filter(maker=self.user), params))
+
+    def test_account_statements_use_the_account_indexes(self):
+
+        since = timezone.make_aware(datetime(2020, 2, 1))
+        for queryset in (
+            Income.objects.filter(account=self.account1, date__gte=since).order_by('date'),
+            Expense.objects.filter(account=self.account1, date__gte=since).order_by('date'),
+            Transaction.objects.filter(account1=self.account1, date__gte=since).order_by('date'),
+            Transaction.objects.filter(account2=self.account2, date__gte=since).order_by('date'),
+        ):
+            self.assertIndexedPlan(queryset)
+
+
+class RollupManagerTests(TestCase):
+    """
+    Tests for keeping the monthly rollups up to date.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        self.account = Account.objects.create(name='Cash', balance=Decimal('0.00'), owner=self.user)
+        self.salary = Category.objects.create(name='Salary', related_to='Income')
+        self.food = Category.objects.create(name='Food', related_to='Expense')
+        self.subcategory = Subcategory.objects.create(name='Other', related_to='Income')
+        self.manager = RollupManager()
+
+    def create(self, model, category, amount):
+
+        entry = model.objects.create(
+            category=category,
+            subcategory=self.subcategory,
+            account=self.account,
+            amount=Decimal(amount),
+            comment='Entry',
+            maker=self.user,
+        )
+        self.manager.apply(self.manager.change(entry, 1))
+        return entry
+
+    def snapshot(self):
+
+        return sorted(MonthlyRollup.objects.exclude(income_count=0, expense_count=0).values_list(
+            'category', 'currency', 'month', 'income_amount', 'income_count', 'expense_amount', 'expense_count'
+        ))
+
+    def test_created_entries_are_summed_per_month(self):
+
+        self.create(Income, self.salary, '100')
+        self.create(Income, self.salary, '50.50')
+        self.create(Expense, self.food, '20')
+        rollups = {rollup.category_id: rollup for rollup in MonthlyRollup.objects.all()}
+        self.assertEqual(rollups[self.salary.id].income_amount, Decimal('150.50'))
+        self.assertEqual(rollups[self.salary.id].income_count, 2)
+        self.assertEqual(rollups[self.food.id].expense_amount, Decimal('20'))
+        self.assertEqual(rollups[self.food.id].month, timezone.localdate().replace(day=1))
+
+    def test_edits_and_deletes_match_a_rebuild(self):
+
+        income = self.create(Income, self.salary, '100')
+        expense = self.create(Expense, self.food, '30')
+        self.create(Expense, self.food, '5')
+
+        removed = self.manager.change(income, -1)
+        income.category = self.food
+        income.amount.amount = Decimal('70')
+        income.save()
+        self.manager.apply(removed, self.manager.change(income, 1))
+
+        self.manager.apply(self.manager.change(expense, -1))
+        expense.delete()
+
+        incremental = self.snapshot()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(incremental, self.snapshot())
+        self.assertEqual(incremental, [(
+            self.food.id, 'UZS', timezone.localdate().replace(day=1), Decimal('70'), 1, Decimal('5'), 1
+        )])
+
+
+class ExportViewTests(TestCase):
+    """
+    Tests for exporting ledgers.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('0.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        category = Category.objects.create(name='Food', related_to='Expense')
+        subcategory = Subcategory.objects.create(name='Lunch', related_to='Expense')
+        for account, amount in ((self.cash, '12.50'), (self.card, '7'), (self.cash, '3')):
+            Expense.objects.create(
+                category=category,
+                subcategory=subcategory,
+                account=account,
+                amount=Decimal(amount),
+                comment='Lunch, office',
+                maker=self.user,
+            )
+        Transaction.objects.create(
+            account1=self.cash, 
+            account2=self.card, 
+            amount=Decimal('5'), 
+            comment='Top up', 
+            maker=self.user
+        )
+        self.client.force_login(self.user)
+
+    def test_csv_export_streams_the_filtered_rows(self):
+
+        response = self.client.get(
+            reverse('panel:expenses-export'), 
+            {'format': 'csv', 'account_id': self.cash.id}
+        )
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Date,Account,Category,Subcategory,Amount,Currency,Comment')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith(',Cash,Food,Lunch,12.50,UZS,"Lunch, office"'))
+
+    def test_xlsx_export_writes_a_worksheet(self):
+
+        response = self.client.get(reverse('panel:transactions-export'), {'account_id': self.card.id})
+        self.assertTrue(response.streaming)
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        rows = list(workbook['transactions'].values)
+        self.assertEqual(rows[0], ('Date', 'From', 'To', 'Amount', 'Currency', 'Comment'))
+        self.assertEqual(rows[1][1:], ('Cash', 'Card', 5, 'UZS', 'Top up'))
+
+    def test_date_filters_apply_to_the_export(self):
+
+        response = self.client.get(reverse('panel:expenses-export'), {'format': 'csv', 'to': '2000-01-01'})
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 1)
+
+
+class ImportViewTests(TestCase):
+    """
+    Tests for importing bank statements.
+    """
+
+    header = 'Date,Account,Category,Subcategory,Amount,Currency,Comment\n'
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        self.food = Category.objects.create(name='Food', related_to='Expense')
+        Subcategory.objects.create(name='Lunch', related_to='Expense')
+        self.client.force_login(self.user)
+
+    def upload(self, name, content, **data):
+
+        return self.client.post(
+            reverse('panel:expenses-import'), 
+            {'file': SimpleUploadedFile(name, content), **data}
+        )
+
+    def test_imports_rows_and_adjusts_balances_once(self):
+
+        rows = ''.join('2023-03-%02d 10:00,cash,Food,Lunch,"1,50",UZS,Lunch\n' % day for day in range(1, 21))
+        rows += '2023-04-01,Card,food,lunch,10,UZS,Dinner\n'
+        response = self.upload('statement.csv', (self.header + rows).encode())
+        self.assertEqual(response.json()['imported'], 21)
+        self.cash.refresh_from_db()
+        self.card.refresh_from_db()
+        self.assertEqual(self.cash.balance.amount, Decimal('70.00'))
+        self.assertEqual(self.card.balance.amount, Decimal('-10.00'))
+        dates = Expense.objects.filter(account=self.cash).values_list('date', flat=True)
+        self.assertEqual({timezone.localtime(date).month for date in dates}, {3})
+        rollups = MonthlyRollup.objects.filter(category=self.food).order_by('month')
+        self.assertEqual([(rollup.expense_amount, rollup.expense_count) for rollup in rollups], [
+            (Decimal('30.00'), 20), 
+            (Decimal('10.00'), 1),
+        ])
+
+    def test_invalid_rows_are_reported_and_nothing_is_saved(self):
+
+        rows = '2023-03-01,Cash,Food,Lunch,5,UZS,Ok\n' \
+            'yesterday,Wallet,Food,Lunch,-5,GBP,Bad\n'
+        response = self.upload('statement.csv', (self.header + rows).encode())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'row': 3, 'errors': [
+            'Unknown account "Wallet".', 
+            'Invalid date.', 
+            'Invalid amount.', 
+            'Unknown currency "GBP".',
+        ]}])
+        self.assertFalse(Expense.objects.exists())
+        self.cash.refresh_from_db()
+        self.assertEqual(self.cash.balance.amount, Decimal('100.00'))
+
+    def test_corrupt_workbooks_are_reported(self):
+
+        archive = BytesIO()
+        with ZipFile(archive, 'w') as file:
+            file.writestr('readme.txt', 'Not a workbook')
+        for content in (b'Not a zip file', archive.getvalue()):
+            response = self.upload('statement.xlsx', content)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['errors'], [
+                {'row': None, 'errors': ['The file is not a valid XLSX workbook.']},
+            ])
+
+    def test_files_that_are_not_utf8_are_reported_and_nothing_is_saved(self):
+
+        rows = '2023-03-01,Cash,Food,Lunch,5,UZS,Ok\n' * 1000
+        content = (self.header + rows).encode() + '2023-03-02,Cash,Food,Lunch,5,UZS,Café\n'.encode('cp1252')
+        response = self.upload('statement.csv', content)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            {'row': None, 'errors': ['The file is not a valid UTF-8 CSV file.']},
+        ])
+        self.assertFalse(Expense.objects.exists())
+
+    def test_dry_run_validates_without_saving(self):
+
+        rows = '2023-03-01,Cash,Food,Lunch,5,UZS,Ok\n'
+        response = self.upload('statement.csv', (self.header + rows).encode(), dry_run='1')
+        self.assertEqual(response.json(), {'status': 200, 'imported': 0, 'valid': 1, 'errors': [], 'dry_run': True})
+        self.assertFalse(Expense.objects.exists())
+
+    def test_export_can_be_imported_back(self):
+
+        subcategory = Subcategory.objects.get(name='Lunch')
+        Expense.objects.create(
+            category=self.food,
+            subcategory=subcategory,
+            account=self.cash,
+            amount=Decimal('4.25'),
+            comment='Coffee',
+            maker=self.user,
+        )
+        exporter = LedgerExporter()
+        file = exporter.to_xlsx(exporter.rows(Expense.objects.all()), 'expenses')
+        response = self.upload('expenses.xlsx', file.read())
+        self.assertEqual(response.json()['imported'], 1)
+        self.assertEqual(Expense.objects.filter(comment='Coffee').count(), 2)
+
+
+class SchemaTests(TestCase):
+    """
+    Tests for parsing request fields.
+    """
+
+    schema = Schema(
+        entry_id=Field(r'[^0-9]', 'int', required=False),
+        amount=Field(r'[^0-9.,]', 'decimal'),
+        date=Field(r'[^0-9/.:+\- TZ]', 'datetime', required=False, strip=False),
+        comment=Field(r'[^a-zA-Z0-9 ,.]', required=False),
+    )
+
+    def test_parses_typed_values(self):
+
+        data, errors = self.schema.parse({
+            'entry_id': ' 12a', 
+            'amount': '1 500,75', 
+            'date': '01.04.2023 12:30', 
+            'comment': 'Rent <b>',
+        })
+        self.assertEqual(errors, {})
+        self.assertEqual(data['entry_id'], 12)
+        self.assertEqual(data['amount'], Decimal('1500.75'))
+        self.assertEqual(data['date'], timezone.make_aware(datetime(2023, 4, 1, 12, 30)))
+        self.assertEqual(data['comment'], 'Rent b')
+
+    def test_accepts_iso_dates_and_missing_optional_fields(self):
+
+        data, errors = self.schema.parse({'amount': '3', 'date': '2023-04-01T10:00:00+00:00'})
+        self.assertEqual(data['date'], datetime(2023, 4, 1, 10, tzinfo=timezone.utc))
+        self.assertIsNone(data['entry_id'])
+        self.assertIsNone(data['comment'])
+        data, errors = self.schema.parse({'amount': '3', 'date': '2023-04-01T10:00:00Z'})
+        self.assertEqual(errors, {})
+        self.assertEqual(data['date'], datetime(2023, 4, 1, 10, tzinfo=timezone.utc))
+
+    def test_rejects_integers_out_of_the_64_bit_range(self):
+
+        data, errors = self.schema.parse({'amount': '3', 'entry_id': '9223372036854775807'})
+        self.assertEqual(data['entry_id'], 2 ** 63 - 1)
+        data, errors = self.schema.parse({'amount': '3', 'entry_id': '99999999999999999999'})
+        self.assertEqual(errors, {'entry_id': 'Enter a number between -9223372036854775808 and 9223372036854775807.'})
+
+    def test_reports_every_invalid_field(self):
+
+        data, errors = self.schema.parse({'amount': '0', 'date': '31.02.2023'})
+        self.assertEqual(data, {})
+        self.assertEqual(errors, {'amount': 'Enter a positive number.', 'date': 'Enter a valid date.'})
+        data, errors = self.schema.parse({'date': 'tomorrow'})
+        self.assertEqual(errors, {
+            'amount': 'This field is required.', 
+            'date': 'Contains characters that are not allowed.',
+        })
+
+
+class LedgerViewTests(TestCase):
+    """
+    Tests for adding, editing and deleting entries through the views.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        self.category = Category.objects.create(name='Salary', related_to='Income')
+        self.subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        self.client.force_login(self.user)
+
+    def post_income(self, **data):
+
+        return self.client.post(reverse('panel:incomes'), {
+            'category_id': self.category.id,
+            'subcategory_id': self.subcategory.id,
+            'account_id': self.cash.id,
+            'amount': '50',
+            'comment': 'March',
+            **data,
+        })
+
+    def assertBalances(self, cash, card):
+
+        self.cash.refresh_from_db()
+        self.card.refresh_from_db()
+        self.assertEqual((self.cash.balance.amount, self.card.balance.amount), (Decimal(cash), Decimal(card)))
+
+    def test_income_lifecycle_keeps_balances(self):
+
+        response = self.post_income(date='15.03.2023 09:00')
+        self.assertEqual(response.json()['action'], 'insert')
+        income = Income.objects.get()
+        self.assertEqual(timezone.localtime(income.date).date().isoformat(), '2023-03-15')
+        self.assertBalances('150', '0')
+
+        response = self.post_income(editing='', income_id=income.id, account_id=self.card.id, amount='20')
+        self.assertEqual(response.json()['action'], 'replace')
+        self.assertBalances('100', '20')
+
+        response = self.client.get(reverse('panel:incomes'), {'deleting': '', 'income_id': income.id})
+        self.assertEqual(response.json(), {'status': 200, 'action': 'remove', 'id': income.id, 'html': ''})
+        self.assertBalances('100', '0')
+        self.assertFalse(MonthlyRollup.objects.exclude(income_count=0).exists())
+
+    def test_entries_and_accounts_of_other_users_are_not_found(self):
+
+        self.post_income()
+        income = Income.objects.get()
+        other = User.objects.create_user('other')
+        wallet = Account.objects.create(name='Wallet', balance=Decimal('0.00'), owner=other)
+        self.client.force_login(other)
+        self.assertEqual(self.post_income(amount='1000').status_code, 404)
+        self.assertEqual(self.post_income(editing='', income_id=income.id, account_id=wallet.id).status_code, 404)
+        response = self.client.get(reverse('panel:incomes'), {'deleting': '', 'income_id': income.id})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(reverse('panel:incomes'), {'income_id': income.id}).status_code, 404)
+        response = self.client.post(reverse('panel:transactions'), {
+            'account1': wallet.id, 
+            'account2': self.cash.id, 
+            'amount': '5',
+        })
+        self.assertEqual(response.status_code, 404)
+        self.assertBalances('150', '0')
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance.amount, Decimal('0.00'))
+        self.assertEqual(Income.objects.get().account_id, self.cash.id)
+
+    def test_transaction_moves_money_between_accounts(self):
+
+        self.client.post(reverse('panel:transactions'), {
+            'account1': self.cash.id,
+            'account2': self.card.id,
+            'amount': '30.5',
+        })
+        self.assertBalances('69.5', '30.5')
+
+    def test_invalid_fields_are_reported(self):
+
+        response = self.post_income(amount='', date='someday')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'amount', 'date'})
+        self.assertFalse(Income.objects.exists())
+        response = self.client.get(reverse('panel:incomes'), {'income_id': '99999999999999999999'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'income_id'})
+
+
+class BatchViewTests(TestCase):
+    """
+    Tests for applying batches of operations.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        self.category = Category.objects.create(name='Food', related_to='Expense')
+        self.subcategory = Subcategory.objects.create(name='Lunch', related_to='Expense')
+        self.expense = Expense.objects.create(
+            category=self.category,
+            subcategory=self.subcategory,
+            account=self.cash,
+            amount=Decimal('10.00'),
+            date=timezone.make_aware(datetime(2023, 3, 1, 12)),
+            maker=self.user,
+        )
+        RollupManager().apply(RollupManager().change(self.expense, 1))
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def send(self, *operations):
+
+        return self.client.post(reverse('panel:batch'), json.dumps(operations), content_type='application/json')
+
+    def expense_data(self, **data):
+
+        return {
+            'category_id': self.category.id,
+            'subcategory_id': self.subcategory.id,
+            'account_id': self.cash.id,
+            'amount': '5',
+            'date': '2023-03-02T12:00:00',
+            **data,
+        }
+
+    def test_applies_every_operation_at_once(self):
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send(
+                {'op': 'create', 'ledger': 'expense', 'data': self.expense_data()},
+                {'op': 'create', 'ledger': 'expense', 'data': self.expense_data(amount=7.5, comment='Dinner')},
+                {'op': 'edit', 'ledger': 'expense', 'id': self.expense.id, 'data': self.expense_data(
+                    account_id=self.card.id, amount='4',
+                )},
+                {'op': 'create', 'ledger': 'transaction', 'data': {
+                    'account1': self.cash.id, 'account2': self.card.id, 'amount': '20',
+                }},
+            )
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([result['op'] for result in body['results']], ['create', 'create', 'edit', 'create'])
+        self.assertEqual(set(body['fragments']), {'expenses', 'transactions'})
+        self.assertIn('Dinner', body['fragments']['expenses']['html'])
+        self.cash.refresh_from_db()
+        self.card.refresh_from_db()
+        self.assertEqual(self.cash.balance.amount, Decimal('77.50'))
+        self.assertEqual(self.card.balance.amount, Decimal('16.00'))
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "panel_account"')]
+        self.assertEqual(len(updates), 2)
+        rollups = MonthlyRollup.objects.filter(maker=self.user)
+        self.assertEqual(
+            {(rollup.account_id, rollup.expense_amount, rollup.expense_count) for rollup in rollups},
+            {(self.cash.id, Decimal('12.50'), 2), (self.card.id, Decimal('4.00'), 1)},
+        )
+
+        response = self.send(
+            *[{'op': 'delete', 'ledger': 'expense', 'id': result['id']} for result in body['results'][:3]]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Expense.objects.exists())
+        self.cash.refresh_from_db()
+        self.card.refresh_from_db()
+        self.assertEqual(self.cash.balance.amount, Decimal('90.00'))
+        self.assertEqual(self.card.balance.amount, Decimal('20.00'))
+        self.assertFalse(MonthlyRollup.objects.exclude(expense_count=0).exists())
+
+    def test_an_invalid_operation_rejects_the_batch(self):
+
+        stranger = User.objects.create_user('stranger')
+        wallet = Account.objects.create(name='Wallet', balance=Decimal('0.00'), owner=stranger)
+        response = self.send(
+            {'op': 'create', 'ledger': 'expense', 'data': self.expense_data()},
+            {'op': 'delete', 'ledger': 'expense', 'id': self.expense.id},
+            {'op': 'edit', 'ledger': 'expense', 'id': self.expense.id, 'data': self.expense_data()},
+            {'op': 'create', 'ledger': 'expense', 'data': self.expense_data(account_id=wallet.id, amount='0')},
+            {'op': 'move', 'ledger': 'loan'},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            {'index': 2, 'errors': ['The expense %d is deleted by an earlier operation.' % self.expense.id]},
+            {'index': 3, 'errors': ['amount: Enter a positive number.']},
+            {'index': 4, 'errors': ['Unknown op "move".', 'Unknown ledger "loan".']},
+        ])
+        self.assertEqual(Expense.objects.count(), 1)
+        self.cash.refresh_from_db()
+        self.assertEqual(self.cash.balance.amount, Decimal('100.00'))
+
+        response = self.send({'op': 'create', 'ledger': 'expense', 'data': self.expense_data(account_id=wallet.id)})
+        self.assertEqual(response.json()['errors'], [{'index': 0, 'errors': ['account_id: Unknown account %d.' % wallet.id]}])
+        response = self.send({'op': 'create', 'ledger': 'expense', 'id': self.expense.id, 'data': self.expense_data()})
+        self.assertEqual(response.json()['errors'], [{'index': 0, 'errors': ['An id is not allowed when creating.']}])
+        self.assertEqual(self.client.post(reverse('panel:batch'), 'nope', content_type='application/json').status_code, 400)
+
+
+class AsyncViewTests(TestCase):
+    """
+    Tests for the async versions of the ledger views.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.category = Category.objects.create(name='Food', related_to='Expense')
+        self.subcategory = Subcategory.objects.create(name='Lunch', related_to='Expense')
+        self.async_client.force_login(self.user)
+
+    async def test_expense_lifecycle(self):
+
+        response = await self.async_client.post(reverse('panel:async-expenses'), {
+            'category_id': self.category.id,
+            'subcategory_id': self.subcategory.id,
+            'account_id': self.cash.id,
+            'amount': '40',
+        })
+        data = response.json()
+        self.assertEqual(data['action'], 'insert')
+        self.assertIn('Cash', data['html'])
+        account = await Account.objects.aget(id=self.cash.id)
+        self.assertEqual(account.balance.amount, Decimal('60.00'))
+
+        response = await self.async_client.get(reverse('panel:async-expenses'), {'expense_id': data['id']})
+        self.assertEqual(response.json()['result']['amount'], '40.00')
+
+        response = await self.async_client.get(reverse('panel:async-expenses'), {'listing': ''})
+        self.assertEqual(response.json()['html'].count('<tr'), 1)
+
+        await self.async_client.get(reverse('panel:async-expenses'), {'deleting': '', 'expense_id': data['id']})
+        account = await Account.objects.aget(id=self.cash.id)
+        self.assertEqual(account.balance.amount, Decimal('100.00'))
+        self.assertFalse(await Expense.objects.aexists())
+
+    async def test_missing_entry_is_not_found(self):
+
+        response = await self.async_client.get(reverse('panel:async-incomes'), {'income_id': 404})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_entries_and_accounts_of_other_users_are_not_found(self):
+
+        expense = await Expense.objects.acreate(
+            category=self.category, 
+            subcategory=self.subcategory, 
+            account=self.cash, 
+            amount=Decimal('10'), 
+            maker=self.user
+        )
+        await sync_to_async(self.async_client.force_login)(await User.objects.acreate(username='other'))
+        response = await self.async_client.get(reverse('panel:async-expenses'), {'expense_id': expense.id})
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.post(reverse('panel:async-expenses'), {
+            'category_id': self.category.id,
+            'subcategory_id': self.subcategory.id,
+            'account_id': self.cash.id,
+            'amount': '1000',
+        })
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(await Expense.objects.exclude(id=expense.id).aexists())
+
+    async def test_page_renders_all_lists(self):
+
+        await Transaction.objects.acreate(
+            account1=self.cash, 
+            account2=self.cash, 
+            amount=Decimal('1'), 
+            comment='Move', 
+            maker=self.user
+        )
+        response = await self.async_client.get(reverse('panel:async-incomes-expenses'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="transaction-')
+
+
+class TimelineTests(TestCase):
+    """
+    Tests for listing the three ledgers as one timeline.
+    """
+
+    def setUp(self):
+
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('0.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        self.salary = Category.objects.create(name='Salary', related_to='Income')
+        self.food = Category.objects.create(name='Food', related_to='Expense')
+        subcategory = Subcategory.objects.create(name='Other', related_to='Expense')
+        day = timezone.make_aware(datetime(2023, 3, 1, 12))
+        self.entries = []
+        for number in range(4):
+            date = day + timedelta(days=number // 2)
+            for model, fields in (
+                (Income, {'category': self.salary, 'subcategory': subcategory, 'account': self.cash}),
+                (Expense, {'category': self.food, 'subcategory': subcategory, 'account': self.card}),
+                (Transaction, {'account1': self.cash, 'account2': self.card}),
+            ):
+                entry = model.objects.create(amount=Decimal('1'), date=date, comment='Entry', maker=self.user, **fields)
+                self.entries.append((entry.date, entry.id, model._meta.model_name))
+        self.entries.sort()
+        self.client.force_login(self.user)
+
+    def read_all(self, **params) -> list[dict]:
+
+        rows, cursor = [], ''
+        while cursor is not None:
+            response = self.client.get(reverse('panel:timeline'), {'page_size': 5, 'cursor': cursor, **params}).json()
+            rows += response['results']
+            cursor = response['next']
+        return rows
+
+    def test_pages_follow_date_id_and_ledger_order(self):
+
+        rows = self.read_all()
+        self.assertEqual(
+            [(row['id'], row['ledger']) for row in rows], 
+            [(entry_id, ledger) for _, entry_id, ledger in self.entries],
+        )
+        transfer = next(row for row in rows if row['ledger'] == 'transaction')
+        self.assertEqual((transfer['source_name'], transfer['target_name'], transfer['category']), ('Cash', 'Card', None))
+        income = next(row for row in rows if row['ledger'] == 'income')
+        self.assertEqual((income['source'], income['target_name'], income['category_name']), (None, 'Cash', 'Salary'))
+
+    def test_filters_narrow_every_ledger(self):
+
+        self.assertEqual({row['ledger'] for row in self.read_all(account=self.card.id)}, {'expense', 'transaction'})
+        self.assertEqual({row['ledger'] for row in self.read_all(category=self.food.id)}, {'expense'})
+        self.assertEqual(len(self.read_all(ledger=['income', 'transaction'], to='2023-03-01')), 4)
+
+    def test_a_page_is_one_query(self):
+
+        with self.assertNumQueries(1):
+            rows, cursor = LedgerTimeline().page(self.user, QueryDict('page_size=4'))
+        self.assertEqual(len(rows), 4)
+        self.assertIsNotNone(cursor)
+
+
+class StatementTests(TestCase):
+    """
+    Tests for the statements of accounts.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        category = Category.objects.create(name='Food', related_to='Expense')
+        subcategory = Subcategory.objects.create(name='Coffee', related_to='Expense')
+        fields = {'category': category, 'subcategory': subcategory, 'account': self.cash, 'maker': self.user}
+        ArchivedExpense.objects.create(
+            id=1000, amount=Decimal('5'), date=self.day(1), comment='Archived', **fields
+        )
+        # Early in the morning, still the day before in UTC
+        Income.objects.create(amount=Decimal('50'), date=self.day(2, hour=1), comment='Salary', **fields)
+        Expense.objects.create(amount=Decimal('12.5'), date=self.day(3), comment='Coffee', **fields)
+        Transaction.objects.create(
+            account1=self.cash, account2=self.card, amount=Decimal('30'), date=self.day(3), comment='Out', maker=self.user
+        )
+        Transaction.objects.create(
+            account1=self.card, account2=self.cash, amount=Decimal('10'), date=self.day(5), comment='Back', maker=self.user
+        )
+        Account.objects.filter(id=self.cash.id).update(balance=Decimal('112.50'))
+        self.client.force_login(self.user)
+
+    def day(self, number: int, hour: int = 12) -> datetime:
+
+        return timezone.make_aware(datetime(2023, 3, number, hour))
+
+    def get_statement(self, account: Account, **params) -> dict:
+
+        response = self.client.get(reverse('panel:statement', args=[account.id]), params)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_running_balances_start_from_the_opening_balance(self):
+
+        statement = self.get_statement(self.cash, **{'from': '2023-03-02', 'to': '2023-03-03'})
+        self.assertEqual(statement['opening_balance'], '95.00')
+        self.assertEqual(
+            [(entry['ledger'], entry['amount'], entry['balance']) for entry in statement['entries']],
+            [('income', '50.00', '145.00'), ('expense', '-12.50', '132.50'), ('transaction', '-30.00', '102.50')],
+        )
+        self.assertEqual(statement['closing_balance'], '102.50')
+
+        statement = self.get_statement(self.cash)
+        self.assertEqual((statement['opening_balance'], statement['closing_balance']), ('100.00', '112.50'))
+        self.assertEqual(statement['entries'][0]['comment'], 'Archived')
+        self.assertEqual(len(statement['entries']), 5)
+
+    def test_periods_without_entries_keep_the_balance(self):
+
+        statement = self.get_statement(self.cash, **{'from': '2023-04-01'})
+        self.assertEqual((statement['opening_balance'], statement['entries']), ('112.50', []))
+        self.assertEqual(statement['closing_balance'], '112.50')
+
+    def test_statements_of_other_users_are_not_found(self):
+
+        other = Account.objects.create(name='Other', balance=Decimal('0.00'), owner=User.objects.create_user('other'))
+        response = self.client.get(reverse('panel:statement', args=[other.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class NetWorthTests(TestCase):
+    """
+    Tests for computing the net worth in one currency.
+    """
+
+    def setUp(self):
+
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('1000000.00'), owner=self.user)
+        self.dollars = Account.objects.create(name='Dollars', balance=Decimal('100.00'), owner=self.user)
+        Account.objects.filter(id=self.dollars.id).update(balance_currency='USD')
+        ExchangeRate.objects.create(currency='USD', rate=Decimal('10000'), date=date(2023, 1, 1))
+        ExchangeRate.objects.create(currency='USD', rate=Decimal('12500'), date=date(2023, 6, 1))
+        self.calculator = NetWorthCalculator()
+
+    def test_converts_with_the_latest_rate_of_the_day(self):
+
+        result = self.calculator.calculate(self.user, 'USD', {})
+        self.assertEqual(result['net_worth'], Decimal('180.00'))
+        result = self.calculator.calculate(self.user, 'UZS', {'to': '2023-03-01'})
+        self.assertEqual(result['net_worth'], Decimal('2000000.00'))
+
+    def test_results_are_cached_until_balances_or_rates_change(self):
+
+        self.calculator.calculate(self.user, 'UZS', {})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.calculator.calculate(self.user, 'UZS', {})['net_worth'], Decimal('2250000.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BalanceManager().apply({self.cash.id: Decimal('-250000')})
+        self.assertEqual(self.calculator.calculate(self.user, 'UZS', {})['net_worth'], Decimal('2000000.00'))
+
+        ExchangeRate.objects.create(currency='USD', rate=Decimal('5000'), date=date(2023, 7, 1))
+        self.assertEqual(self.calculator.calculate(self.user, 'UZS', {})['net_worth'], Decimal('1250000.00'))
+
+    def test_results_are_dropped_when_accounts_change(self):
+
+        self.assertEqual(self.calculator.calculate(self.user, 'UZS', {})['net_worth'], Decimal('2250000.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Account.objects.create(name='Savings', balance=Decimal('500000.00'), owner=self.user)
+        self.assertEqual(self.calculator.calculate(self.user, 'UZS', {})['net_worth'], Decimal('2750000.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cash.balance = Decimal('0.00')
+            self.cash.save()
+        self.assertEqual(self.calculator.calculate(self.user, 'UZS', {})['net_worth'], Decimal('1750000.00'))
+
+    def test_view_rejects_currencies_without_rates(self):
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('panel:net-worth'), {'currency': 'RUB'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('panel:net-worth'), {'currency': 'USD'})
+        self.assertEqual(response.json()['net_worth'], '180.00')
+
+    def test_rates_are_loaded_from_a_file(self):
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('date,currency,rate\n2023-06-01,usd,13000\n2023-06-01,RUB,150\n')
+        self.addCleanup(os.remove, file.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_rates', file.name, stdout=StringIO())
+        self.assertEqual(ExchangeRate.objects.count(), 3)
+        self.assertEqual(self.calculator.calculate(self.user, 'RUB', {})['net_worth'], Decimal('15333.33'))
+
+
+class DashboardTests(TestCase):
+    """
+    Tests for the dashboard of the index page.
+    """
+
+    def setUp(self):
+
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        self.food = Category.objects.create(name='Food', related_to='Expense')
+        self.home = Category.objects.create(name='Home', related_to='Expense')
+        self.subcategory = Subcategory.objects.create(name='Other', related_to='Expense')
+        self.client.force_login(self.user)
+        for category, amount in ((self.food, '10'), (self.home, '30'), (self.food, '5')):
+            self.post_expense(category, amount)
+
+    def post_expense(self, category: Category, amount: str):
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('panel:expenses'), {
+                'category_id': category.id,
+                'subcategory_id': self.subcategory.id,
+                'account_id': self.cash.id,
+                'amount': amount,
+                'comment': 'Shop',
+            })
+
+    def test_summary_holds_balances_totals_and_top_categories(self):
+
+        response = self.client.get(reverse('panel:dashboard'))
+        summary = response.json()
+        self.assertEqual(summary['month'], timezone.localdate().replace(day=1).isoformat())
+        self.assertEqual(
+            [(account['name'], account['balance']) for account in summary['balances']], 
+            [('Cash', '55.00'), ('Card', '0.00')],
+        )
+        self.assertEqual(summary['totals'], [{'currency': 'UZS', 'incomes': '0.00', 'expenses': '45.00'}])
+        self.assertEqual(
+            [(category['name'], category['amount']) for category in summary['top_categories']],
+            [('Home', '30.00'), ('Food', '15.00')],
+        )
+
+        response = self.client.get(reverse('panel:index'))
+        self.assertContains(response, '<td>Home</td>')
+        self.assertContains(response, '55.00 UZS')
+
+    def test_rebuilding_the_rollups_drops_the_cached_totals(self):
+
+        MonthlyRollup.objects.update(expense_amount=0)
+        self.assertEqual(self.client.get(reverse('panel:dashboard')).json()['totals'][0]['expenses'], '0.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.client.get(reverse('panel:dashboard')).json()['totals'][0]['expenses'], '45.00')
+
+    def test_writes_rebuild_only_the_parts_they_change(self):
+
+        dashboard = DashboardSummary()
+        dashboard.summarize(self.user)
+        with self.assertNumQueries(0):
+            dashboard.summarize(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('panel:transactions'), {
+                'account1': self.cash.id,
+                'account2': self.card.id,
+                'amount': '20',
+            })
+        with self.assertNumQueries(1):
+            summary = dashboard.summarize(self.user)
+        self.assertEqual([account['balance'] for account in summary['balances']], [Decimal('35.00'), Decimal('20.00')])
+
+        self.post_expense(self.food, '40')
+        summary = dashboard.summarize(self.user)
+        self.assertEqual(summary['totals'][0]['expenses'], Decimal('85.00'))
+        self.assertEqual(summary['top_categories'][0]['amount'], Decimal('55.00'))
+
+
+class ChartTests(TestCase):
+    """
+    Tests for rendering and caching the charts.
+    """
+
+    def setUp(self):
+
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        category = Category.objects.create(name='Food', related_to='Expense')
+        subcategory = Subcategory.objects.create(name='Coffee', related_to='Expense')
+        self.client.force_login(self.user)
+        self.client.post(reverse('panel:expenses'), {
+            'category_id': category.id,
+            'subcategory_id': subcategory.id,
+            'account_id': self.cash.id,
+            'amount': '10',
+            'comment': 'Coffee',
+        })
+        self.client.post(reverse('panel:transactions'), {
+            'account1': self.cash.id,
+            'account2': self.card.id,
+            'amount': '20',
+        })
+        self.renderer = ChartRenderer(workers=0)
+
+    def test_balances_are_worked_out_backwards_per_month(self):
+
+        data, options = self.renderer.data('balance', self.user, {'account': self.cash.id, 'months': 2})
+        self.assertEqual(data['balances'], [100.0, 70.0])
+        self.assertEqual(options['title'], 'Balance of Cash')
+        data, _ = self.renderer.data('cash-flow', self.user, {'months': 2})
+        self.assertEqual((data['incomes'], data['expenses']), ([0.0, 0.0], [0.0, 10.0]))
+        with self.assertRaises(Account.DoesNotExist):
+            self.renderer.data('balance', User.objects.create_user('other'), {'account': self.cash.id})
+
+    def test_the_same_data_is_rendered_once(self):
+
+        with mock.patch.object(ChartView, 'renderer', self.renderer), \
+                mock.patch('panel.rendering.charts.render', wraps=charts.render) as render:
+            response = self.client.get(reverse('panel:chart-categories'))
+            self.assertEqual(response['Content-Type'], 'image/svg+xml')
+            self.assertIn(b'Food', response.content)
+            response = self.client.get(reverse('panel:chart-categories'), HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.client.get(reverse('panel:chart-categories'))
+            self.client.get(reverse('panel:chart-categories'), {'width': '600'})
+        self.assertEqual(render.call_count, 2)
+
+        response = self.client.get(reverse('panel:chart-balance'), {'account': self.cash.id, 'currency': 'XYZ'})
+        self.assertEqual(set(response.json()['errors']), {'currency'})
+
+    def test_renders_run_in_a_bounded_pool(self):
+
+        renderer = ChartRenderer(workers=1, queue=1)
+        self.addCleanup(self.shutdown_pool)
+        data, options = renderer.data('cash-flow', self.user, {})
+        self.assertTrue(renderer.render('cash-flow', data, options).startswith(b'<?xml'))
+        renderer.slots.acquire()
+        with self.assertRaises(ChartQueueFull):
+            renderer.render('cash-flow', data, options)
+
+    def test_slow_renders_time_out_and_keep_their_place_until_done(self):
+
+        renderer = ChartRenderer(workers=1, queue=1, timeout=0.1)
+        pool = ThreadPoolExecutor(1)
+        done = threading.Event()
+        with mock.patch.object(ChartView, 'renderer', renderer), \
+                mock.patch.object(renderer, 'get_pool', return_value=pool), \
+                mock.patch('panel.rendering.charts.render', side_effect=lambda *args: done.wait(5) and b'<svg/>'):
+            response = self.client.get(reverse('panel:chart-categories'))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+            self.assertFalse(renderer.slots.acquire(blocking=False))
+            done.set()
+            pool.shutdown()
+        self.assertTrue(renderer.slots.acquire(blocking=False))
+
+    def shutdown_pool(self):
+
+        ChartRenderer.pool.shutdown()
+        ChartRenderer.pool = None
+
+
+class FragmentCacheTests(TestCase):
+    """
+    Tests for serving the lists from the versioned fragment cache.
+    """
+
+    def setUp(self):
+
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.category = Category.objects.create(name='Salary', related_to='Income')
+        self.subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        self.client.force_login(self.user)
+
+    def add_income(self, comment: str):
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('panel:incomes'), {
+                'category_id': self.category.id,
+                'subcategory_id': self.subcategory.id,
+                'account_id': self.cash.id,
+                'amount': '50',
+                'comment': comment,
+            })
+
+    def test_unchanged_lists_are_not_modified(self):
+
+        self.add_income('March')
+        response = self.client.get(reverse('panel:incomes-expenses'))
+        self.assertContains(response, 'March')
+        etag = response['ETag']
+        response = self.client.get(reverse('panel:incomes-expenses'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        self.add_income('April')
+        response = self.client.get(reverse('panel:incomes-expenses'), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'April')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_pages_are_rendered_once_per_version(self):
+
+        self.add_income('March')
+        self.client.get(reverse('panel:incomes'), {'listing': ''})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('panel:incomes'), {'listing': ''})
+        self.assertIn('March', response.json()['html'])
+        self.assertFalse([query for query in queries if 'panel_income' in query['sql']])
+
+    def test_saves_outside_the_views_invalidate_the_pages(self):
+
+        self.add_income('March')
+        etag = self.client.get(reverse('panel:incomes'), {'listing': ''})['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Income.objects.update(comment='Renamed')
+            Income.objects.get().save()
+        response = self.client.get(reverse('panel:incomes'), {'listing': ''}, HTTP_IF_NONE_MATCH=etag)
+        self.assertIn('Renamed', response.json()['html'])
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cash.name = 'Wallet'
+            self.cash.save()
+        response = self.client.get(reverse('panel:incomes'), {'listing': ''}, HTTP_IF_NONE_MATCH=etag)
+        self.assertIn('Wallet', response.json()['html'])
+
+    def test_account_changes_keep_the_pages_of_other_users(self):
+
+        self.add_income('March')
+        other = User.objects.create_user('other')
+        fragment_cache = FragmentCache()
+        keys = lambda: [fragment_cache.key(user.id, 'incomes', QueryDict()) for user in (self.user, other)]
+        owner_key, other_key = keys()
+        with self.captureOnCommitCallbacks(execute=True):
+            Account.objects.create(name='Card', balance=Decimal('0.00'), owner=other)
+        self.assertEqual(keys()[0], owner_key)
+        self.assertNotEqual(keys()[1], other_key)
+
+        owner_key, other_key = keys()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Wages'
+            self.category.save()
+        self.assertNotEqual(keys()[0], owner_key)
+        self.assertNotEqual(keys()[1], other_key)
+
+    def test_file_based_cache(self):
+
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        with self.settings(CACHES={'default': backend}):
+            self.add_income('March')
+            etag = self.client.get(reverse('panel:incomes-expenses'))['ETag']
+            response = self.client.get(reverse('panel:incomes-expenses'), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.add_income('April')
+            response = self.client.get(reverse('panel:incomes-expenses'), HTTP_IF_NONE_MATCH=etag)
+            self.assertContains(response, 'April')
+
+
+class LookupCacheTests(TestCase):
+    """
+    Tests for resolving the names of accounts and categories from the memory of the process.
+    """
+
+    def setUp(self):
+
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('0.00'), owner=self.user)
+        self.category = Category.objects.create(name='Salary', related_to='Income')
+        self.subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        for day in range(1, 4):
+            Income.objects.create(
+                category=self.category,
+                subcategory=self.subcategory,
+                account=self.cash,
+                amount=Decimal('1'),
+                comment='Day %d' % day,
+                maker=self.user,
+            )
+        self.lookups = LookupCache()
+
+    def test_names_are_loaded_once_per_version(self):
+
+        with self.assertNumQueries(4):
+            incomes = self.lookups.resolve(list(Income.objects.all()), IncomeValuesSerializer.related_names)
+        self.assertEqual({(income.account_name, income.category_name) for income in incomes}, {('Cash', 'Salary')})
+        with self.assertNumQueries(1):
+            rows = self.lookups.resolve(list(Income.objects.values('account', 'category', 'subcategory')), {
+                'subcategory_name': 'subcategory',
+            })
+        self.assertEqual(rows[0]['subcategory_name'], 'Bonus')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Wages'
+            self.category.save()
+        incomes = self.lookups.resolve(list(Income.objects.all()), IncomeValuesSerializer.related_names)
+        self.assertEqual(incomes[0].category_name, 'Wages')
+
+    def test_rows_show_the_cached_names(self):
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cash.name = 'Wallet'
+            self.cash.save()
+        response = self.client.get(reverse('panel:incomes'), {'listing': ''})
+        self.assertEqual(response.json()['html'].count('<td>Wallet</td>'), 3)
+
+
+class ValuesSerializerTests(TestCase):
+    """
+    Tests for reading entries through the values() serializers.
+    """
+
+    def setUp(self):
+
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('0.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        self.category = Category.objects.create(name='Salary', related_to='Income')
+        self.subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        for day in range(1, 4):
+            Income.objects.create(
+                category=self.category, 
+                subcategory=self.subcategory, 
+                account=self.cash, 
+                amount=Decimal('10.50') * day, 
+                date=timezone.make_aware(datetime(2023, 3, day, 9)), 
+                comment='Day %d' % day, 
+                maker=self.user
+            )
+        self.client.force_login(self.user)
+
+    def test_output_extends_the_model_serializer(self):
+
+        income = Income.objects.first()
+        transaction = Transaction.objects.create(
+            account1=self.cash, 
+            account2=self.card, 
+            amount=Decimal('5'), 
+            maker=self.user
+        )
+        for serializer, model_serializer, entry, names in (
+            (IncomeValuesSerializer(), IncomeSerializer, income, {'account_name': 'Cash', 'category_name': 'Salary'}),
+            (TransactionValuesSerializer(), TransactionSerializer, transaction, {'account2_name': 'Card'}),
+        ):
+            serializer.to_representation(serializer.values(type(entry).objects.all()).get(id=entry.id))
+            # The names come from the lookup cache once it has them.
+            with self.assertNumQueries(1):
+                result = serializer.to_representation(serializer.values(type(entry).objects.all()).get(id=entry.id))
+            self.assertEqual(json.loads(json.dumps(result)), result)
+            self.assertEqual({name: result[name] for name in model_serializer(entry).data}, model_serializer(entry).data)
+            self.assertEqual({name: result[name] for name in names}, names)
+
+    def test_retrieve_returns_the_names(self):
+
+        income = Income.objects.first()
+        response = self.client.get(reverse('panel:incomes'), {'income_id': income.id})
+        result = response.json()['result']
+        self.assertEqual((result['amount'], result['subcategory_name']), ('10.50', 'Bonus'))
+        self.assertEqual(result['date'], '2023-03-01T09:00:00+05:00')
+
+    def test_json_listing_is_paginated(self):
+
+        response = self.client.get(reverse('panel:incomes'), {'listing': '', 'format': 'json', 'page_size': 2})
+        data = response.json()
+        self.assertEqual([income['comment'] for income in data['results']], ['Day 1', 'Day 2'])
+        response = self.client.get(reverse('panel:incomes'), {
+            'listing': '', 
+            'format': 'json', 
+            'page_size': 2, 
+            'cursor': data['next'],
+        })
+        self.assertEqual(response.json()['results'][0]['amount'], '31.50')
+        self.assertIsNone(response.json()['next'])
+
+
+@override_settings(PANEL_METRICS=True, PANEL_ENFORCE_QUERY_BUDGETS=True)
+class MetricsTests(TestCase):
+    """
+    Tests for recording the metrics of the views and keeping them within their query budgets.
+    """
+
+    def setUp(self):
+
+        cache.clear()
+        registry.clear()
+        self.user = User.objects.create_superuser('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        self.category = Category.objects.create(name='Salary', related_to='Income')
+        self.subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        self.client.force_login(self.user)
+
+    def test_every_branch_keeps_within_the_budget(self):
+
+        categories = {'category_id': self.category.id, 'subcategory_id': self.subcategory.id}
+        for name, fields in (
+            ('incomes', {**categories, 'account_id': self.cash.id}),
+            ('expenses', {**categories, 'account_id': self.cash.id}),
+            ('transactions', {'account1': self.cash.id, 'account2': self.card.id}),
+        ):
+            for url in (reverse('panel:' + name), reverse('panel:async-' + name)):
+                entry_id = self.client.post(url, {**fields, 'amount': '5'}).json()['id']
+                id_field = name[:-1] + '_id'
+                self.client.post(url, {**fields, 'amount': '6', 'editing': '', id_field: entry_id})
+                self.client.post(url, {**fields, 'amount': '7', 'editing': '', 'full': '', id_field: entry_id})
+                self.client.get(url, {id_field: entry_id})
+                self.client.get(url, {'listing': ''})
+                self.client.get(url, {'listing': '', 'format': 'json'})
+                self.client.get(url, {'deleting': '', id_field: entry_id})
+        for name in ('index', 'incomes-expenses', 'async-incomes-expenses', 'net-worth', 'incomes-export'):
+            cache.clear()
+            self.assertEqual(self.client.get(reverse('panel:' + name)).status_code, 200)
+
+    def test_templates_are_timed_only_with_metrics_on(self):
+
+        engine = engines.all()[0]
+        self.assertIsInstance(engine.get_template('panel/index.html'), metrics.Template)
+        with self.settings(PANEL_METRICS=False):
+            self.assertNotIsInstance(engine.get_template('panel/index.html'), metrics.Template)
+            self.assertNotIsInstance(engine.from_string('{{ value }}'), metrics.Template)
+
+    def test_exceeding_the_budget_fails(self):
+
+        with mock.patch.object(IncomeView, 'query_budget', 1):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'panel:incomes ran 3 queries, its budget is 1.'):
+                self.client.get(reverse('panel:incomes'), {'listing': ''})
+        with mock.patch.object(IncomeView, 'query_budget', 1), self.settings(PANEL_ENFORCE_QUERY_BUDGETS=False):
+            with self.assertLogs('panel.metrics', 'WARNING'):
+                self.client.get(reverse('panel:incomes'), {'listing': '', 'page_size': 1})
+        self.assertIn(
+            'panel_view_query_budget_exceeded_total{view="panel:incomes"} 2', 
+            self.client.get(reverse('panel:metrics')).content.decode()
+        )
+
+    def test_metrics_are_served_to_superusers(self):
+
+        self.client.get(reverse('panel:incomes-expenses'))
+        self.client.get(reverse('panel:incomes-expenses'))
+        metrics = self.client.get(reverse('panel:metrics')).content.decode()
+        self.assertIn('panel_view_queries_bucket{view="panel:incomes-expenses",le="5"} 2\n', metrics)
+        self.assertIn('panel_view_queries_sum{view="panel:incomes-expenses"} 7\n', metrics)
+        self.assertIn('panel_view_response_bytes_count{view="panel:incomes-expenses"} 2\n', metrics)
+        self.assertIn('panel_view_template_seconds_count{view="panel:incomes-expenses"} 2\n', metrics)
+
+        self.client.force_login(User.objects.create_user('other'))
+        self.assertEqual(self.client.get(reverse('panel:metrics')).status_code, 403)
+
+    async def test_queries_of_async_views_are_recorded(self):
+
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse('panel:async-incomes'), {'listing': ''})
+        self.assertEqual(response.status_code, 200)
+        metrics = await sync_to_async(registry.render)()
+        self.assertIn('panel_view_queries_sum{view="panel:async-incomes"} 3\n', metrics)
+
+
+class LoginRequiredTests(TestCase):
+    """
+    Tests for refusing the requests of anonymous users.
+    """
+
+    def test_anonymous_users_are_refused(self):
+
+        for name in (
+            'incomes-expenses', 'incomes', 'expenses', 'transactions', 'incomes-export', 'search', 'timeline',
+            'net-worth', 'dashboard', 'chart-categories', 'chart-cash-flow', 'chart-balance', 'async-incomes-expenses',
+            'async-incomes', 'async-expenses', 'async-transactions',
+        ):
+            self.assertEqual(self.client.get(reverse('panel:' + name), {'listing': '', 'q': 'lunch'}).status_code, 403)
+        self.assertEqual(self.client.get(reverse('panel:statement', args=[1])).status_code, 403)
+        self.assertEqual(self.client.post(reverse('panel:incomes-import')).status_code, 403)
+        self.assertEqual(self.client.post(reverse('panel:batch'), '[]', content_type='application/json').status_code, 403)
+        self.assertEqual(self.client.get(reverse('panel:index')).status_code, 200)
+
+
+class SearchTests(TestCase):
+    """
+    Tests for searching the comments of the ledgers.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        other = User.objects.create_user('other')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        category = Category.objects.create(name='Food', related_to='Expense')
+        subcategory = Subcategory.objects.create(name='Lunch', related_to='Expense')
+        fields = {'category': category, 'subcategory': subcategory, 'account': self.cash, 'amount': Decimal('5')}
+        self.expenses = [
+            Expense.objects.create(comment=comment, maker=self.user, **fields)
+            for comment in ('Coffee', 'Coffee beans and coffee filters', 'Groceries', 'Кофе с собой')
+        ]
+        Expense.objects.create(comment='Coffee', maker=other, **fields)
+        self.transaction = Transaction.objects.create(
+            account1=self.cash, 
+            account2=self.card, 
+            amount=Decimal('1'), 
+            comment='Coffee fund', 
+            maker=self.user,
+        )
+        self.client.force_login(self.user)
+
+    def search(self, **params):
+
+        return self.client.get(reverse('panel:search'), params).json()
+
+    def test_finds_ranked_matches_of_the_user(self):
+
+        results = self.search(q='coff')['results']
+        self.assertEqual(
+            [(result['ledger'], result['id']) for result in results],
+            [
+                ('expense', self.expenses[0].id), 
+                ('expense', self.expenses[1].id), 
+                ('transaction', self.transaction.id),
+            ],
+        )
+        self.assertEqual(results[2]['account1_name'], 'Cash')
+        self.assertEqual([result['comment'] for result in self.search(q='КОФЕ')['results']], ['Кофе с собой'])
+        self.assertEqual(self.search(q='coffee fund')['results'][0]['id'], self.transaction.id)
+        self.assertEqual(self.client.get(reverse('panel:search'), {'q': '...'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('panel:search')).status_code, 400)
+
+    def test_pages_follow_the_ranking(self):
+
+        first = self.search(q='coffee')
+        ids, cursor = [result['id'] for result in first['results']], None
+        while True:
+            params = {'q': 'coffee', 'page_size': 1}
+            page = self.search(**params, cursor=cursor) if cursor else self.search(**params)
+            self.assertEqual(len(page['results']), 1)
+            ids.remove(page['results'][0]['id'])
+            cursor = page['next']
+            if cursor is None:
+                break
+        self.assertEqual(ids, [])
+
+    def test_index_follows_the_writes(self):
+
+        self.expenses[2].comment = 'Coffee machine'
+        self.expenses[2].save()
+        self.expenses[0].delete()
+        Expense.objects.filter(id=self.expenses[1].id).update(comment='Tea')
+        self.assertEqual(
+            {(result['ledger'], result['comment']) for result in self.search(q='coffee')['results']},
+            {('expense', 'Coffee machine'), ('transaction', 'Coffee fund')},
+        )
+
+
+class ArchiveTests(TestCase):
+    """
+    Tests for archiving old entries and reading them back.
+    """
+
+    def setUp(self):
+
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        self.category = Category.objects.create(name='Food', related_to='Expense')
+        self.subcategory = Subcategory.objects.create(name='Lunch', related_to='Expense')
+        self.client.force_login(self.user)
+        manager = BalanceManager()
+        for month, day in ((1, 5), (1, 20), (2, 10), (3, 1), (4, 2)):
+            expense = Expense.objects.create(
+                category=self.category,
+                subcategory=self.subcategory,
+                account=self.cash,
+                amount=Decimal('%d.50' % month),
+                date=timezone.make_aware(datetime(2023, month, day, 12)),
+                comment='Lunch %d.%d' % (day, month),
+                maker=self.user,
+            )
+            transfer = Transaction.objects.create(
+                account1=self.cash,
+                account2=self.card,
+                amount=Decimal('3.00'),
+                date=expense.date,
+                maker=self.user,
+            )
+            manager.apply(manager.collect(*manager.changes(expense), *manager.changes(transfer)))
+        call_command('rebuild_rollups', stdout=StringIO())
+
+    def archive(self, before='2023-03-15'):
+
+        call_command('archive_ledgers', before=before, batch_size=2, stdout=StringIO())
+
+    def test_archived_months_leave_exact_summaries(self):
+
+        rollups = list(MonthlyRollup.objects.order_by('month').values_list('month', 'expense_amount', 'expense_count'))
+        net_worth = self.client.get(reverse('panel:net-worth'), {'from': '2023-01-01'}).json()
+        self.archive()
+        self.assertEqual(Expense.objects.count(), 2)
+        self.assertEqual(ArchivedExpense.objects.count(), 3)
+        self.assertEqual(ArchivedTransaction.objects.count(), 3)
+        self.assertEqual(
+            list(ArchiveSummary.objects.filter(kind='expense').order_by('month').values_list('month', 'amount', 'count')),
+            [(date(2023, 1, 1), Decimal('3.00'), 2), (date(2023, 2, 1), Decimal('2.50'), 1)],
+        )
+        self.assertEqual(
+            set(ArchiveSummary.objects.filter(month=date(2023, 1, 1)).exclude(kind='expense').values_list('kind', 'amount')),
+            {('transfer_out', Decimal('6.00')), ('transfer_in', Decimal('6.00'))},
+        )
+
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(
+            list(MonthlyRollup.objects.order_by('month').values_list('month', 'expense_amount', 'expense_count')),
+            rollups,
+        )
+        report = StringIO()
+        call_command('reconcile_balances', workers=1, json=True, stdout=report)
+        self.assertEqual(json.loads(report.getvalue())['drifted'], [])
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('panel:net-worth'), {'from': '2023-01-01'}).json(), net_worth)
+
+    def test_archive_is_read_only_when_asked_for(self):
+
+        self.archive()
+        url = reverse('panel:expenses')
+        response = self.client.get(url, {'listing': '', 'format': 'json'})
+        self.assertEqual([entry['comment'] for entry in response.json()['results']], ['Lunch 1.3', 'Lunch 2.4'])
+
+        comments, cursor = [], None
+        while True:
+            params = {'listing': '', 'format': 'json', 'archive': '1', 'page_size': 2}
+            response = self.client.get(url, {**params, 'cursor': cursor} if cursor else params).json()
+            comments += [entry['comment'] for entry in response['results']]
+            cursor = response['next']
+            if cursor is None:
+                break
+        self.assertEqual(comments, ['Lunch 5.1', 'Lunch 20.1', 'Lunch 10.2', 'Lunch 1.3', 'Lunch 2.4'])
+
+        response = self.client.get(reverse('panel:expenses-export'), {'format': 'csv', 'archive': '1'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([line.rsplit(',', 1)[-1] for line in lines[1:]], comments)
+        response = self.client.get(reverse('panel:expenses-export'), {'format': 'csv'})
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 3)
+
+
+class AdminTests(TestCase):
+    """
+    Tests for the admin of the ledgers.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_superuser('admin')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.card = Account.objects.create(name='Card', balance=Decimal('0.00'), owner=self.user)
+        self.category = Category.objects.create(name='Food', related_to='Expense')
+        self.subcategory = Subcategory.objects.create(name='Coffee', related_to='Expense')
+        self.client.force_login(self.user)
+
+    def add_entries(self, count: int) -> None:
+
+        for number in range(count):
+            Expense.objects.create(
+                category=self.category,
+                subcategory=self.subcategory,
+                account=self.cash if number % 2 else self.card,
+                amount=Decimal('1.00'),
+                comment='Coffee',
+                maker=self.user,
+            )
+            Transaction.objects.create(
+                account1=self.cash, 
+                account2=self.card, 
+                amount=Decimal('2.00'), 
+                comment='Transfer', 
+                maker=self.user,
+            )
+
+    def test_changelists_run_the_same_queries_for_any_number_of_rows(self):
+
+        queries = {}
+        for count in (2, 10):
+            self.add_entries(count)
+            for model in ('expense', 'transaction'):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(reverse('admin:panel_%s_changelist' % model))
+                self.assertEqual(response.status_code, 200)
+                queries.setdefault(model, set()).add(len(context.captured_queries))
+        self.assertEqual(len(queries['expense']), 1)
+        self.assertEqual(len(queries['transaction']), 1)
+
+    def test_change_forms_use_autocomplete_widgets(self):
+
+        self.add_entries(1)
+        expense = Expense.objects.get()
+        response = self.client.get(reverse('admin:panel_expense_change', args=[expense.id]))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, '<option value="%d">Card</option>' % self.card.id)
+
+    def test_deleting_entries_applies_one_balance_update_per_account(self):
+
+        self.add_entries(4)
+        ids = list(Expense.objects.values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('admin:panel_expense_changelist'), {
+                'action': 'delete_selected',
+                '_selected_action': ids,
+                'post': 'yes',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Expense.objects.exists())
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE "panel_account"')]
+        self.assertEqual(len(updates), 2)
+        self.cash.refresh_from_db()
+        self.card.refresh_from_db()
+        self.assertEqual(self.cash.balance.amount, Decimal('102.00'))
+        self.assertEqual(self.card.balance.amount, Decimal('2.00'))
+        self.assertEqual(sum(MonthlyRollup.objects.values_list('expense_count', flat=True)), -4)
+
+    def test_editing_an_entry_moves_its_amount_between_accounts(self):
+
+        self.add_entries(1)
+        transfer = Transaction.objects.get()
+        response = self.client.post(reverse('admin:panel_transaction_change', args=[transfer.id]), {
+            'account1': self.card.id,
+            'account2': self.cash.id,
+            'amount_0': '5.00',
+            'amount_1': 'UZS',
+            'date_0': '2024-01-01',
+            'date_1': '10:00:00',
+            'comment': 'Back',
+            'maker': self.user.id,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.cash.refresh_from_db()
+        self.card.refresh_from_db()
+        self.assertEqual(self.cash.balance.amount, Decimal('107.00'))
+        self.assertEqual(self.card.balance.amount, Decimal('-7.00'))
+        self.assertEqual(str(Transaction.objects.get()), 'Card > Cash')
+
+
+class SyntheticDataTests(TestCase):
+    """
+    Tests for generating synthetic data and benchmarking the views on it.
+    """
+
+    def setUp(self):
+
+        cache.clear()
+        call_command(
+            'generate_data', 
+            users=2, 
+            incomes=30, 
+            expenses=120, 
+            transactions=15, 
+            months=6, 
+            stdout=StringIO()
+        )
+
+    def test_generates_consistent_ledgers(self):
+
+        user = User.objects.get(username='synthetic-0')
+        self.assertTrue(user.is_superuser)
+        self.assertEqual(Income.objects.filter(maker=user).count(), 30)
+        self.assertEqual(Expense.objects.count(), 240)
+        self.assertEqual(Transaction.objects.count(), 30)
+        for account in Account.objects.filter(owner=user):
+            total = sum(income.amount.amount for income in Income.objects.filter(account=account)) \
+                - sum(expense.amount.amount for expense in Expense.objects.filter(account=account)) \
+                - sum(transaction.amount.amount for transaction in Transaction.objects.filter(account1=account)) \
+                + sum(transaction.amount.amount for transaction in Transaction.objects.filter(account2=account))
+            self.assertEqual(account.balance.amount, total)
+        self.assertEqual(sum(MonthlyRollup.objects.values_list('expense_count', flat=True)), 240)
+
+    def test_benchmark_writes_the_results(self):
+
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as file:
+            pass
+        self.addCleanup(os.remove, file.name)
+        call_command(
+            'bench_views', 
+            requests=2, 
+            warmup=1, 
+            only=['page', 'income'], 
+            output=file.name, 
+            compare=file.name, 
+            stdout=StringIO()
+        )
+        with open(file.name) as results:
+            report = json.load(results)
+        self.assertEqual(
+            list(report['scenarios']), 
+            ['page', 'page (cold)', 'income add', 'income edit', 'income delete', 'admin incomes']
+        )
+        self.assertEqual(report['scenarios']['income add']['statuses'], [200])
+        self.assertEqual(report['scenarios']['page (cold)']['queries'], 5)
+        self.assertEqual(report['entries']['incomes'], 30)
+
+
+class ReconciliationTests(TransactionTestCase):
+    """
+    Tests for finding and repairing balances that drifted from the entries.
+    """
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('owner')
+        self.accounts = [
+            Account.objects.create(name='Account %d' % number, balance=Decimal('100.00'), owner=self.user)
+            for number in range(6)
+        ]
+        category = Category.objects.create(name='Salary', related_to='Income')
+        subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        manager = BalanceManager()
+        for account, other in zip(self.accounts, self.accounts[1:]):
+            income = Income.objects.create(
+                category=category, 
+                subcategory=subcategory, 
+                account=account, 
+                amount=Decimal('20.00'), 
+                maker=self.user,
+            )
+            transfer = Transaction.objects.create(
+                account1=account, 
+                account2=other, 
+                amount=Decimal('7.50'), 
+                maker=self.user,
+            )
+            manager.apply(manager.collect(*manager.changes(income), *manager.changes(transfer)))
+        Account.objects.filter(id=self.accounts[1].id).update(balance=F('balance') + Decimal('0.01'))
+        Account.objects.filter(id=self.accounts[4].id).update(balance=Decimal('0.00'))
+
+    def reconcile(self, *args) -> dict:
+
+        output = StringIO()
+        call_command('reconcile_balances', *args, '--json', stdout=output)
+        return json.loads(output.getvalue())
+
+    def test_opening_balances_derived_by_the_migration_are_logged(self):
+
+        migration = import_module('panel.migrations.0006_account_opening_balance')
+        Account.objects.create(name='Empty', balance=Decimal('0.00'), owner=self.user)
+        with self.assertLogs('panel.migrations', 'WARNING') as logs:
+            migration.set_opening_balances(apps, None)
+        self.assertEqual(len(logs.output), 6)
+        self.assertIn(
+            'Account %d (Account 1) gets an opening balance of 100.01 derived' % self.accounts[1].id, logs.output[1]
+        )
+
+    def test_reports_and_repairs_the_drift(self):
+
+        report = self.reconcile('--workers', '1', '--shards', '4')
+        self.assertEqual(report['shards'], 3)
+        self.assertEqual(
+            [(drift['account'], drift['drift']) for drift in report['drifted']],
+            [(self.accounts[1].id, '0.01'), (self.accounts[4].id, '-120.00')],
+        )
+        self.assertEqual(report['repaired'], [])
+
+        report = self.reconcile('--workers', '1', '--repair')
+        self.assertEqual(len(report['repaired']), 2)
+        self.assertEqual(
+            [account.balance.amount for account in Account.objects.order_by('id')],
+            [Decimal(amount) for amount in ('112.50', '120.00', '120.00', '120.00', '120.00', '107.50')],
+        )
+        self.assertEqual(self.reconcile('--workers', '1')['drifted'], [])
+
+    def test_workers_find_the_same_drift(self):
+
+        self.assertEqual(
+            self.reconcile('--workers', '3')['drifted'],
+            self.reconcile('--workers', '1')['drifted'],
+        )
+
+
+@skipUnless('replica' in settings.DATABASES, 'Needs the replica database of mypanel.test_settings.')
+@override_settings(PANEL_REPLICA_DATABASE='replica')
+class ReplicaRouterTests(TestCase):
+    """
+    Tests for reading the read-only views from the replica without losing the user's own writes.
+    """
+
+    databases = '__all__'
+
+    def setUp(self):
+
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.cash = Account.objects.create(name='Cash', balance=Decimal('100.00'), owner=self.user)
+        self.category = Category.objects.create(name='Salary', related_to='Income')
+        self.subcategory = Subcategory.objects.create(name='Bonus', related_to='Income')
+        for instance in (self.user, self.cash, self.category, self.subcategory):
+            instance.save(using='replica', force_insert=True)
+        self.client.force_login(self.user)
+
+    def create_income(self, database: str, comment: str):
+
+        Income.objects.using(database).create(
+            category=self.category, 
+            subcategory=self.subcategory, 
+            account=self.cash, 
+            amount=Decimal('10'), 
+            comment=comment, 
+            maker=self.user
+        )
+
+    def test_read_only_views_read_the_replica(self):
+
+        self.create_income('replica', 'Replicated')
+        self.create_income('default', 'Lagging')
+        response = self.client.get(reverse('panel:timeline'))
+        self.assertEqual([row['comment'] for row in response.json()['results']], ['Replicated'])
+        response = self.client.get(reverse('panel:incomes'), {'listing': '', 'format': 'json'})
+        self.assertEqual([income['comment'] for income in response.json()['results']], ['Lagging'])
+
+    def test_writes_pin_the_user_to_the_primary(self):
+
+        self.client.post(reverse('panel:incomes'), {
+            'category_id': self.category.id,
+            'subcategory_id': self.subcategory.id,
+            'account_id': self.cash.id,
+            'amount': '50',
+            'comment': 'Fresh',
+        })
+        self.assertContains(self.client.get(reverse('panel:timeline')), 'Fresh')
+        cache.clear()
+        self.assertNotContains(self.client.get(reverse('panel:timeline')), 'Fresh')
+
+    def test_cached_pages_are_rendered_from_the_replica(self):
+
+        self.create_income('replica', 'Replicated')
+        self.create_income('default', 'Lagging')
+        response = self.client.get(reverse('panel:incomes-expenses'))
+        self.assertContains(response, 'Replicated')
+        self.assertNotContains(response, 'Lagging')
+
+    def test_writes_of_others_pin_the_owner_to_the_primary(self):
+
+        self.create_income('replica', 'Replicated')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_income('default', 'Added by the admin')
+        response = self.client.get(reverse('panel:incomes-expenses'))
+        self.assertContains(response, 'Added by the admin')
+        self.assertNotContains(response, 'Replicated')
+
+    def test_middleware_follows_the_mode_of_the_handler(self):
+
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(ReplicaMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(ReplicaMiddleware(lambda request: HttpResponse())))
+
+    async def test_async_views_read_the_replica_until_the_user_writes(self):
+
+        await sync_to_async(self.create_income)('replica', 'Replicated')
+        await sync_to_async(self.create_income)('default', 'Lagging')
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse('panel:async-incomes-expenses'))
+        self.assertContains(response, 'Replicated')
+        self.assertNotContains(response, 'Lagging')
+
+        await self.async_client.post(reverse('panel:async-incomes'), {
+            'category_id': self.category.id,
+            'subcategory_id': self.subcategory.id,
+            'account_id': self.cash.id,
+            'amount': '50',
+            'comment': 'Fresh',
+        })
+        self.assertTrue(await sync_to_async(ReplicaRouter.is_pinned)(self.user.id))
+        # The write bumps the version of the cached pages on commit, which the test transaction never reaches.
+        await sync_to_async(FragmentCache().bump)(self.user.id, 'incomes')
+        response = await self.async_client.get(reverse('panel:async-incomes-expenses'))
+        self.assertContains(response, 'Fresh')
+        self.assertContains(response, 'Lagging')
+
+    def test_rates_are_loaded_from_the_primary(self):
+
+        ExchangeRate.objects.create(currency='USD', rate=Decimal('10000'), date=date(2023, 1, 1))
+        for attempt in range(2):
+            response = self.client.get(reverse('panel:net-worth'), {'currency': 'USD'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(Decimal(response.json()['net_worth']), Decimal('0.01'))
+
+    def test_names_are_loaded_from_the_primary(self):
+
+        self.create_income('replica', 'Replicated')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cash.name = 'Wallet'
+            self.cash.save()
+        # The rename pinned the owner to the primary; the names have to come from it after the pin, too.
+        cache.delete(ReplicaRouter.pin_key(self.user.id))
+        response = self.client.get(reverse('panel:timeline'))
+        self.assertEqual([row['target_name'] for row in response.json()['results']], ['Wallet'])
+
+    def test_streamed_responses_read_the_replica(self):
+
+        self.create_income('replica', 'Replicated')
+        self.create_income('default', 'Lagging')
+        response = self.client.get(reverse('panel:incomes-export'), {'format': 'csv'})
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Replicated', content)
+        self.assertNotIn('Lagging', content)
+        response = self.client.get(reverse('panel:statement', args=[self.cash.id]))
+        entries = json.loads(b''.join(response.streaming_content))['entries']
+        self.assertEqual([entry['comment'] for entry in entries], ['Replicated'])
+
+    def test_use_replica_routes_reads_and_keeps_writes_on_the_primary(self):
+
+        self.create_income('replica', 'Replicated')
+        with ReplicaRouter.use_replica() as state:
+            self.assertEqual(Income.objects.get().comment, 'Replicated')
+            self.create_income('default', 'Written')
+        self.assertTrue(state['wrote'])
+        self.assertEqual(Income.objects.get().comment, 'Written')
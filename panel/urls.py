@@ -9,4 +9,24 @@ urlpatterns = [
     path('incomes/', IncomeView.as_view(), name='incomes'),
     path('expenses/', ExpenseView.as_view(), name='expenses'),
     path('transactions/', TransactionView.as_view(), name='transactions'),
-]
\ No newline at end of file
+    path('incomes/export/', ExportView.as_view(model=Income, archive_model=ArchivedIncome), name='incomes-export'),
+    path('expenses/export/', ExportView.as_view(model=Expense, archive_model=ArchivedExpense), name='expenses-export'),
+    path('transactions/export/', ExportView.as_view(model=Transaction, archive_model=ArchivedTransaction), name='transactions-export'),
+    path('incomes/import/', ImportView.as_view(model=Income), name='incomes-import'),
+    path('expenses/import/', ImportView.as_view(model=Expense), name='expenses-import'),
+    path('transactions/import/', ImportView.as_view(model=Transaction), name='transactions-import'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('timeline/', TimelineView.as_view(), name='timeline'),
+    path('accounts/<int:account_id>/statement/', StatementView.as_view(), name='statement'),
+    path('net-worth/', NetWorthView.as_view(), name='net-worth'),
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('charts/categories/', ChartView.as_view(kind='categories'), name='chart-categories'),
+    path('charts/cash-flow/', ChartView.as_view(kind='cash-flow'), name='chart-cash-flow'),
+    path('charts/balance/', ChartView.as_view(kind='balance'), name='chart-balance'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('async/incomes-expenses/', AsyncIncomesExpensesView.as_view(), name='async-incomes-expenses'),
+    path('async/incomes/', AsyncIncomeView.as_view(), name='async-incomes'),
+    path('async/expenses/', AsyncExpenseView.as_view(), name='async-expenses'),
+    path('async/transactions/', AsyncTransactionView.as_view(), name='async-transactions'),
+]
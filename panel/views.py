@@ -1,16 +1,57 @@
+import asyncio
+import json
+from collections.abc import Callable
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.http import HttpRequest, JsonResponse
+from django.db import transaction as db_transaction
+from django.db.models import QuerySet
+from django.http import FileResponse, \
+    Http404, \
+    HttpRequest, \
+    HttpResponse, \
+    JsonResponse, \
+    QueryDict, \
+    StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.generic import TemplateView, View
-from .assistants import Validator
-from .models import Expense, \
+from .assistants import Field, \
+    Schema
+from .balances import BalanceManager
+from .caches import FragmentCache, \
+    lookup_cache
+from .files import LedgerExporter, \
+    LedgerImporter
+from .ledgers import LedgerBatch, \
+    RollupManager
+from .metrics import registry
+from .models import ArchivedExpense, \
+    ArchivedIncome, \
+    ArchivedTransaction, \
+    ExchangeRate, \
+    Expense, \
     Income, \
     Transaction
+from .paginators import KeysetPaginator
+from .rates import NetWorthCalculator
 from .relationships import Account
-from .serializers import ExpenseSerializer, \
-    IncomeSerializer, \
-    TransactionSerializer
+from .rendering import ChartQueueFull, \
+    ChartRenderer, \
+    ChartTimeout
+from .reports import AccountStatement, \
+    CommentSearch, \
+    DashboardSummary, \
+    LedgerTimeline
+from .serializers import ExpenseValuesSerializer, \
+    IncomeValuesSerializer, \
+    StatementSerializer, \
+    TimelineSerializer, \
+    TransactionValuesSerializer
 
 
 class IndexView(TemplateView):
@@ -19,59 +60,284 @@ class IndexView(TemplateView):
     """
     
     template_name = 'panel/index.html'
+    dashboard = DashboardSummary()
+    query_budget = 6
+    read_only = True
 
     def get(self, request: HttpRequest):
         """
         A method for handling GET method of the request that comes for the index page.
         """
 
-        return render(request, self.template_name)
+        context = {}
+        if request.user.is_authenticated:
+            context['summary'] = self.dashboard.summarize(request.user)
+        return render(request, self.template_name, context)
 
 
-class IncomesExpensesView(View):
+class LoginRequiredMixin:
+    """
+    A mixin for refusing the requests of anonymous users with 403 Forbidden.
+    """
+
+    def dispatch(self, request: HttpRequest, *args, **kwargs):
+
+        if not request.user.is_authenticated:
+            raise PermissionDenied
+        return super().dispatch(request, *args, **kwargs)
+
+
+class ConditionalMixin:
+    """
+    A mixin for answering requests for cached pages the client already has with 304 Not Modified.
+    """
+
+    fragment_cache = FragmentCache()
+
+    def respond_conditionally(self, request: HttpRequest, etag: str, respond: Callable[[], HttpResponse]):
+        """
+        A method for responding with 304 when the ETag matches, or with the response built by respond.
+        """
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = respond()
+        return self.add_etag(response, etag)
+
+
+    def add_etag(self, response: HttpResponse, etag: str) -> HttpResponse:
+        """
+        A method for marking the response with the ETag and making browsers revalidate it on every use.
+        """
+
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class IncomesExpensesView(LoginRequiredMixin, ConditionalMixin, View):
     """
     A view for the page of incomes and expenses.
+
+    Every list is paged on its own by the '<ledger>_cursor' and '<ledger>_page_size' parameters
+    (like 'incomes_cursor'), while 'from'/'to' limit all of them.
     """
 
     tempate_name = 'panel/incomes-expenses.html'
-    validator = Validator()
+    query_budget = 8
+    read_only = True
+    paginator = KeysetPaginator()
+    related_names = {
+        'incomes': IncomeValuesSerializer.related_names,
+        'expenses': ExpenseValuesSerializer.related_names,
+        'transactions': TransactionValuesSerializer.related_names,
+    }
 
     def get(self, request: HttpRequest):
         """
         A method for handling GET method of the request that comes for the incomes and expenses page.
         """
 
-        incomes = render_to_string(
-            'includes/incomes.html', 
-            {'incomes': Income.objects.filter(maker=request.user).order_by('date')}
-        )
-        expenses = render_to_string(
-            'includes/expenses.html', 
-            {'expenses': Expense.objects.filter(maker=request.user).order_by('date')}
-        )
-        transactions = render_to_string(
-            'includes/transactions.html',
-            {'transactions': Transaction.objects.filter(maker=request.user).order_by('date')}
-        )
-        context = {
-            'incomes': incomes,
-            'expenses': expenses,
-            'transactions': transactions,
+        querysets = self.get_querysets(request)
+        params = {ledger: self.get_params(ledger, request.GET) for ledger in querysets}
+        keys = {
+            ledger: self.fragment_cache.key(request.user.id, ledger, params[ledger]) for ledger in querysets
+        }
+        return self.respond_conditionally(request, self.fragment_cache.etag(*keys.values()), lambda: render(
+            request, 
+            self.tempate_name, 
+            self.get_context({
+                ledger: self.fragment_cache.get(
+                    keys[ledger], partial(self.render_page, ledger, queryset, params[ledger])
+                ) for ledger, queryset in querysets.items()
+            })
+        ))
+
+
+    def get_querysets(self, request: HttpRequest) -> dict[str, QuerySet]:
+        """
+        A method for getting the user's entries of every ledger.
+        """
+
+        return {
+            'incomes': Income.objects.filter(maker=request.user),
+            'expenses': Expense.objects.filter(maker=request.user),
+            'transactions': Transaction.objects.filter(maker=request.user),
         }
-        return render(request, self.tempate_name, context)
 
 
-class IncomeView(View):
+    def get_params(self, ledger: str, params: QueryDict) -> QueryDict:
+        """
+        A method for getting the paging parameters of the ledger's list out of the parameters of the page.
+        """
+
+        ledger_params = QueryDict(mutable=True)
+        for name in ('from', 'to'):
+            if params.get(name):
+                ledger_params[name] = params.get(name)
+        for name in ('cursor', 'page_size'):
+            if params.get(ledger + '_' + name):
+                ledger_params[name] = params.get(ledger + '_' + name)
+        return ledger_params
+
+
+    def render_page(self, ledger: str, queryset: QuerySet, params: QueryDict) -> dict:
+        """
+        A method for rendering the requested page of the ledger.
+        """
+
+        entries, next_cursor = self.paginator.paginate(queryset, params)
+        lookup_cache.resolve(entries, self.related_names[ledger])
+        return {'html': render_to_string('includes/%s.html' % ledger, {ledger: entries}), 'next': next_cursor}
+
+
+    def get_context(self, pages: dict[str, dict]) -> dict:
+        """
+        A method for putting the rendered pages of the lists into the context of the page.
+        """
+
+        context = {}
+        for ledger, page in pages.items():
+            context[ledger] = page['html']
+            context[ledger + '_next'] = page['next']
+        return context
+
+
+class RowResponseMixin(ConditionalMixin):
+    """
+    A mixin for responding to changes in lists with only the changed row.
+
+    The response carries the rendered row and the action (insert/replace/remove) the client should
+    apply to its list. Clients that send the 'full' flag get the whole re-rendered list instead.
+    Pages of the list are served from the fragment cache.
+    """
+
+    model = None
+    archive_model = None
+    template_name = ''
+    row_template_name = ''
+    context_object_name = ''
+    paginator = KeysetPaginator()
+
+    def get_queryset(self, request: HttpRequest):
+        """
+        A method for getting the user's entries.
+        """
+
+        return self.model.objects.filter(maker=request.user)
+
+
+    def resolve(self, entries: list) -> list:
+        """
+        A method for setting the names of the accounts and categories the list templates show on the entries.
+        """
+
+        return lookup_cache.resolve(entries, self.serializer.related_names)
+
+
+    def respond(self, request: HttpRequest, flags: QueryDict, action: str, entry_id: int, entry=None):
+        """
+        A method for building the response for a created/edited/deleted entry.
+        """
+
+        if 'full' in flags:
+            html = render_to_string(
+                self.template_name,
+                {self.context_object_name + 's': self.resolve(list(self.get_queryset(request).order_by('date')))}
+            )
+            return JsonResponse({'status': 200, 'html': html})
+        html = ''
+        if entry is not None:
+            html = render_to_string(self.row_template_name, {self.context_object_name: self.resolve([entry])[0]})
+        return JsonResponse({'status': 200, 'action': action, 'id': entry_id, 'html': html})
+
+
+    def respond_page(self, request: HttpRequest):
+        """
+        A method for responding with one page of the user's list and the cursor of the next page.
+
+        The page is rendered into rows, or serialized into a list of entries with format=json.
+        """
+
+        if request.GET.get('format') == 'json':
+            entries, next_cursor = self.paginator.paginate_merged(self.get_value_querysets(request), request.GET)
+            return self.respond_values(entries, next_cursor)
+        key = self.fragment_cache.key(request.user.id, self.context_object_name + 's', request.GET)
+        return self.respond_conditionally(request, self.fragment_cache.etag(key), lambda: JsonResponse({
+            'status': 200, 
+            **self.fragment_cache.get(key, partial(self.render_page, request)),
+        }))
+
+
+    def render_page(self, request: HttpRequest) -> dict:
+        """
+        A method for rendering the requested page of the user's list.
+        """
+
+        entries, next_cursor = self.paginator.paginate(self.get_queryset(request), request.GET)
+        html = render_to_string(self.template_name, {self.context_object_name + 's': self.resolve(entries)})
+        return {'html': html, 'next': next_cursor}
+
+
+    def get_values(self, request: HttpRequest) -> QuerySet:
+        """
+        A method for getting the user's entries as the rows of the serializer.
+        """
+
+        return self.serializer.values(self.model.objects.filter(maker=request.user))
+
+
+    def get_value_querysets(self, request: HttpRequest) -> list[QuerySet]:
+        """
+        A method for getting the querysets of the serialized list, with the archived entries when asked for.
+        """
+
+        querysets = [self.get_values(request)]
+        if request.GET.get('archive'):
+            querysets.append(self.serializer.values(self.archive_model.objects.filter(maker=request.user)))
+        return querysets
+
+
+    def respond_values(self, entries: list[dict], next_cursor: str | None):
+        """
+        A method for responding with the serialized entries of a page and the cursor of the next page.
+        """
+
+        results = self.serializer.many(entries)
+        return JsonResponse({'status': 200, 'results': results, 'next': next_cursor})
+
+
+class IncomeView(LoginRequiredMixin, RowResponseMixin, View):
     """
     A view for managing incomes.
     """
 
+    model = Income
+    archive_model = ArchivedIncome
     template_name = 'includes/incomes.html'
-    validator = Validator()
+    row_template_name = 'includes/income.html'
+    context_object_name = 'income'
+    query_budget = 19
+    account_fields = ['account_id']
+    serializer = IncomeValuesSerializer()
+    get_schema = Schema(
+        income_id=Field(r'[^0-9]', 'int'),
+    )
+    post_schema = Schema(
+        income_id=Field(r'[^0-9]', 'int', required=False),
+        category_id=Field(r'[^0-9]', 'int'),
+        subcategory_id=Field(r'[^0-9]', 'int'),
+        account_id=Field(r'[^0-9]', 'int'),
+        amount=Field(r'[^0-9.,]', 'decimal'),
+        date=Field(r'[^0-9/.:+\- TZ]', 'datetime', required=False, strip=False),
+        comment=Field(r'[^a-zA-Zа-яА-ЯёЁ0-9 ,.#+_()-]', required=False),
+    )
+    balance_manager = BalanceManager()
+    rollup_manager = RollupManager()
 
     def get(self, request: HttpRequest):
         """
-        A method for retrieving/deleting incomes.
+        A method for listing/retrieving/deleting incomes.
         """
 
         is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
@@ -79,21 +345,19 @@ class IncomeView(View):
         if not is_ajax and not request.user.is_superuser and request.method != 'GET':
             raise PermissionDenied
         
-        income_id = self.validator.validate(request.GET.get('income_id'), r'[^0-9]', strip=True)
-        income = get_object_or_404(Income, id=income_id)
-        account = get_object_or_404(Account, id=income.account.id)
+        if 'listing' in request.GET:
+            return self.respond_page(request)
+        data, errors = self.get_schema.parse(request.GET)
+        if errors:
+            return JsonResponse({'status': 400, 'errors': errors}, status=400)
         if 'deleting' in request.GET:
-            account.decrement(float(income.amount.amount))
-            account.save()
-            income.delete()
-            html = render_to_string(
-                self.template_name,
-                {'incomes': Income.objects.filter(maker=request.user).order_by('date')}
-            )
-            return JsonResponse({'status': 200, 'html': html})
+            deleted_id = self.remove(data['income_id'], request.user)
+            return self.respond(request, request.GET, 'remove', deleted_id)
         else:
-            result = IncomeSerializer(income)
-            return JsonResponse({'status': 200, 'result': result})
+            income = get_object_or_404(
+                self.serializer.values(Income.objects.filter(maker=request.user)), id=data['income_id']
+            )
+            return JsonResponse({'status': 200, 'result': self.serializer.to_representation(income)})
 
 
     def post(self, request: HttpRequest):
@@ -106,58 +370,106 @@ class IncomeView(View):
         if not is_ajax and not request.user.is_superuser and request.method != 'POST':
             raise PermissionDenied
 
-        income_id = self.validator.validate(request.POST.get('income_id'), r'[^0-9]', strip=True)
-        category_id = self.validator.validate(request.POST.get('category_id'), r'[^0-9]', strip=True)
-        subcategory_id = self.validator.validate(request.POST.get('subcategory_id'), r'[^0-9]', strip=True)
-        account_id = self.validator.validate(request.POST.get('account_id'), r'[^0-9]', strip=True)
-        amount = self.validator.validate(request.POST.get('amount'), r'[^0-9.,]', strip=True)
-        date = self.validator.validate(request.POST.get('date'), r'[^0-9/.-:;,]')
-        comment = self.validator.validate(request.POST.get('comment'), r'[^a-zA-Zа-яА-ЯёЁ0-9,.#+_-()]', strip=True)
-        account = get_object_or_404(Account, id=account_id)
+        data, errors = self.post_schema.parse(request.POST)
+        if errors:
+            return JsonResponse({'status': 400, 'errors': errors}, status=400)
+        account = get_object_or_404(Account, id=data['account_id'], owner=request.user)
         if 'editing' in request.POST:
-            income = get_object_or_404(Income, id=income_id)
-            account.decrement(float(income.amount.amount))
-            account.increment(float(amount))
-            income.category = category_id
-            income.subcategory = subcategory_id
-            income.amount.amount = amount
-            income.date = date
-            income.comment = comment
-            income.save()
-            account.save()
-            html = render_to_string(
-                self.template_name,
-                {'incomes': Income.objects.filter(maker=request.user).order_by('date')}
-            )
-            return JsonResponse({'status': 200, 'html': html})
+            income = self.edit(data, account, request.user)
+            return self.respond(request, request.POST, 'replace', income.id, income)
         else:
-            account.increment(float(amount))
-            account.save()
+            income = self.add(data, account, request.user)
+            return self.respond(request, request.POST, 'insert', income.id, income)
+
+
+    def add(self, data: dict, account: Account, user: User) -> Income:
+        """
+        A method for adding an income and booking it on the account.
+        """
+
+        with db_transaction.atomic():
+            self.balance_manager.apply({account.id: data['amount']})
             income = Income(
-                account=account_id,
-                amount=amount,
-                comment=comment,
-                maker=request.user,
+                category_id=data['category_id'],
+                subcategory_id=data['subcategory_id'],
+                account=account,
+                amount=data['amount'],
+                date=data['date'] or timezone.now(),
+                comment=data['comment'] or '',
+                maker=user,
             )
             income.save()
-            html = render_to_string(
-                self.template_name,
-                {'incomes': Income.objects.filter(maker=request.user).order_by('date')}
-            )
-            return JsonResponse({'status': 200, 'html': html})
+            self.rollup_manager.apply(self.rollup_manager.change(income, 1))
+        return income
+
+
+    def edit(self, data: dict, account: Account, user: User) -> Income:
+        """
+        A method for editing an income of the user, moving its amount from the old account to the given one.
+        """
 
+        with db_transaction.atomic():
+            income = get_object_or_404(Income.objects.select_for_update(), id=data['income_id'], maker=user)
+            removed = self.rollup_manager.change(income, -1)
+            self.balance_manager.apply(self.balance_manager.collect(
+                (income.account_id, -income.amount.amount),
+                (account.id, data['amount']),
+            ))
+            income.account = account
+            income.category_id = data['category_id']
+            income.subcategory_id = data['subcategory_id']
+            income.amount.amount = data['amount']
+            income.date = data['date'] or income.date
+            income.comment = data['comment'] or ''
+            income.save()
+            self.rollup_manager.apply(removed, self.rollup_manager.change(income, 1))
+        return income
 
-class ExpenseView(View):
+
+    def remove(self, income_id: int, user: User) -> int:
+        """
+        A method for deleting an income of the user and taking it back from its account.
+        """
+
+        with db_transaction.atomic():
+            income = get_object_or_404(Income.objects.select_for_update(), id=income_id, maker=user)
+            self.balance_manager.apply({income.account_id: -income.amount.amount})
+            self.rollup_manager.apply(self.rollup_manager.change(income, -1))
+            income.delete()
+        return income_id
+
+
+class ExpenseView(LoginRequiredMixin, RowResponseMixin, View):
     """
     A view for managing expenses.
     """
 
+    model = Expense
+    archive_model = ArchivedExpense
     template_name = 'includes/expenses.html'
-    validator = Validator()
+    row_template_name = 'includes/expense.html'
+    context_object_name = 'expense'
+    query_budget = 19
+    account_fields = ['account_id']
+    serializer = ExpenseValuesSerializer()
+    get_schema = Schema(
+        expense_id=Field(r'[^0-9]', 'int'),
+    )
+    post_schema = Schema(
+        expense_id=Field(r'[^0-9]', 'int', required=False),
+        category_id=Field(r'[^0-9]', 'int'),
+        subcategory_id=Field(r'[^0-9]', 'int'),
+        account_id=Field(r'[^0-9]', 'int'),
+        amount=Field(r'[^0-9.,]', 'decimal'),
+        date=Field(r'[^0-9/.:+\- TZ]', 'datetime', required=False, strip=False),
+        comment=Field(r'[^a-zA-Zа-яА-ЯёЁ0-9 ,.#+_()-]', required=False),
+    )
+    balance_manager = BalanceManager()
+    rollup_manager = RollupManager()
 
     def get(self, request: HttpRequest):
         """
-        A method for retrieving/deleting expenses.
+        A method for listing/retrieving/deleting expenses.
         """
 
         is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
@@ -165,21 +477,20 @@ class ExpenseView(View):
         if not is_ajax and not request.user.is_superuser and request.method != 'GET':
             raise PermissionDenied
         
-        expense_id = self.validator.validate(request.GET.get('expense_id'), r'[^0-9]', strip=True)
-        expense = get_object_or_404(Expense, id=expense_id)
-        account = get_object_or_404(Account, id=expense.account.id)
+        if 'listing' in request.GET:
+            return self.respond_page(request)
+        data, errors = self.get_schema.parse(request.GET)
+        if errors:
+            return JsonResponse({'status': 400, 'errors': errors}, status=400)
         if 'deleting' in request.GET:
-            account.increment(float(expense.amount.amount))
-            account.save()
-            expense.delete()
-            html = render_to_string(
-                self.template_name,
-                {'expenses': Expense.objects.filter(maker=request.user).order_by('date')}
-            )
-            return JsonResponse({'status': 200, 'html': html})
+            deleted_id = self.remove(data['expense_id'], request.user)
+            return self.respond(request, request.GET, 'remove', deleted_id)
         else:
-            result = ExpenseSerializer(expense)
-            return JsonResponse({'status': 200, 'result': result})
+            expense = get_object_or_404(
+                self.serializer.values(Expense.objects.filter(maker=request.user)), id=data['expense_id']
+            )
+            return JsonResponse({'status': 200, 'result': self.serializer.to_representation(expense)})
+
 
     def post(self, request: HttpRequest):
         """
@@ -191,58 +502,104 @@ class ExpenseView(View):
         if not is_ajax and not request.user.is_superuser and request.method != 'POST':
             raise PermissionDenied
 
-        expense_id = self.validator.validate(request.POST.get('expense_id'), r'[^0-9]', strip=True)
-        category_id = self.validator.validate(request.POST.get('category_id'), r'[^0-9]', strip=True)
-        subcategory_id = self.validator.validate(request.POST.get('subcategory_id'), r'[^0-9]', strip=True)
-        account_id = self.validator.validate(request.POST.get('account_id'), r'[^0-9]', strip=True)
-        amount = self.validator.validate(request.POST.get('amount'), r'[^0-9.,]', strip=True)
-        date = self.validator.validate(request.POST.get('date'), r'[^0-9/.-:;,]')
-        comment = self.validator.validate(request.POST.get('comment'), r'[^a-zA-Zа-яА-ЯёЁ0-9,.#+_-()]', strip=True)
-        account = get_object_or_404(Account, id=account_id)
+        data, errors = self.post_schema.parse(request.POST)
+        if errors:
+            return JsonResponse({'status': 400, 'errors': errors}, status=400)
+        account = get_object_or_404(Account, id=data['account_id'], owner=request.user)
         if 'editing' in request.POST:
-            expense = get_object_or_404(Income, id=expense_id)
-            account.increment(float(expense.amount.amount))
-            account.decrement(float(amount))
-            expense.category = category_id
-            expense.subcategory = subcategory_id
-            expense.amount.amount = amount
-            expense.date = date
-            expense.comment = comment
-            expense.save()
-            account.save()
-            html = render_to_string(
-                self.template_name,
-                {'incomes': Expense.objects.filter(maker=request.user).order_by('date')}
-            )
-            return JsonResponse({'status': 200, 'html': html})
+            expense = self.edit(data, account, request.user)
+            return self.respond(request, request.POST, 'replace', expense.id, expense)
         else:
-            account.decrement(float(amount))
-            account.save()
+            expense = self.add(data, account, request.user)
+            return self.respond(request, request.POST, 'insert', expense.id, expense)
+
+
+    def add(self, data: dict, account: Account, user: User) -> Expense:
+        """
+        A method for adding an expense and booking it on the account.
+        """
+
+        with db_transaction.atomic():
+            self.balance_manager.apply({account.id: -data['amount']})
             expense = Expense(
-                account=account_id,
-                amount=amount,
-                comment=comment,
-                maker=request.user,
+                category_id=data['category_id'],
+                subcategory_id=data['subcategory_id'],
+                account=account,
+                amount=data['amount'],
+                date=data['date'] or timezone.now(),
+                comment=data['comment'] or '',
+                maker=user,
             )
             expense.save()
-            html = render_to_string(
-                self.template_name,
-                {'expenses': Expense.objects.filter(maker=request.user).order_by('date')}
-            )
-            return JsonResponse({'status': 200, 'html': html})
+            self.rollup_manager.apply(self.rollup_manager.change(expense, 1))
+        return expense
+
+
+    def edit(self, data: dict, account: Account, user: User) -> Expense:
+        """
+        A method for editing an expense of the user, moving its amount from the old account to the given one.
+        """
+
+        with db_transaction.atomic():
+            expense = get_object_or_404(Expense.objects.select_for_update(), id=data['expense_id'], maker=user)
+            removed = self.rollup_manager.change(expense, -1)
+            self.balance_manager.apply(self.balance_manager.collect(
+                (expense.account_id, expense.amount.amount),
+                (account.id, -data['amount']),
+            ))
+            expense.account = account
+            expense.category_id = data['category_id']
+            expense.subcategory_id = data['subcategory_id']
+            expense.amount.amount = data['amount']
+            expense.date = data['date'] or expense.date
+            expense.comment = data['comment'] or ''
+            expense.save()
+            self.rollup_manager.apply(removed, self.rollup_manager.change(expense, 1))
+        return expense
 
 
-class TransactionView(View):
+    def remove(self, expense_id: int, user: User) -> int:
+        """
+        A method for deleting an expense of the user and taking it back from its account.
+        """
+
+        with db_transaction.atomic():
+            expense = get_object_or_404(Expense.objects.select_for_update(), id=expense_id, maker=user)
+            self.balance_manager.apply({expense.account_id: expense.amount.amount})
+            self.rollup_manager.apply(self.rollup_manager.change(expense, -1))
+            expense.delete()
+        return expense_id
+
+
+class TransactionView(LoginRequiredMixin, RowResponseMixin, View):
     """
     A view for managing transactions.
     """
 
+    model = Transaction
+    archive_model = ArchivedTransaction
     template_name = 'includes/transactions.html'
-    validator = Validator()
+    row_template_name = 'includes/transaction.html'
+    context_object_name = 'transaction'
+    query_budget = 15
+    account_fields = ['account1', 'account2']
+    serializer = TransactionValuesSerializer()
+    get_schema = Schema(
+        transaction_id=Field(r'[^0-9]', 'int'),
+    )
+    post_schema = Schema(
+        transaction_id=Field(r'[^0-9]', 'int', required=False),
+        account1=Field(r'[^0-9]', 'int'),
+        account2=Field(r'[^0-9]', 'int'),
+        amount=Field(r'[^0-9.,]', 'decimal'),
+        date=Field(r'[^0-9/.:+\- TZ]', 'datetime', required=False, strip=False),
+        comment=Field(r'[^a-zA-Zа-яА-ЯёЁ0-9 ,.#+_()-]', required=False),
+    )
+    balance_manager = BalanceManager()
 
     def get(self, request: HttpRequest):
         """
-        A method for retrieving/deleting transactions.
+        A method for listing/retrieving/deleting transactions.
         """
 
         is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
@@ -250,24 +607,19 @@ class TransactionView(View):
         if not is_ajax and not request.user.is_superuser and request.method != 'GET':
             raise PermissionDenied
         
-        transaction_id = self.validator.validate(request.GET.get('transaction_id'), r'[^0-9]', strip=True)
-        transaction = get_object_or_404(Income, id=transaction_id)
-        account1 = get_object_or_404(Account, id=transaction.account1.id)
-        account2 = get_object_or_404(Account, id=transaction.account2.id)
+        if 'listing' in request.GET:
+            return self.respond_page(request)
+        data, errors = self.get_schema.parse(request.GET)
+        if errors:
+            return JsonResponse({'status': 400, 'errors': errors}, status=400)
         if 'deleting' in request.GET:
-            account1.increment(float(transaction.amount.amount))
-            account2.decrement(float(transaction.amount.amount))
-            account1.save()
-            account2.save()
-            transaction.delete()
-            html = render_to_string(
-                self.template_name,
-                {'transactions': Transaction.objects.filter(maker=request.user).order_by('date')}
-            )
-            return JsonResponse({'status': 200, 'html': html})
+            deleted_id = self.remove(data['transaction_id'], request.user)
+            return self.respond(request, request.GET, 'remove', deleted_id)
         else:
-            result = TransactionSerializer(transaction)
-            return JsonResponse({'status': 200, 'result': result})
+            transaction = get_object_or_404(
+                self.serializer.values(Transaction.objects.filter(maker=request.user)), id=data['transaction_id']
+            )
+            return JsonResponse({'status': 200, 'result': self.serializer.to_representation(transaction)})
 
     def post(self, request: HttpRequest):
         """
@@ -279,46 +631,533 @@ class TransactionView(View):
         if not is_ajax and not request.user.is_superuser and request.method != 'POST':
             raise PermissionDenied
 
-        transaction_id = self.validator.validate(request.POST.get('transaction_id'), r'[^0-9]', strip=True)
-        account1 = self.validator.validate(request.POST.get('account1'), r'[^0-9]', strip=True)
-        account2 = self.validator.validate(request.POST.get('account2'), r'[^0-9]', strip=True)
-        amount = self.validator.validate(request.POST.get('amount'), r'[^0-9.,]', strip=True)
-        date = self.validator.validate(request.POST.get('date'), r'[^0-9/.-:;,]')
-        comment = self.validator.validate(request.POST.get('comment'), r'[^a-zA-Zа-яА-ЯёЁ0-9,.#+_-()]', strip=True)
-        account1 = get_object_or_404(Account, id=account1)
-        account2 = get_object_or_404(Account, id=account2)
+        data, errors = self.post_schema.parse(request.POST)
+        if errors:
+            return JsonResponse({'status': 400, 'errors': errors}, status=400)
+        account1 = get_object_or_404(Account, id=data['account1'], owner=request.user)
+        account2 = get_object_or_404(Account, id=data['account2'], owner=request.user)
         if 'editing' in request.POST:
-            transaction = get_object_or_404(Transaction, id=transaction_id)
-            account1.increment(float(transaction.amount.amount))
-            account2.decrement(float(transaction.amount.amount))
-            account1.decrement(float(amount))
-            account2.increment(float(amount))
-            account1.save()
-            account2.save()
-            transaction.amount.amount = amount
-            transaction.date = date
-            transaction.comment = comment
-            transaction.save()
-            html = render_to_string(
-                self.template_name,
-                {'transactions': Transaction.objects.filter(maker=request.user).order_by('date')}
-            )
-            return JsonResponse({'status': 200, 'html': html})
+            transaction = self.edit(data, account1, account2, request.user)
+            return self.respond(request, request.POST, 'replace', transaction.id, transaction)
         else:
-            account1.decrement(float(amount))
-            account2.increment(float(amount))
-            account1.save()
-            account2.save()
+            transaction = self.add(data, account1, account2, request.user)
+            return self.respond(request, request.POST, 'insert', transaction.id, transaction)
+
+
+    def add(self, data: dict, account1: Account, account2: Account, user: User) -> Transaction:
+        """
+        A method for adding a transaction and moving its amount from account1 to account2.
+        """
+
+        with db_transaction.atomic():
+            self.balance_manager.apply(self.balance_manager.collect(
+                (account1.id, -data['amount']),
+                (account2.id, data['amount']),
+            ))
             transaction = Transaction(
                 account1=account1,
                 account2=account2,
-                amount=amount,
-                comment=comment,
-                maker=request.user,
+                amount=data['amount'],
+                date=data['date'] or timezone.now(),
+                comment=data['comment'] or '',
+                maker=user,
             )
             transaction.save()
-            html = render_to_string(
-                self.template_name,
-                {'transactions': Transaction.objects.filter(maker=request.user).order_by('date')}
+        return transaction
+
+
+    def edit(self, data: dict, account1: Account, account2: Account, user: User) -> Transaction:
+        """
+        A method for editing a transaction of the user, reverting the old transfer and making the new one.
+        """
+
+        with db_transaction.atomic():
+            transaction = get_object_or_404(Transaction.objects.select_for_update(), id=data['transaction_id'], maker=user)
+            self.balance_manager.apply(self.balance_manager.collect(
+                (transaction.account1_id, transaction.amount.amount),
+                (transaction.account2_id, -transaction.amount.amount),
+                (account1.id, -data['amount']),
+                (account2.id, data['amount']),
+            ))
+            transaction.account1 = account1
+            transaction.account2 = account2
+            transaction.amount.amount = data['amount']
+            transaction.date = data['date'] or transaction.date
+            transaction.comment = data['comment'] or ''
+            transaction.save()
+        return transaction
+
+
+    def remove(self, transaction_id: int, user: User) -> int:
+        """
+        A method for deleting a transaction of the user and reverting its transfer.
+        """
+
+        with db_transaction.atomic():
+            transaction = get_object_or_404(Transaction.objects.select_for_update(), id=transaction_id, maker=user)
+            self.balance_manager.apply(self.balance_manager.collect(
+                (transaction.account1_id, transaction.amount.amount),
+                (transaction.account2_id, -transaction.amount.amount),
+            ))
+            transaction.delete()
+        return transaction_id
+
+
+class AsyncMixin:
+    """
+    A mixin with helpers for views served natively under ASGI.
+    """
+
+    async def load_user(self, request: HttpRequest):
+        """
+        A method for loading the lazy user of the request, which needs the database, outside the event loop.
+        """
+
+        await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+    async def dispatch(self, request: HttpRequest, *args, **kwargs):
+        """
+        A method for loading the user before the sync checks of the view read it.
+        """
+
+        await self.load_user(request)
+        return await super().dispatch(request, *args, **kwargs)
+
+
+    async def aget_object_or_404(self, queryset: QuerySet, **kwargs):
+        """
+        A method for getting an object through the async ORM or raising Http404.
+        """
+
+        try:
+            return await queryset.aget(**kwargs)
+        except queryset.model.DoesNotExist:
+            raise Http404('No %s matches the given query.' % queryset.model._meta.object_name)
+
+
+class AsyncLedgerMixin(AsyncMixin):
+    """
+    A mixin for serving the ledger views natively under ASGI.
+
+    Reads go through the async ORM. Writes run the add/edit/remove methods of the view in a
+    thread, since transaction.atomic and select_for_update are only available to sync code.
+    """
+
+    async def get(self, request: HttpRequest):
+        """
+        A method for listing/retrieving/deleting entries.
+        """
+
+        is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+        if not is_ajax and not request.user.is_superuser and request.method != 'GET':
+            raise PermissionDenied
+
+        if 'listing' in request.GET and request.GET.get('format') == 'json':
+            entries, next_cursor = await self.paginator.apaginate_merged(self.get_value_querysets(request), request.GET)
+            return await sync_to_async(self.respond_values)(entries, next_cursor)
+        if 'listing' in request.GET:
+            key = await sync_to_async(self.fragment_cache.key)(
+                request.user.id, self.context_object_name + 's', request.GET
             )
-            return JsonResponse({'status': 200, 'html': html})
+            etag = self.fragment_cache.etag(key)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                page = await self.fragment_cache.aget(key, partial(self.arender_page, request))
+                response = JsonResponse({'status': 200, **page})
+            return self.add_etag(response, etag)
+        data, errors = self.get_schema.parse(request.GET)
+        if errors:
+            return JsonResponse({'status': 400, 'errors': errors}, status=400)
+        entry_id = data[self.context_object_name + '_id']
+        if 'deleting' in request.GET:
+            deleted_id = await sync_to_async(self.remove)(entry_id, request.user)
+            return await sync_to_async(self.respond)(request, request.GET, 'remove', deleted_id)
+        else:
+            entry = await self.aget_object_or_404(
+                self.serializer.values(self.model.objects.filter(maker=request.user)), id=entry_id
+            )
+            result = await sync_to_async(self.serializer.to_representation)(entry)
+            return JsonResponse({'status': 200, 'result': result})
+
+
+    async def post(self, request: HttpRequest):
+        """
+        A method for adding/editing entries.
+        """
+
+        is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+        if not is_ajax and not request.user.is_superuser and request.method != 'POST':
+            raise PermissionDenied
+
+        data, errors = self.post_schema.parse(request.POST)
+        if errors:
+            return JsonResponse({'status': 400, 'errors': errors}, status=400)
+        accounts = [
+            await self.aget_object_or_404(Account.objects.filter(owner=request.user), id=data[field])
+            for field in self.account_fields
+        ]
+        if 'editing' in request.POST:
+            entry = await sync_to_async(self.edit)(data, *accounts, request.user)
+            return await sync_to_async(self.respond)(request, request.POST, 'replace', entry.id, entry)
+        else:
+            entry = await sync_to_async(self.add)(data, *accounts, request.user)
+            return await sync_to_async(self.respond)(request, request.POST, 'insert', entry.id, entry)
+
+
+    async def arender_page(self, request: HttpRequest) -> dict:
+        """
+        A method for rendering the requested page of the user's list through the async ORM.
+        """
+
+        entries, next_cursor = await self.paginator.apaginate(self.get_queryset(request), request.GET)
+        await sync_to_async(self.resolve)(entries)
+        html = render_to_string(self.template_name, {self.context_object_name + 's': entries})
+        return {'html': html, 'next': next_cursor}
+
+
+class AsyncIncomesExpensesView(AsyncMixin, IncomesExpensesView):
+    """
+    An async version of IncomesExpensesView, fetching the three lists concurrently.
+    """
+
+    async def get(self, request: HttpRequest):
+        """
+        A method for handling GET method of the request that comes for the incomes and expenses page.
+        """
+
+        querysets = self.get_querysets(request)
+        params = {ledger: self.get_params(ledger, request.GET) for ledger in querysets}
+        keys = await sync_to_async(lambda: {
+            ledger: self.fragment_cache.key(request.user.id, ledger, params[ledger]) for ledger in querysets
+        })()
+        etag = self.fragment_cache.etag(*keys.values())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            pages = await asyncio.gather(*[
+                self.fragment_cache.aget(keys[ledger], partial(self.arender_page, ledger, queryset, params[ledger]))
+                for ledger, queryset in querysets.items()
+            ])
+            context = self.get_context(dict(zip(querysets, pages)))
+            response = await sync_to_async(render)(request, self.tempate_name, context)
+        return self.add_etag(response, etag)
+
+
+    async def arender_page(self, ledger: str, queryset: QuerySet, params: QueryDict) -> dict:
+        """
+        A method for rendering the requested page of the ledger through the async ORM.
+        """
+
+        entries, next_cursor = await self.paginator.apaginate(queryset, params)
+        await sync_to_async(lookup_cache.resolve)(entries, self.related_names[ledger])
+        return {'html': render_to_string('includes/%s.html' % ledger, {ledger: entries}), 'next': next_cursor}
+
+
+class AsyncIncomeView(AsyncLedgerMixin, IncomeView):
+    """
+    An async version of IncomeView.
+    """
+
+
+class AsyncExpenseView(AsyncLedgerMixin, ExpenseView):
+    """
+    An async version of ExpenseView.
+    """
+
+
+class AsyncTransactionView(AsyncLedgerMixin, TransactionView):
+    """
+    An async version of TransactionView.
+    """
+
+
+class ExportView(LoginRequiredMixin, View):
+    """
+    A view for exporting incomes, expenses or transactions.
+    """
+
+    model = None
+    archive_model = None
+    exporter = LedgerExporter()
+    query_budget = 4
+    read_only = True
+
+    def get(self, request: HttpRequest):
+        """
+        A method for streaming the user's ledger as an XLSX (default) or CSV file.
+        """
+
+        queryset = self.exporter.filter(self.model.objects.filter(maker=request.user), request.GET)
+        archived = []
+        if request.GET.get('archive'):
+            archived.append(self.exporter.filter(self.archive_model.objects.filter(maker=request.user), request.GET))
+        rows = self.exporter.rows(queryset, *archived)
+        name = self.model._meta.model_name + 's'
+        if request.GET.get('format') == 'csv':
+            response = StreamingHttpResponse(self.exporter.to_csv(rows), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="%s.csv"' % name
+            return response
+        return FileResponse(self.exporter.to_xlsx(rows, name), as_attachment=True, filename=name + '.xlsx')
+
+
+class ImportView(LoginRequiredMixin, View):
+    """
+    A view for importing bank statements into incomes, expenses or transactions.
+    """
+
+    model = None
+    importer = LedgerImporter()
+
+    def post(self, request: HttpRequest):
+        """
+        A method for importing the uploaded statement, or only validating it when running dry.
+        """
+
+        if 'file' not in request.FILES:
+            return JsonResponse({'status': 400, 'errors': [{'row': None, 'errors': ['No file.']}]}, status=400)
+        report = self.importer.run(self.model, request.FILES['file'], request.user, dry_run='dry_run' in request.POST)
+        status = 400 if report['errors'] else 200
+        return JsonResponse({'status': status, **report}, status=status)
+
+
+class BatchView(LoginRequiredMixin, View):
+    """
+    A view for applying a batch of create/edit/delete operations on incomes, expenses and transactions at once.
+
+    The body is a JSON list of operations like {"op": "edit", "ledger": "income", "id": 1, "data": {...}},
+    where data has the fields the ledger's own view takes. Either all operations are applied, or none
+    is and the errors of every invalid one are returned. The first pages of the changed ledgers are
+    returned re-rendered, so the page can replace its lists in one go.
+    """
+
+    batch = LedgerBatch({
+        'income': IncomeView.post_schema,
+        'expense': ExpenseView.post_schema,
+        'transaction': TransactionView.post_schema,
+    })
+    page = IncomesExpensesView()
+
+    def post(self, request: HttpRequest):
+        """
+        A method for applying the operations and responding with their results and the re-rendered ledgers.
+        """
+
+        try:
+            operations = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'status': 400, 'errors': [{'index': None, 'errors': ['Invalid JSON.']}]}, status=400)
+        report = self.batch.run(operations, request.user)
+        if report['errors']:
+            return JsonResponse({'status': 400, **report}, status=400)
+        ledgers = {result['ledger'] + 's' for result in report['results']}
+        querysets = self.page.get_querysets(request)
+        fragments = {}
+        for ledger in sorted(ledgers):
+            fragments[ledger] = self.page.fragment_cache.get(
+                self.page.fragment_cache.key(request.user.id, ledger, QueryDict()),
+                partial(self.page.render_page, ledger, querysets[ledger], QueryDict()),
+            )
+        return JsonResponse({'status': 200, **report, 'fragments': fragments})
+
+
+class SearchView(LoginRequiredMixin, View):
+    """
+    A view for searching the comments of the user's incomes, expenses and transactions.
+    """
+
+    search = CommentSearch()
+    schema = Schema(
+        q=Field(r'[^a-zA-Zа-яА-ЯёЁ0-9 ,.#+_()-]'),
+    )
+    ledgers = {
+        'income': (Income, IncomeValuesSerializer()),
+        'expense': (Expense, ExpenseValuesSerializer()),
+        'transaction': (Transaction, TransactionValuesSerializer()),
+    }
+    query_budget = 6
+    read_only = True
+
+    def get(self, request: HttpRequest):
+        """
+        A method for responding with the best matching entries (q) and the cursor of the next page.
+        """
+
+        data, errors = self.schema.parse(request.GET)
+        if errors:
+            return JsonResponse({'status': 400, 'errors': errors}, status=400)
+        hits, next_cursor = self.search.search(request.user, data['q'], request.GET)
+        entries = {}
+        for ledger, (model, serializer) in self.ledgers.items():
+            ids = [entry_id for hit_ledger, entry_id, score in hits if hit_ledger == ledger]
+            if ids:
+                rows = serializer.many(list(serializer.values(model.objects.filter(maker=request.user, id__in=ids))))
+                entries.update({(ledger, row['id']): row for row in rows})
+        results = [
+            {'ledger': ledger, 'score': score, **entries[ledger, entry_id]} 
+            for ledger, entry_id, score in hits if (ledger, entry_id) in entries
+        ]
+        return JsonResponse({'status': 200, 'results': results, 'next': next_cursor})
+
+
+class TimelineView(LoginRequiredMixin, View):
+    """
+    A view for the user's incomes, expenses and transactions as one list ordered by date.
+    """
+
+    timeline = LedgerTimeline()
+    serializer = TimelineSerializer()
+    query_budget = 6
+    read_only = True
+
+    def get(self, request: HttpRequest):
+        """
+        A method for responding with the page of the timeline and the cursor of the next page.
+        """
+
+        rows, next_cursor = self.timeline.page(request.user, request.GET)
+        return JsonResponse({'status': 200, 'results': self.serializer.many(rows), 'next': next_cursor})
+
+
+class StatementView(LoginRequiredMixin, View):
+    """
+    A view for the statement of an account with the balance after every entry, streamed as JSON.
+    """
+
+    statement = AccountStatement()
+    serializer = StatementSerializer()
+    query_budget = 4
+    read_only = True
+
+    def get(self, request: HttpRequest, account_id: int):
+        """
+        A method for streaming the opening balance, the entries and the closing balance of the 'from'/'to' period.
+        """
+
+        try:
+            account, rows = self.statement.build(request.user, account_id, request.GET)
+        except Account.DoesNotExist:
+            raise Http404
+        return StreamingHttpResponse(self.stream(account, rows), content_type='application/json')
+
+
+    def stream(self, account: dict, rows):
+        """
+        A method for encoding the statement as one JSON object, an entry at a time.
+        """
+
+        for row in rows:
+            if row['kind'] == 'opening':
+                yield '{"status": 200, "account": %s, "currency": %s, "opening_balance": "%s", "entries": [' % (
+                    json.dumps(account['name']), json.dumps(account['balance_currency']), row['balance']
+                )
+                separator = ''
+            elif row['kind'] == 'entry':
+                del row['kind']
+                yield separator + json.dumps(self.serializer.to_representation(row))
+                separator = ', '
+            else:
+                yield '], "closing_balance": "%s"}' % row['balance']
+
+
+class NetWorthView(LoginRequiredMixin, View):
+    """
+    A view for the user's net worth and period totals converted to one currency.
+    """
+
+    calculator = NetWorthCalculator()
+    query_budget = 8
+    read_only = True
+
+    def get(self, request: HttpRequest):
+        """
+        A method for responding with the net worth and the incomes/expenses between 'from' and 'to'.
+        """
+
+        currency = request.GET.get('currency', settings.PANEL_BASE_CURRENCY)
+        if currency not in dict(ExchangeRate.currencies):
+            return JsonResponse({'status': 400, 'errors': {'currency': 'Unknown currency.'}}, status=400)
+        try:
+            result = self.calculator.calculate(request.user, currency, request.GET)
+        except LookupError as error:
+            return JsonResponse({'status': 400, 'errors': {'currency': str(error)}}, status=400)
+        return JsonResponse({'status': 200, **result})
+
+
+class ChartView(LoginRequiredMixin, ConditionalMixin, View):
+    """
+    A view for a chart of the user's ledgers (kind) as SVG.
+    """
+
+    kind = None
+    renderer = ChartRenderer()
+    schema = Schema(
+        months=Field(r'[^0-9]', 'int', required=False),
+        currency=Field(r'[^A-Z]', required=False),
+        account=Field(r'[^0-9]', 'int', required=False),
+        width=Field(r'[^0-9]', 'int', required=False),
+        height=Field(r'[^0-9]', 'int', required=False),
+    )
+    query_budget = 8
+    read_only = True
+
+    def get(self, request: HttpRequest):
+        """
+        A method for responding with the chart, or with 304 when the client has the chart of the same data.
+        """
+
+        params, errors = self.schema.parse(request.GET)
+        if params.get('currency') and params['currency'] not in dict(ExchangeRate.currencies):
+            errors['currency'] = 'Unknown currency.'
+        if self.kind == 'balance' and not params.get('account'):
+            errors['account'] = 'This field is required.'
+        if errors:
+            return JsonResponse({'status': 400, 'errors': errors}, status=400)
+        try:
+            data, options = self.renderer.data(self.kind, request.user, params)
+        except Account.DoesNotExist:
+            raise Http404
+        key = self.renderer.key(self.kind, data, options)
+        try:
+            return self.respond_conditionally(request, '"%s"' % key, lambda: HttpResponse(
+                self.renderer.get(key, self.kind, data, options), content_type='image/svg+xml'
+            ))
+        except (ChartQueueFull, ChartTimeout) as error:
+            response = JsonResponse({'status': 503, 'errors': {'chart': str(error)}}, status=503)
+            response['Retry-After'] = '1'
+            return response
+
+
+class DashboardView(LoginRequiredMixin, View):
+    """
+    A view for the dashboard of the index page as JSON, for polling.
+    """
+
+    dashboard = DashboardSummary()
+    query_budget = 6
+    read_only = True
+
+    def get(self, request: HttpRequest):
+        """
+        A method for responding with the balances, month-to-date totals and top spending categories of the user.
+        """
+
+        return JsonResponse({'status': 200, **self.dashboard.summarize(request.user)})
+
+
+class MetricsView(View):
+    """
+    A view for the metrics recorded by MetricsMiddleware, in the Prometheus text format.
+    """
+
+    query_budget = 2
+
+    def get(self, request: HttpRequest):
+        """
+        A method for responding with the metrics to superusers.
+        """
+
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')